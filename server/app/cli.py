@@ -0,0 +1,153 @@
+# server/app/cli.py
+"""
+Maintenance commands, run from server/:
+
+    python -m app.cli rebuild-streaks [--user-id N]
+    python -m app.cli rebuild-bitsets [--user-id N]
+    python -m app.cli check-bitsets [--user-id N]
+    python -m app.cli rebuild-rollups [--user-id N]
+    python -m app.cli rebuild-scores [--user-id N]
+    python -m app.cli import --user-id N FILE [--format csv|ndjson]
+    python -m app.cli drain-feed
+    python -m app.cli backfill-search
+    python -m app.cli upgrade-schema
+
+Every command first creates missing tables and upgrades older ones (see
+database.upgrade_schema), the same as app startup.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import List, Optional
+
+from sqlmodel import Session
+
+from .database import create_db_and_tables, engine, upgrade_schema
+from .services import bitsets, leaderboard, rollups, streaks, user_search
+from .services.feed import feed_worker
+from .services.importer import import_stream
+
+
+def cmd_rebuild_streaks(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        count = streaks.rebuild_all_streaks(session, args.user_id)
+        session.commit()
+    print(f"Rebuilt streaks for {count} habit(s)")
+    return 0
+
+
+def cmd_rebuild_bitsets(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        count = bitsets.rebuild(session, args.user_id)
+        session.commit()
+    print(f"Rebuilt {count} completion bitset(s)")
+    return 0
+
+
+def cmd_check_bitsets(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        problems = bitsets.check(session, args.user_id)
+    for p in problems:
+        print(f"habit {p['habit_id']} year {p['year']}: missing={p['missing']} extra={p['extra']}")
+    print("Bitsets consistent" if not problems else f"{len(problems)} inconsistent habit-year(s)")
+    return 1 if problems else 0
+
+
+def cmd_rebuild_rollups(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        count = rollups.rebuild(session, args.user_id)
+        session.commit()
+    print(f"Rebuilt {count} completion rollup(s)")
+    return 0
+
+
+def cmd_rebuild_scores(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        count = leaderboard.rebuild(session, args.user_id)
+        session.commit()
+    print(f"Rebuilt {count} weekly score(s)")
+    return 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "ndjson")
+    with open(args.file, encoding="utf-8-sig", newline="") as stream:
+        with Session(engine, expire_on_commit=False) as session:
+            report = import_stream(session, args.user_id, stream, fmt)
+    for line in report.pop("errors"):
+        print(f"line {line['line']}: {line['error']}")
+    print(", ".join(f"{key}={value}" for key, value in report.items()))
+    return 1 if report["rows_invalid"] else 0
+
+
+def cmd_drain_feed(args: argparse.Namespace) -> int:
+    count = feed_worker.drain()
+    print(f"Fanned out {count} pending activit{'y' if count == 1 else 'ies'}")
+    return 0
+
+
+def cmd_backfill_search(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        count = user_search.backfill(session)
+        session.commit()
+    print(f"Backfilled search keys for {count} user(s)")
+    return 0
+
+
+def cmd_upgrade_schema(args: argparse.Namespace) -> int:
+    # main() has already run it; a second pass confirms nothing is left to do.
+    ran = upgrade_schema(engine)
+    print("Schema up to date" if not ran else "\n".join(ran))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="HabitFlow maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-streaks", help="Recompute stored streaks from the completions table")
+    p.add_argument("--user-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_streaks)
+
+    p = sub.add_parser("rebuild-bitsets", help="Regenerate completion bitsets from the completions table")
+    p.add_argument("--user-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_bitsets)
+
+    p = sub.add_parser("check-bitsets", help="Compare completion bitsets with the completions table")
+    p.add_argument("--user-id", type=int, default=None)
+    p.set_defaults(func=cmd_check_bitsets)
+
+    p = sub.add_parser("rebuild-rollups", help="Regenerate day/week/month rollups from the completions table")
+    p.add_argument("--user-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("rebuild-scores", help="Regenerate weekly leaderboard scores from the weekly rollups")
+    p.add_argument("--user-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_scores)
+
+    p = sub.add_parser("import", help="Bulk-import habits and completions (CSV or NDJSON) for a user")
+    p.add_argument("--user-id", type=int, required=True)
+    p.add_argument("--format", choices=("csv", "ndjson"), default=None, help="Defaults from the file extension")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("drain-feed", help="Fan out every pending feed activity now")
+    p.set_defaults(func=cmd_drain_feed)
+
+    p = sub.add_parser("backfill-search", help="Fill users' name/email search keys (e.g. after upgrade-schema adds them)")
+    p.set_defaults(func=cmd_backfill_search)
+
+    p = sub.add_parser("upgrade-schema", help="Add columns and indexes that tables created by older versions lack")
+    p.set_defaults(func=cmd_upgrade_schema)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    create_db_and_tables()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,23 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from .config import settings
+from .services.metrics import registry
+
+logger = logging.getLogger(__name__)
 
 engine_kwargs = {
-    "echo": True,  # Set to False in production
+    "echo": settings.DB_ECHO,  # Set to False in production
     "pool_pre_ping": True,
 }
 
@@ -10,14 +25,305 @@ engine_kwargs = {
 if settings.DATABASE_URL.startswith("sqlite"):
     engine_kwargs["connect_args"] = {"check_same_thread": False}
 
-# Create engine
+# Create engine (always built: create_all, debug dumps and scripts use it directly)
 engine = create_engine(settings.DATABASE_URL, **engine_kwargs)
 
-def get_session():
-    """Dependency for getting database session"""
-    with Session(engine) as session:
-        yield session
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto its async driver (aiosqlite / asyncpg)."""
+    scheme, sep, rest = url.partition("://")
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme in ("postgres", "postgresql") or scheme.startswith("postgresql+"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+# Async engine, only when DB_ASYNC is enabled
+async_engine: Optional[AsyncEngine] = None
+if settings.DB_ASYNC:
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        echo=settings.DB_ECHO,
+        pool_pre_ping=True,
+    )
+
+
+# ----------------------------
+# Per-request query accounting
+# ----------------------------
+class QueryBudgetExceeded(AssertionError):
+    """Raised (test mode) when a request issues more statements than the query budget."""
+
+
+class QueryStats:
+    """Statements and DB time seen while a `track_queries()` block is active."""
+    __slots__ = ("count", "seconds", "statements", "budget")
+
+    def __init__(self, budget: int = 0):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+        self.budget = budget
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Identical statements run `threshold`+ times: the signature of an N+1 loop."""
+        if threshold <= 0 or self.count < threshold:
+            return []
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_budget_override: Optional[int] = None
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _query_stats.get()
+
+
+@contextmanager
+def track_queries(budget: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    Count statements for everything run inside the block (including threadpool hops,
+    which copy the context). budget > 0 makes the N+1th statement raise.
+    """
+    if budget is None:
+        budget = _budget_override if _budget_override is not None else settings.DB_QUERY_BUDGET
+    stats = QueryStats(budget)
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+@contextmanager
+def query_budget(limit: int) -> Iterator[None]:
+    """Test helper: every request inside the block fails once it exceeds `limit` statements."""
+    global _budget_override
+    previous = _budget_override
+    _budget_override = limit
+    try:
+        yield
+    finally:
+        _budget_override = previous
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    if stats is None:
+        return
+    stats.count += 1
+    stats.statements[statement] += 1
+    if stats.budget and stats.count > stats.budget:
+        raise QueryBudgetExceeded(f"query budget of {stats.budget} exceeded by: {statement}")
+    context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    started = getattr(context, "_query_started_at", None)
+    if stats is None or started is None:
+        return
+    stats.seconds += time.perf_counter() - started
+
+
+pool_checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds", "Time to get a pooled connection (waiting for a slot + connect)", ["engine"]
+)
+pool_checked_out = registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool", ["engine"])
+
+
+def _time_checkouts(pool: Any, label: str) -> None:
+    """
+    Wrap the pool's checkout so waits for an exhausted pool show up in the histogram.
+
+    Pool events only fire once a connection is in hand ("checkout"), so there is no
+    public hook for the start of the wait. This wraps Pool._do_get, which every pool
+    class in SQLAlchemy 2.0.x implements; requirements.txt pins sqlalchemy to 2.0.x
+    for that reason. On a pool without it the histogram just stays empty.
+    """
+    do_get = getattr(pool, "_do_get", None)
+    if do_get is None:
+        return
+    observe = pool_checkout_seconds.labels(label).observe
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+
+def instrument_engine(sync_engine: Engine, label: str) -> None:
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    _time_checkouts(sync_engine.pool, label)
+    if hasattr(sync_engine.pool, "checkedout"):
+        pool_checked_out.labels(label).set_function(lambda: sync_engine.pool.checkedout())
+
+
+instrument_engine(engine, "sync")
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine, "async")
+
+
+class ThreadedSession:
+    """
+    Awaitable facade over a sync Session.
+
+    Mirrors the subset of AsyncSession the routers use, so handlers are written once
+    as `async def` and run against either engine. Each blocking call is pushed to the
+    threadpool. Service functions written against a plain Session go through
+    `run_sync`, same as on AsyncSession.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance: Any) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances: Any) -> None:
+        self.sync_session.add_all(instances)
+
+    async def exec(self, statement: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.exec, statement, **kwargs)
+
+    async def execute(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity: Any, ident: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance: Any, **kwargs: Any) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, **kwargs)
+
+    async def delete(self, instance: Any) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+# What get_session yields; both expose the same awaitable API.
+DBSession = Union[AsyncSession, ThreadedSession]
+
+
+async def get_session():
+    """Dependency for getting database session (AsyncSession, or a sync Session behind ThreadedSession)"""
+    # expire_on_commit=False: handlers return rows after commit, and an expired
+    # attribute cannot be lazy-loaded from an AsyncSession.
+    if async_engine is not None:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+    else:
+        session = ThreadedSession(Session(engine, expire_on_commit=False))
+        try:
+            yield session
+        finally:
+            await session.close()
+
+def dialect_insert(session: Session) -> Optional[Callable[..., Any]]:
+    """`insert` with ON CONFLICT support for the session's dialect (SQLite/Postgres), else None."""
+    name = session.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+# ----------------------------
+# Schema upgrades
+# ----------------------------
+# create_all only creates missing tables; it never alters one that already exists.
+# Columns added to existing tables since, as (table, column, command that fills them
+# in on existing rows). They are added with the model's type and scalar default.
+ADDED_COLUMNS: List[Tuple[str, str, Optional[str]]] = [
+    ("users", "search_name", "backfill-search"),
+    ("users", "search_email", "backfill-search"),
+    ("habits", "current_streak", "rebuild-streaks"),
+    ("habits", "longest_streak", "rebuild-streaks"),
+    ("habits", "last_completed_date", "rebuild-streaks"),
+]
+# Indexes superseded by differently named ones, dropped where still present.
+DROPPED_INDEXES: List[Tuple[str, str]] = [
+    ("friend_requests", "ix_friend_requests_receiver_status"),  # -> ix_friend_requests_receiver_status_created
+    ("completions", "ix_completions_habit_day_id"),  # uq_completion_habit_day serves the same reads
+]
+
+
+def _add_column_ddl(conn: Any, table: str, column_name: str) -> str:
+    column = SQLModel.metadata.tables[table].c[column_name]
+    quote = conn.dialect.identifier_preparer.quote
+    ddl = f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=conn.dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += f" DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+    if not column.nullable and default is not None:
+        ddl += " NOT NULL"
+    return ddl
+
+
+def upgrade_schema(bind: Engine = engine) -> List[str]:
+    """
+    Bring tables created by an older version up to the models: add ADDED_COLUMNS,
+    create any model index that is missing, drop DROPPED_INDEXES. Idempotent (every
+    step checks the live schema first); returns the DDL it ran.
+    """
+    ran: List[str] = []
+    follow_ups = set()
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        for table, column, follow_up in ADDED_COLUMNS:
+            if table in tables and column not in {c["name"] for c in inspector.get_columns(table)}:
+                ran.append(_add_column_ddl(conn, table, column))
+                conn.execute(text(ran[-1]))
+                if follow_up:
+                    follow_ups.add(follow_up)
+        for table, index in DROPPED_INDEXES:
+            if table in tables and index in {i["name"] for i in inspector.get_indexes(table)}:
+                ran.append(f"DROP INDEX {conn.dialect.identifier_preparer.quote(index)}")
+                conn.execute(text(ran[-1]))
+        inspector = inspect(conn)  # fresh reflection after the ALTERs
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    ran.append(f"CREATE INDEX {index.name}")
+    for statement in ran:
+        logger.warning("Schema upgrade: %s", statement)
+    for command in sorted(follow_ups):
+        logger.warning("Schema upgrade: run `python -m app.cli %s` to fill the new columns", command)
+    return ran
+
 
 def create_db_and_tables():
-    """Create all tables"""
+    """Create all tables, then upgrade any that predate the current models"""
     SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
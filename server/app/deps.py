@@ -1,9 +1,15 @@
-from fastapi import Depends, HTTPException, status
+from datetime import date
+from typing import List, Optional, Type
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from sqlmodel import Session
-from .database import get_session
+from pydantic import BaseModel
+from .database import DBSession, get_session
 from .models import User
+from .responses import parse_fields
+from .services import changes
+from .services.auth_cache import UserSnapshot, auth_cache
+import hashlib
 import os
 
 security = HTTPBearer()
@@ -12,14 +18,81 @@ ALGORITHM = "HS256"
 
 async def current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    session: Session = Depends(get_session)
-) -> User:
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
-    except (JWTError, TypeError, ValueError):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    session: DBSession = Depends(get_session)
+) -> UserSnapshot:
+    return await user_from_token(credentials.credentials, session)
+
+
+async def user_from_token(token: str, session: DBSession) -> UserSnapshot:
+    """The user a bearer token belongs to (401 if invalid); for transports without HTTPBearer."""
+    user_id = auth_cache.get_token(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id = int(payload.get("sub"))
+        except (JWTError, TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        auth_cache.remember_token(token, user_id, payload.get("exp"))
+
+    snapshot = auth_cache.get_user(user_id)
+    if snapshot is None:
+        user = await session.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        snapshot = UserSnapshot.from_user(user)
+        auth_cache.remember_user(snapshot)
+    return snapshot
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches.
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def etag_guard(resource: str, daily: bool = False):
+    """
+    Dependency for conditional GETs on a per-user resource (see services/changes.RESOURCES).
+
+    Reads the user's version of `resource` (one primary-key lookup) and derives a
+    strong ETag from it plus the URL. A matching If-None-Match is answered with 304
+    before the handler runs its own queries. `daily` folds today's date in, for
+    bodies with date-dependent fields such as Habit.streak.
+    """
+    async def guard(
+        request: Request,
+        response: Response,
+        session: DBSession = Depends(get_session),
+        user: UserSnapshot = Depends(current_user),
+    ) -> None:
+        version = await session.run_sync(changes.resource_version, user.id, resource)
+        parts = [str(user.id), resource, str(version), request.url.path]
+        parts += [f"{k}={v}" for k, v in sorted(request.query_params.multi_items())]
+        if daily:
+            parts.append(date.today().isoformat())
+        etag = '"' + hashlib.sha1("|".join(parts).encode()).hexdigest()[:24] + '"'
+
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+
+    return guard
+
+
+def sparse_fields(schema: Type[BaseModel]):
+    """
+    Dependency for a `fields=` query parameter on list endpoints: comma-separated
+    names from `schema`, validated up front. Resolves to None (all fields) when absent.
+    """
+    def parse(
+        fields: Optional[str] = Query(
+            default=None, description=f"Comma-separated subset of: {', '.join(schema.model_fields)}"
+        ),
+    ) -> Optional[List[str]]:
+        return parse_fields(fields, schema)
+
+    return parse
@@ -1,23 +1,63 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from .config import settings
 from .database import create_db_and_tables
-from .routes import habits, completions, friends, auth, debug
+from .responses import ORJSONResponse
+from .middleware import MetricsMiddleware, QueryStatsMiddleware
+from .services.metrics import registry
+from .services.feed import feed_worker
+from .services.passwords import password_hasher
+from .services.realtime import broker
+from .routes import habits, completions, friends, auth, debug, dashboard, sync, stats, export, imports, feed, leaderboard, users, events
 
-app = FastAPI(title="HabitFlow API", version="1.0.0")
+app = FastAPI(title="HabitFlow API", version="1.0.0", default_response_class=ORJSONResponse)
 
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-DB-Queries", "X-DB-Time-Ms", "X-DB-N-Plus-One"],
+)
+app.add_middleware(MetricsMiddleware)  # outermost, so latency covers the whole stack
 
 app.include_router(habits.router)
 app.include_router(completions.router)
 app.include_router(auth.router)
 app.include_router(friends.router)
 app.include_router(debug.router)
+app.include_router(dashboard.router)
+app.include_router(sync.router)
+app.include_router(stats.router)
+app.include_router(export.router)
+app.include_router(imports.router)
+app.include_router(feed.router)
+app.include_router(leaderboard.router)
+app.include_router(users.router)
+app.include_router(events.router)
 
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    broker.start()
+    if settings.FEED_WORKER_ENABLED:
+        feed_worker.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    feed_worker.stop()
+    broker.stop()
+    password_hasher.shutdown()
 
 @app.get("/health")
 def health():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of the in-process registry"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,140 @@
+# server/app/middleware.py
+"""
+Pure ASGI middleware (no BaseHTTPMiddleware): handlers run in the same task and
+context, so per-request ContextVars set here are visible all the way down,
+including threadpool hops.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .database import QueryBudgetExceeded, track_queries
+from .services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DB_STATEMENT_BUCKETS = (1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 89)
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"]
+)
+http_latency = registry.histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served")
+http_exceptions = registry.counter(
+    "http_unhandled_exceptions_total", "Requests that raised instead of returning a response", ["method", "route"]
+)
+
+db_statements = registry.histogram(
+    "db_statements_per_request", "SQL statements issued per request", ["route"], buckets=DB_STATEMENT_BUCKETS
+)
+db_seconds = registry.histogram("db_seconds_per_request", "Time spent in SQL per request", ["route"])
+db_n_plus_one = registry.counter(
+    "db_n_plus_one_suspected_total", "Requests that repeated an identical statement (likely N+1)", ["route"]
+)
+
+
+def route_template(scope: Scope) -> str:
+    """`/api/habits/{habit_id}` rather than `/api/habits/42`, so labels stay bounded."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Per-route request count, status, latency and in-flight gauge.
+    Cost per request is two perf_counter() calls and a handful of dict lookups.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.in_flight = http_in_flight.labels()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+        self.in_flight.inc()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            http_exceptions.labels(scope["method"], route_template(scope)).inc()
+            raise
+        finally:
+            self.in_flight.dec()
+            route = route_template(scope)
+            http_latency.labels(scope["method"], route).observe(time.perf_counter() - started)
+            http_requests.labels(scope["method"], route, str(status_code)).inc()
+
+
+class QueryStatsMiddleware:
+    """
+    Counts SQL statements and DB time per request.
+    Adds X-DB-Queries / X-DB-Time-Ms (and X-DB-N-Plus-One when suspicious) to the
+    response and records the same numbers in the metrics registry.
+
+    A request over the query budget (DB_QUERY_BUDGET, or an X-DB-Query-Budget request
+    header when ENABLE_DEBUG_ENDPOINTS=1) gets a 500 naming the statement that broke it.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.threshold = settings.DB_N_PLUS_ONE_THRESHOLD
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = None
+        if os.getenv("ENABLE_DEBUG_ENDPOINTS") == "1":
+            requested = Headers(scope=scope).get("x-db-query-budget", "")
+            budget = int(requested) if requested.isdigit() else None
+
+        started = False
+        with track_queries(budget) as stats:
+            async def send_with_stats(message: Message) -> None:
+                nonlocal started
+                if message["type"] == "http.response.start":
+                    started = True
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Queries", str(stats.count))
+                    headers.append("X-DB-Time-Ms", f"{stats.seconds * 1000:.2f}")
+                    suspects = stats.repeated(self.threshold)
+                    if suspects:
+                        headers.append("X-DB-N-Plus-One", str(len(suspects)))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            except QueryBudgetExceeded as exc:
+                if started:
+                    raise
+                logger.error("%s %s: %s", scope.get("method"), route_template(scope), exc)
+                await JSONResponse({"detail": str(exc)}, status_code=500)(scope, receive, send_with_stats)
+
+        route = route_template(scope)
+        db_statements.labels(route).observe(stats.count)
+        db_seconds.labels(route).observe(stats.seconds)
+        suspects = stats.repeated(self.threshold)
+        if suspects:
+            db_n_plus_one.labels(route).inc()
+            for sql, n in suspects:
+                logger.warning("Possible N+1 on %s %s: %dx %.200s", scope.get("method"), route, n, sql)
@@ -1,11 +1,15 @@
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime, date
 from typing import Optional, List
-from pydantic import BaseModel, EmailStr
-from sqlalchemy import Column, JSON, UniqueConstraint, Index
+from pydantic import BaseModel, ConfigDict, EmailStr, computed_field, conlist
+from sqlalchemy import Column, JSON, LargeBinary, String, UniqueConstraint, Index
 
 # ===== DATABASE MODELS (SQLModel - used for both DB and API responses) =====
 
+# Normalized search keys compare bytewise ("C" collation on Postgres), so a range
+# on the index is exactly a prefix match (see services/user_search.py).
+SEARCH_KEY = String().with_variant(String(collation="C"), "postgresql")
+
 class User(SQLModel, table=True):
     """User model - foundation for all habits and completions"""
     __tablename__ = "users"
@@ -16,6 +20,10 @@ class User(SQLModel, table=True):
     name: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = Field(default=None, sa_column_kwargs={"onupdate": datetime.utcnow})
+
+    # Case-folded name/email for GET /api/users/search; set via user_search.set_keys
+    search_name: Optional[str] = Field(default=None, sa_type=SEARCH_KEY, index=True)
+    search_email: Optional[str] = Field(default=None, sa_type=SEARCH_KEY, index=True)
     
     # Relationships (not stored in DB, just for querying)
     habits: List["Habit"] = Relationship(back_populates="user")
@@ -76,6 +84,11 @@ class Habit(SQLModel, table=True):
     
     # Status
     status: str = Field(default="active", max_length=20)  # active, paused, archived
+
+    # Streaks (maintained on write by services/streaks.py; never computed on read)
+    current_streak: int = Field(default=0)  # run length ending at last_completed_date
+    longest_streak: int = Field(default=0)
+    last_completed_date: Optional[date] = None
     
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -86,6 +99,13 @@ class Habit(SQLModel, table=True):
     user: Optional[User] = Relationship(back_populates="habits")
     completions: List["Completion"] = Relationship(back_populates="habit")
 
+    @computed_field
+    @property
+    def streak(self) -> int:
+        """Live streak as of today (0 once a scheduled day has been missed)"""
+        from .services.streaks import streak_as_of
+        return streak_as_of(self, date.today())
+
 
 class Completion(SQLModel, table=True):
     """
@@ -95,6 +115,8 @@ class Completion(SQLModel, table=True):
     __tablename__ = "completions"
 
     __table_args__ = (
+        # Also serves keyset pagination of a habit's history: the pair is unique, so
+        # (completed_date, id) desc within a habit is a range read of this index.
         UniqueConstraint("habit_id", "completed_date", name="uq_completion_habit_day"),
         Index("ix_completions_user_day", "user_id", "completed_date"),
     )
@@ -116,6 +138,139 @@ class Completion(SQLModel, table=True):
     user: Optional[User] = Relationship(back_populates="completions")
 
 
+class CompletionBitset(SQLModel, table=True):
+    """
+    Compact secondary index of completions: one row per habit per year, bit N set
+    when the habit was completed on day-of-year N+1. Kept in sync on write; the
+    completions table stays canonical (see services/bitsets.py for rebuild/check).
+    """
+    __tablename__ = "completion_bitsets"
+
+    __table_args__ = (
+        UniqueConstraint("habit_id", "year", name="uq_completion_bitset_habit_year"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    habit_id: int = Field(foreign_key="habits.id", index=True)
+    user_id: int = Field(foreign_key="users.id", index=True)
+    year: int
+    bits: bytes = Field(sa_column=Column(LargeBinary, nullable=False))  # 46 bytes = 368 bits
+
+
+class CompletionRollup(SQLModel, table=True):
+    """
+    Precomputed completion totals per habit per day / week (Monday start) / month,
+    maintained on write (see services/rollups.py). GET /api/stats reads only these.
+    """
+    __tablename__ = "completion_rollups"
+
+    __table_args__ = (
+        UniqueConstraint("habit_id", "period", "period_start", name="uq_completion_rollup_habit_period"),
+        Index("ix_completion_rollups_user_period", "user_id", "period", "period_start"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    habit_id: int = Field(foreign_key="habits.id")
+    user_id: int = Field(foreign_key="users.id")
+    period: str = Field(max_length=10)  # day, week, month
+    period_start: date
+    completions: int = Field(default=0)
+    quantity_total: float = Field(default=0.0)  # sum of quantity_value, in the habit's quantity_unit
+
+
+class WeeklyScore(SQLModel, table=True):
+    """
+    Completions per user per week (Monday start), maintained on write alongside the
+    rollups. Friend leaderboards are assembled from these rows (services/leaderboard.py).
+    """
+    __tablename__ = "weekly_scores"
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    week_start: date = Field(primary_key=True)
+    completions: int = Field(default=0)
+
+
+class SyncCounter(SQLModel, table=True):
+    """
+    Per-user sync version counter. Bumped (row-locked) by every write that logs a
+    change, so a user's change versions are handed out in commit order.
+    """
+    __tablename__ = "sync_counters"
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    version: int = Field(default=0)
+
+
+class ResourceVersion(SQLModel, table=True):
+    """
+    Per-user, per-resource version (habits, friend_requests, friends), bumped by
+    every write that touches the resource. Read-side ETags are derived from it.
+    """
+    __tablename__ = "resource_versions"
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    resource: str = Field(max_length=20, primary_key=True)
+    version: int = Field(default=0)
+
+
+class ChangeLog(SQLModel, table=True):
+    """
+    Per-user change log behind GET /api/sync. Compacted on write: each entity keeps
+    only its latest entry (upsert or delete tombstone), so the log grows with the
+    number of rows a user has touched, not with the number of writes.
+    """
+    __tablename__ = "change_log"
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "version", name="uq_change_log_user_version"),
+        Index("ix_change_log_user_entity", "user_id", "entity", "entity_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id")
+    version: int  # per-user, from SyncCounter
+    entity: str = Field(max_length=20)  # habit, completion, friend_request, friendship
+    entity_id: int
+    op: str = Field(max_length=10)  # upsert, delete
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Activity(SQLModel, table=True):
+    """
+    Something a user did that their friends' feeds show ("completed Read", "became
+    friends with Bob"). Written on the request path; services/feed.py fans it out
+    to friends' FeedItem rows in the background (or, for very high-degree actors,
+    leaves it to be pulled on read).
+    """
+    __tablename__ = "activities"
+
+    __table_args__ = (
+        # Worker: pending rows; read path: pull-mode activities of the viewer's friends.
+        Index("ix_activities_fanout_actor", "fanout", "actor_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    actor_id: int = Field(foreign_key="users.id")
+    verb: str = Field(max_length=20)  # completed, friended
+    # Plain ids + name copies: a feed entry outlives the habit it mentions.
+    habit_id: Optional[int] = None
+    habit_name: Optional[str] = Field(default=None, max_length=100)
+    subject_id: Optional[int] = Field(default=None, foreign_key="users.id")  # the new friend, for "friended"
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    fanout: str = Field(default="pending", max_length=10)  # pending, push, pull
+
+
+class FeedItem(SQLModel, table=True):
+    """
+    One activity in one user's feed. The (owner_id, activity_id) key doubles as the
+    keyset index for feed pages; each owner keeps at most FEED_MAX_ITEMS rows.
+    """
+    __tablename__ = "feed_items"
+
+    owner_id: int = Field(foreign_key="users.id", primary_key=True)
+    activity_id: int = Field(foreign_key="activities.id", primary_key=True)
+
+
 # ===== REQUEST SCHEMAS (Pydantic - only for API input validation) =====
 
 class UserCreate(BaseModel):
@@ -171,12 +326,97 @@ class CompletionCreate(BaseModel):
     note: Optional[str] = None
 
 
+class CompletionBatchItem(CompletionCreate):
+    """One completion in a batch replay (e.g. ticked while offline)"""
+    habit_id: int
+
+
+class CompletionBatch(BaseModel):
+    """Schema for replaying many completions, across habits, in one request"""
+    items: conlist(CompletionBatchItem, min_length=1, max_length=1000)
+
+
+class HabitImport(HabitCreate):
+    """A habit row in a bulk import; fields other trackers rarely have get defaults"""
+    id: Optional[int] = None  # id in the source file, only used to resolve its completion rows
+    category: str = "other"
+    description: str = ""
+    trigger_value: str = ""
+    frequency_type: str = "daily"
+    status: str = "active"
+
+
+class CompletionImport(CompletionCreate):
+    """A completion row in a bulk import; points at its habit by source id or by name"""
+    habit_id: Optional[int] = None
+    habit_name: Optional[str] = None
+
+
 class AIGenerateRequest(BaseModel):
     """Schema for AI habit generation request"""
     user_goal: str  # Natural language: "I want to pray except weekends"
     category: str  # fitness, study, wellness, reading, sleep
     context: Optional[dict] = None  # {"experience_level": "beginner", "available_time": 15}
 
+
+# ===== RESPONSE SCHEMAS (Pydantic - declared as response_model) =====
+# Declaring these lets FastAPI serialize straight to JSON bytes through Pydantic's
+# core instead of walking each table model with jsonable_encoder, and keeps
+# relationships and internal columns out of responses.
+
+class HabitRead(BaseModel):
+    """A habit as returned by the API"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    name: str
+    category: str
+    description: str
+    trigger_type: str
+    trigger_value: str
+    frequency_type: str
+    frequency_pattern: Optional[dict] = None
+    requires_quantity: bool
+    quantity_unit: Optional[str] = None
+    allows_notes: bool
+    motivation_statement: Optional[str] = None
+    status: str
+    current_streak: int
+    longest_streak: int
+    last_completed_date: Optional[date] = None
+    created_at: datetime
+    started_at: Optional[date] = None
+    updated_at: Optional[datetime] = None
+    streak: int  # Habit.streak: live streak as of today
+
+
+class CompletionRead(BaseModel):
+    """A completion as returned by the API"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    habit_id: int
+    user_id: int
+    completed_date: date
+    completed_at: datetime
+    quantity_value: Optional[float] = None
+    note: Optional[str] = None
+
+
+class FriendRequestRead(BaseModel):
+    """A friend request as returned by the API"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    requester_id: int
+    receiver_id: int
+    status: str
+    message: Optional[str] = None
+    created_at: datetime
+    responded_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 # ===== FRIENDS MODELS =====
 
 class FriendRequest(SQLModel, table=True):
@@ -213,7 +453,11 @@ class FriendRequest(SQLModel, table=True):
     __table_args__ = (
         # prevents duplicate pending requests in the same direction
         UniqueConstraint("requester_id", "receiver_id", name="uq_friend_request_pair"),
-        Index("ix_friend_requests_receiver_status", "receiver_id", "status"),
+        # Inbox/outbox: status-filtered, keyset-paginated on (created_at, id) desc, and
+        # pending counts answered from the index alone. (Replaces the 2-column
+        # ix_friend_requests_receiver_status; see database.DROPPED_INDEXES.)
+        Index("ix_friend_requests_receiver_status_created", "receiver_id", "status", "created_at", "id"),
+        Index("ix_friend_requests_requester_status", "requester_id", "status", "created_at", "id"),
     )
 
 
@@ -0,0 +1,78 @@
+# server/app/responses.py
+"""
+JSON response classes and the row-tuple serialization path.
+
+ORJSONResponse is the app's default response class, so plain dict/list returns
+are rendered by orjson rather than json.dumps. Routes that declare a
+`response_model` (the *Read schemas in models.py) take FastAPI's Pydantic
+dump_json path instead, which never builds an intermediate dict.
+
+Large lists skip both: `rows_response` renders column tuples from a Core
+`select(*columns)` straight to bytes, with no ORM instances, no jsonable_encoder
+walk and no response-model validation. The same listings take a `fields=`
+sparse fieldset (parse_fields), which narrows the SELECT itself.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable, List, Optional, Sequence, Type
+
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlmodel import SQLModel
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        # orjson writes date/datetime as ISO 8601, matching Pydantic's output.
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[List[str]]:
+    """
+    `fields=id,name,status` as a list of the schema's field names, in request order
+    (None when the parameter is absent). Unknown names are a 400 before any query runs.
+    """
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in schema.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if not names:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    return names
+
+
+def read_columns(model: Type[SQLModel], schema: Type[BaseModel], fields: Optional[Sequence[str]] = None) -> List[Any]:
+    """The table columns behind a read schema's fields (or just `fields`), in that order."""
+    table = model.__table__
+    return [table.c[name] for name in (fields or schema.model_fields) if name in table.c]
+
+
+def json_response(content: Any, response: Optional[Response] = None, status_code: int = 200) -> ORJSONResponse:
+    """
+    ORJSONResponse carrying over the headers already set on the route's injected
+    `response` (ETag, X-Next-Cursor, ...), which FastAPI drops when a handler
+    returns its own Response.
+    """
+    out = ORJSONResponse(content, status_code=status_code)
+    if response is not None:
+        out.headers.raw.extend(response.headers.raw)
+    return out
+
+
+def rows_response(
+    keys: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    response: Optional[Response] = None,
+    status_code: int = 200,
+) -> ORJSONResponse:
+    """
+    JSON array of objects from column tuples. Trailing columns beyond `keys` (e.g. sort
+    keys selected only to build a cursor) are left out of the objects.
+    """
+    return json_response([dict(zip(keys, row)) for row in rows], response, status_code)
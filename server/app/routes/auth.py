@@ -2,20 +2,20 @@
 from __future__ import annotations
 
 import os
-import hashlib
-import hmac
-import secrets
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from jose import jwt
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel import select
 
-from ..database import get_session
+from ..database import DBSession, get_session
 from ..models import User, UserCreate, UserLogin, UserUpdate  # UserUpdate for PATCH /me
-from ..deps import current_user  # for GET /me and PATCH /me
+from ..deps import UserSnapshot, current_user  # for GET /me and PATCH /me
+from ..services import user_search
+from ..services.auth_cache import auth_cache
+from ..services.passwords import HashingBusy, password_hasher
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -26,29 +26,21 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
 
 
 # ----------------------------
-# Password hashing (no extra deps)
-# Stored format: pbkdf2_sha256$<iters>$<salt_hex>$<dk_hex>
+# Password hashing lives in services/passwords.py; the routes await the process pool
+# via password_hasher so PBKDF2 never runs on a request worker.
 # ----------------------------
-def hash_password(password: str, iterations: int = 200_000) -> str:
-    if not isinstance(password, str) or len(password) < 1:
-        raise ValueError("Password required")
-    salt = secrets.token_bytes(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
-    return f"pbkdf2_sha256${iterations}${salt.hex()}${dk.hex()}"
+async def _hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashingBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
 
 
-def verify_password(password: str, stored: str) -> bool:
+async def _verify(password: str, stored: str) -> bool:
     try:
-        scheme, iters_s, salt_hex, dk_hex = stored.split("$", 3)
-        if scheme != "pbkdf2_sha256":
-            return False
-        iterations = int(iters_s)
-        salt = bytes.fromhex(salt_hex)
-        expected = bytes.fromhex(dk_hex)
-        candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
-        return hmac.compare_digest(candidate, expected)
-    except Exception:
-        return False
+        return await password_hasher.verify(password, stored)
+    except HashingBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
 
 
 def create_access_token(sub: str, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
@@ -63,7 +55,7 @@ def create_access_token(sub: str, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MIN
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def public_user(u: User) -> Dict[str, Any]:
+def public_user(u: User | UserSnapshot) -> Dict[str, Any]:
     # Tests only need user.id, but returning a sane object is useful.
     return {
         "id": u.id,
@@ -74,75 +66,93 @@ def public_user(u: User) -> Dict[str, Any]:
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register(payload: UserCreate, session: Session = Depends(get_session)):
+async def register(payload: UserCreate, session: DBSession = Depends(get_session)):
     # Basic validation; keep it simple for tests.
     if not payload.password or len(payload.password) < 6:
         raise HTTPException(status_code=400, detail="Password too short")
 
     user = User(
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=await _hash(payload.password),
         name=payload.name,
     )
+    user_search.set_keys(user)
     session.add(user)
     try:
-        session.commit()
+        await session.commit()
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
 
-    session.refresh(user)
+    await session.refresh(user)
     token = create_access_token(str(user.id))
     return {"user": public_user(user), "access_token": token, "token_type": "bearer"}
 
 
 @router.post("/login", status_code=status.HTTP_200_OK)
-def login(payload: UserLogin, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == payload.email)).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login(payload: UserLogin, session: DBSession = Depends(get_session)):
+    user = (await session.exec(select(User).where(User.email == payload.email))).first()
+    # End the read before hashing: a pooled connection must not sit idle behind the hashing
+    # queue, or a login burst exhausts the DB pool long before HASH_QUEUE_LIMIT is reached.
+    await session.commit()
+    if not user or not await _verify(payload.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
+    # Transparent upgrade: hashes made with an older iteration count are redone now
+    # that we have the plaintext, so PASSWORD_HASH_ITERATIONS can change without a migration.
+    if password_hasher.needs_rehash(user.password_hash):
+        user.password_hash = await _hash(payload.password)
+        session.add(user)
+        await session.commit()
+
     token = create_access_token(str(user.id))
     return {"user": public_user(user), "access_token": token, "token_type": "bearer"}
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-def logout():
+async def logout():
     # Stateless JWT logout: tests expect 200. :contentReference[oaicite:5]{index=5}
     return {"message": "logged out"}
 
 
 @router.get("/me", status_code=status.HTTP_200_OK)
-def get_me(user: User = Depends(current_user)):
+async def get_me(user: UserSnapshot = Depends(current_user)):
     return public_user(user)
 
 
 @router.patch("/me", status_code=status.HTTP_200_OK)
-def update_me(
+async def update_me(
     payload: UserUpdate,
-    user: User = Depends(current_user),
-    session: Session = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+    session: DBSession = Depends(get_session),
 ):
+    # current_user hands back a cached snapshot; edits go through the real row.
+    db_user = await session.get(User, user.id)
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
     if payload.name is not None:
-        user.name = payload.name
+        db_user.name = payload.name
 
-    if payload.email is not None and payload.email != user.email:
-        existing = session.exec(select(User).where(User.email == payload.email)).first()
+    if payload.email is not None and payload.email != db_user.email:
+        existing = (await session.exec(select(User).where(User.email == payload.email))).first()
         if existing:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already in use")
-        user.email = payload.email
+        db_user.email = payload.email
 
     if payload.new_password is not None:
         if not payload.current_password:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="current_password required to set a new password")
-        if not verify_password(payload.current_password, user.password_hash):
+        if not await _verify(payload.current_password, db_user.password_hash):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="current_password is incorrect")
         if len(payload.new_password) < 6:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Password too short")
-        user.password_hash = hash_password(payload.new_password)
-
-    user.updated_at = datetime.utcnow()  # set manually; onupdate is unreliable here
-    session.add(user)
-    session.commit()
-    session.refresh(user)
-    return public_user(user)
\ No newline at end of file
+        db_user.password_hash = await _hash(payload.new_password)
+
+    user_search.set_keys(db_user)
+    db_user.updated_at = datetime.utcnow()  # set manually; onupdate is unreliable here
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    auth_cache.invalidate_user(db_user.id)
+    return public_user(db_user)
\ No newline at end of file
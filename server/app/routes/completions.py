@@ -1,32 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+from sqlmodel import select
 from datetime import date
-from ..database import get_session
-from ..deps import current_user
-from ..models import Completion, CompletionCreate, Habit, User
+from typing import List, Optional
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user, sparse_fields
+from ..models import Completion, CompletionBatch, CompletionCreate, CompletionRead, Habit
+from ..responses import read_columns, rows_response
+from ..services import bitsets, feed, realtime
+from ..services.completion_writes import insert_batch, record_inserted
+from ..services.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/api/completions", tags=["completions"])
 
-@router.post("/habits/{habit_id}/complete", status_code=status.HTTP_201_CREATED)
-def complete_habit(
+@router.post("/habits/{habit_id}/complete", response_model=CompletionRead, status_code=status.HTTP_201_CREATED)
+async def complete_habit(
     habit_id: int,
     completion: CompletionCreate,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     """Mark a habit as completed for a specific date"""
-    # Verify habit exists and belongs to user
-    habit = session.get(Habit, habit_id)
+    # Verify habit exists and belongs to user; the row lock serializes streak updates
+    habit = await session.get(Habit, habit_id, with_for_update=True)
     if not habit or habit.user_id != user.id:
         raise HTTPException(status_code=404, detail="Habit not found")
     
     # Check if already completed on this date
-    existing = session.exec(
+    existing = (await session.exec(
         select(Completion).where(
             Completion.habit_id == habit_id,
             Completion.completed_date == completion.completed_date
         )
-    ).first()
+    )).first()
     
     if existing:
         raise HTTPException(status_code=400, detail="Already completed on this date")
@@ -38,25 +45,140 @@ def complete_habit(
         user_id=user.id
     )
     session.add(db_completion)
-    session.commit()
-    session.refresh(db_completion)
+    await session.flush()
+
+    # Bitsets, streak fields, the change log and feed activity are maintained here so reads never scan the history.
+    await session.run_sync(
+        record_inserted,
+        user.id,
+        {habit_id: habit},
+        [(db_completion.id, habit_id, completion.completed_date, completion.quantity_value)],
+    )
+    await session.commit()
+    feed.feed_worker.notify()  # friends' feeds are filled in the background
+    await session.refresh(db_completion)
+    realtime.publish_activity(
+        user.id, "friend.completed",
+        habit_id=habit_id, habit_name=habit.name, completed_date=db_completion.completed_date,
+    )
     return db_completion
 
-@router.get("/habits/{habit_id}/completions")
-def list_completions(
+@router.post("/batch")
+async def complete_batch(
+    batch: CompletionBatch,
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Replay many completions (e.g. ticked offline) in one transaction.
+    Ownership is checked with a single IN query and rows go in with one
+    INSERT ... ON CONFLICT DO NOTHING; each item gets its own result.
+    """
+    habit_ids = {item.habit_id for item in batch.items}
+    habits = {
+        h.id: h
+        for h in (await session.exec(
+            select(Habit)
+            .where(Habit.id.in_(habit_ids), Habit.user_id == user.id)
+            .order_by(Habit.id)
+            .with_for_update()  # streak fields are read-modify-write
+        )).all()
+    }
+
+    rows = []
+    seen = set()
+    for item in batch.items:
+        key = (item.habit_id, item.completed_date)
+        if item.habit_id in habits and key not in seen:
+            seen.add(key)
+            rows.append({**item.model_dump(), "user_id": user.id})
+
+    inserted = await session.run_sync(insert_batch, user.id, habits, rows)
+    await session.commit()
+    if inserted:
+        feed.feed_worker.notify()
+
+    results = []
+    claimed = set()
+    for index, item in enumerate(batch.items):
+        key = (item.habit_id, item.completed_date)
+        result = {"index": index, "habit_id": item.habit_id, "completed_date": item.completed_date}
+        if item.habit_id not in habits:
+            result["status"] = "not_found"
+        elif key in inserted and key not in claimed:
+            claimed.add(key)
+            result.update(status="created", id=inserted[key])
+        else:
+            result["status"] = "duplicate"
+        results.append(result)
+
+    counts = {"created": 0, "duplicate": 0, "not_found": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {**counts, "results": results}
+
+@router.get("/habits/{habit_id}/completions", response_model=List[CompletionRead])
+async def list_completions(
     habit_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    response: Response,
+    limit: int = Query(default=settings.COMPLETIONS_PAGE_SIZE, ge=1, le=settings.COMPLETIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = Query(default=None, alias="from"),
+    date_to: Optional[date] = Query(default=None, alias="to"),
+    fields: Optional[List[str]] = Depends(sparse_fields(CompletionRead)),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
-    """List all completions for a habit"""
+    """
+    List a habit's completions, newest first, one page at a time.
+    Pages are keyset-paginated on (completed_date, id): pass the X-Next-Cursor
+    header of one response as `cursor` to get the next; no header means last page.
+    `from`/`to` bound completed_date (inclusive); `fields=` narrows the columns read.
+    """
+    after = decode_cursor(cursor, (date, int))
+
     # Verify habit belongs to user
-    habit = session.get(Habit, habit_id)
+    habit = await session.get(Habit, habit_id)
     if not habit or habit.user_id != user.id:
         raise HTTPException(status_code=404, detail="Habit not found")
     
-    query = select(Completion).where(
-        Completion.habit_id == habit_id
-    ).order_by(Completion.completed_date.desc())
+    names = fields or list(CompletionRead.model_fields)
+    columns = read_columns(Completion, CompletionRead, names)
+    # The sort key is always read, for the cursor, but only returned if asked for.
+    columns += [c for c in (Completion.completed_date, Completion.id) if c.name not in names]
+    query = select(*columns).where(Completion.habit_id == habit_id)
+    if date_from is not None:
+        query = query.where(Completion.completed_date >= date_from)
+    if date_to is not None:
+        query = query.where(Completion.completed_date <= date_to)
+    if after is not None:
+        query = query.where(tuple_(Completion.completed_date, Completion.id) < tuple(after))
+    # One extra row tells us whether another page exists without a COUNT.
+    query = query.order_by(Completion.completed_date.desc(), Completion.id.desc()).limit(limit + 1)
     
-    completions = session.exec(query).all()
-    return completions
+    # Column tuples, not ORM instances: a full page serializes straight to JSON bytes.
+    rows = (await session.exec(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor((last.completed_date, last.id))
+    return rows_response(names, rows, response)
+
+@router.get("/habits/{habit_id}/calendar")
+async def completion_calendar(
+    habit_id: int,
+    year: int = Query(..., ge=1970, le=9999),
+    month: Optional[int] = Query(default=None, ge=1, le=12),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """Completed dates for a month (or a whole year), read from the habit's bitset"""
+    habit = await session.get(Habit, habit_id)
+    if not habit or habit.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Habit not found")
+
+    if month is None:
+        days = await session.run_sync(bitsets.year_days, habit_id, year)
+    else:
+        days = await session.run_sync(bitsets.month_days, habit_id, year, month)
+    return {"habit_id": habit_id, "year": year, "month": month, "completed_dates": days}
@@ -0,0 +1,63 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import select
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..models import Completion, Habit
+from ..services import streaks
+
+router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
+
+@router.get("/today")
+async def today_dashboard(
+    on: Optional[date] = Query(default=None, description="Day to report on (defaults to server today)"),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Everything HomeView's "Today's Progress" card needs in one call: active habits,
+    whether each is done on the day, live streaks and the overall percentage.
+    Two queries regardless of habit count (streaks are stored on Habit).
+    """
+    day = on or date.today()
+
+    habits = (await session.exec(
+        select(Habit).where(Habit.user_id == user.id, Habit.status == "active").order_by(Habit.id)
+    )).all()
+
+    # One indexed lookup on ix_completions_user_day covers every habit.
+    done = {
+        habit_id: quantity
+        for habit_id, quantity in (await session.exec(
+            select(Completion.habit_id, Completion.quantity_value).where(
+                Completion.user_id == user.id,
+                Completion.completed_date == day,
+            )
+        )).all()
+    }
+
+    items = []
+    scheduled_count = completed_count = 0
+    for habit in habits:
+        scheduled = day.weekday() in streaks.habit_weekdays(habit)
+        completed = habit.id in done
+        if scheduled:
+            scheduled_count += 1
+            completed_count += completed
+        item = habit.model_dump()
+        item.update(
+            scheduled=scheduled,
+            completed=completed,
+            quantity_value=done.get(habit.id),
+            streak=streaks.streak_as_of(habit, day),
+        )
+        items.append(item)
+
+    return {
+        "date": day,
+        "habits": items,
+        "scheduled_count": scheduled_count,
+        "completed_count": completed_count,
+        "completion_percentage": round(100 * completed_count / scheduled_count, 1) if scheduled_count else 0.0,
+    }
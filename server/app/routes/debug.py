@@ -1,11 +1,16 @@
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Body, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
 
 from ..database import engine
-from ..models import User, Habit, Completion, FriendRequest, Friendship
+from ..models import User
+from ..services import dbdump
+from ..services.auth_cache import auth_cache
+from ..services.passwords import SCHEME, hash_iterations, hash_password, password_hasher
+from ..services.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/api/debug", tags=["debug"])
 
@@ -17,24 +22,81 @@ def _guard():
 
 
 @router.get("/print-db")
-def print_db() -> Dict[str, Any]:
+def print_db() -> StreamingResponse:
     """
-    Dumps entire DB contents.
-    ONLY use in development.
+    Dumps entire DB contents, streamed table by table in fixed-size batches.
+    ONLY use in development. For big databases prefer /summary and /tables/{name}.
     """
     _guard()
+    return StreamingResponse(dbdump.stream_dump(), media_type="application/json")
 
+
+@router.get("/summary")
+def db_summary() -> Dict[str, Any]:
+    """Row count (COUNT(*)) and, where the backend reports it, size in bytes per table."""
+    _guard()
+    with Session(engine) as s:
+        return dbdump.summary(s)
+
+
+@router.get("/tables/{name}")
+def dump_table(
+    name: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+) -> Dict[str, Any]:
+    """One page of a table in primary-key order; pass `next_cursor` back as `cursor`."""
+    _guard()
+    table = dbdump.tables().get(name)
+    if table is None:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    after = decode_cursor(cursor, dbdump.key_types(table))
+    with Session(engine) as s:
+        result = dbdump.page(s, table, after, limit)
+    nxt = result.pop("next")
+    result["next_cursor"] = encode_cursor(nxt) if nxt is not None else None
+    return result
+
+
+@router.get("/auth-cache")
+def auth_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the token + user caches behind deps.current_user."""
+    _guard()
+    return auth_cache.stats()
+
+
+@router.get("/password-hasher")
+def password_hasher_stats() -> Dict[str, Any]:
+    """Pool size, queue limit, jobs in flight and the iteration count for new hashes."""
+    _guard()
+    return password_hasher.stats()
+
+
+@router.get("/users/{user_id}/password-hash")
+def password_hash_info(user_id: int) -> Dict[str, Any]:
+    """Scheme and iteration count of a user's stored hash (never the hash itself)."""
+    _guard()
+    with Session(engine) as s:
+        user = s.get(User, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        scheme = user.password_hash.split("$", 1)[0]
+        return {"user_id": user_id, "scheme": scheme, "iterations": hash_iterations(user.password_hash)}
+
+
+@router.put("/users/{user_id}/password-hash")
+def set_password_hash(
+    user_id: int,
+    password: str = Body(...),
+    iterations: int = Body(..., ge=1),
+) -> Dict[str, Any]:
+    """Store a hash made with `iterations`, as an older PASSWORD_HASH_ITERATIONS would have (rehash-on-login tests)."""
+    _guard()
     with Session(engine) as s:
-        users = s.exec(select(User)).all()
-        habits = s.exec(select(Habit)).all()
-        completions = s.exec(select(Completion)).all()
-        friend_requests = s.exec(select(FriendRequest)).all()
-        friendships = s.exec(select(Friendship)).all()
-
-        return {
-            "users": [u.model_dump() for u in users],
-            "habits": [h.model_dump() for h in habits],
-            "completions": [c.model_dump() for c in completions],
-            "friend_requests": [fr.model_dump() for fr in friend_requests],
-            "friendships": [fs.model_dump() for fs in friendships],
-        }
\ No newline at end of file
+        user = s.get(User, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user.password_hash = hash_password(password, iterations)
+        s.add(user)
+        s.commit()
+    return {"user_id": user_id, "scheme": SCHEME, "iterations": iterations}
\ No newline at end of file
@@ -0,0 +1,89 @@
+import asyncio
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlmodel import select
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user, user_from_token
+from ..services import realtime
+from ..services.friend_graph import edges
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+async def _open(session: DBSession, user_id: int) -> realtime.Subscription:
+    """Subscribe the user and their friends' activity, then release the DB connection."""
+    subscription = realtime.open_stream(user_id)
+    try:
+        friends = edges([user_id])
+        friend_ids: List[int] = (await session.exec(select(friends.c.friend_id))).all()
+        realtime.follow(subscription, friend_ids)
+    except BaseException:
+        subscription.close()
+        raise
+    finally:
+        # The stream can stay open for hours; it must not pin a pooled connection.
+        await session.close()
+    return subscription
+
+
+@router.get("")
+async def event_stream(session: DBSession = Depends(get_session), user: UserSnapshot = Depends(current_user)):
+    """
+    Server-sent events for the signed-in user: friend_request.received / .declined /
+    .canceled, friend.added, friend.removed and friend.completed. A heartbeat comment
+    goes out every PUSH_KEEPALIVE_SECONDS. An `overflow` event means events were
+    dropped because the client fell behind; resync with GET /api/sync.
+    """
+    subscription = await _open(session, user.id)
+    stream = realtime.events(subscription, settings.PUSH_KEEPALIVE_SECONDS)
+    return StreamingResponse(
+        (realtime.encode_sse(event) async for event in stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(subscription.close),  # also if the body never started
+    )
+
+
+@router.websocket("/ws")
+async def event_socket(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    session: DBSession = Depends(get_session),
+):
+    """
+    The same events over a WebSocket, as JSON text frames {"type", "data"}. Browsers
+    cannot set headers on a WebSocket, so the JWT may also come as `?token=`.
+    """
+    header = websocket.headers.get("authorization", "")
+    bearer = header[7:] if header.lower().startswith("bearer ") else None
+    try:
+        if not (bearer or token):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        user = await user_from_token(bearer or token, session)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = await _open(session, user.id)
+
+    async def send() -> None:
+        async for event in realtime.events(subscription, settings.PUSH_KEEPALIVE_SECONDS):
+            await websocket.send_text(orjson.dumps(event or {"type": "keepalive"}).decode())
+
+    async def receive() -> None:
+        # Nothing is expected from the client; reading is how a disconnect is noticed.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        subscription.close()
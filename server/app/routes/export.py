@@ -0,0 +1,32 @@
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from ..deps import UserSnapshot, current_user
+from ..services.export import EXPORT_TABLES, export_chunks
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+@router.get("")
+async def export_account(
+    fmt: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+    tables: Optional[List[str]] = Query(default=None, description="Subset of habits, completions, friendships"),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Stream the user's habits, completions and friendships as NDJSON or CSV.
+    Rows are read and encoded in fixed-size batches, so memory does not grow with the account.
+    """
+    wanted = tables or list(EXPORT_TABLES)
+    unknown = sorted(set(wanted) - set(EXPORT_TABLES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+
+    filename = f"habitflow-export-{date.today().isoformat()}.{fmt}"
+    return StreamingResponse(
+        export_chunks(user.id, fmt, wanted),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
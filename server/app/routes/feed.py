@@ -0,0 +1,29 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Response
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..responses import json_response
+from ..services import feed
+from ..services.pagination import decode_cursor, encode_cursor
+
+router = APIRouter(prefix="/api/feed", tags=["feed"])
+
+@router.get("")
+async def read_feed(
+    response: Response,
+    limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=settings.FEED_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Friends' recent activity, newest first. Keyset-paginated like completion
+    listings: pass the X-Next-Cursor header back as `cursor`; no header means last page.
+    Entries appear once the background fan-out has run (usually well under a second).
+    """
+    after = decode_cursor(cursor, (int,))
+    items, next_before = await session.run_sync(feed.page, user.id, after[0] if after else None, limit)
+    if next_before is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor((next_before,))
+    return json_response(items, response)
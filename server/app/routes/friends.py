@@ -1,16 +1,21 @@
 # server/app/routes/friends.py
 from __future__ import annotations
 
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import case, func, tuple_
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel import select
 
-from ..database import get_session
-from ..deps import current_user
-from ..models import User, FriendRequest, Friendship
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user, etag_guard, sparse_fields
+from ..models import Completion, Habit, User, FriendRequest, FriendRequestRead, Friendship
+from ..responses import read_columns, rows_response
+from ..services import changes, feed, friend_graph, leaderboard, realtime, streaks
+from ..services.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/api/friends", tags=["friends"])
 
@@ -20,35 +25,51 @@ def _friendship_pair(a: int, b: int) -> tuple[int, int]:
     return low, high
 
 
-@router.post("/requests", status_code=status.HTTP_201_CREATED)
-def send_request(
+async def _log(session: DBSession, entity: str, row, op: str = changes.UPSERT) -> None:
+    """Record a friends-table change for both users involved (row must be flushed)."""
+    if entity == "friendship":
+        users = (row.user_low_id, row.user_high_id)
+    else:
+        users = (row.requester_id, row.receiver_id)
+    await session.run_sync(changes.record_change, users, entity, row.id, op)
+
+
+def _push_received(req: FriendRequest) -> None:
+    realtime.publish(
+        [req.receiver_id], "friend_request.received",
+        id=req.id, requester_id=req.requester_id, message=req.message, created_at=req.created_at,
+    )
+
+
+@router.post("/requests", response_model=FriendRequestRead, status_code=status.HTTP_201_CREATED)
+async def send_request(
     receiver_id: int = Query(...),  # FIX: was Query(.) :contentReference[oaicite:7]{index=7}
     message: Optional[str] = Query(default=None, max_length=280),
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     if receiver_id == user.id:
         raise HTTPException(status_code=400, detail="You cannot friend yourself")
 
-    receiver = session.get(User, receiver_id)
+    receiver = await session.get(User, receiver_id)
     if not receiver:
         raise HTTPException(status_code=404, detail="Receiver not found")
 
     # Already friends?
     low, high = _friendship_pair(user.id, receiver_id)
-    existing_friendship = session.exec(
+    existing_friendship = (await session.exec(
         select(Friendship).where(Friendship.user_low_id == low, Friendship.user_high_id == high)
-    ).first()
+    )).first()
     if existing_friendship:
         raise HTTPException(status_code=409, detail="Already friends")
 
     # If a row already exists for this direction, reuse it (so you can re-request after decline/cancel)
-    existing_req = session.exec(
+    existing_req = (await session.exec(
         select(FriendRequest).where(
             FriendRequest.requester_id == user.id,
             FriendRequest.receiver_id == receiver_id,
         )
-    ).first()
+    )).first()
 
     if existing_req:
         if existing_req.status == "pending":
@@ -59,8 +80,10 @@ def send_request(
         existing_req.created_at = datetime.utcnow()
         existing_req.responded_at = None
         session.add(existing_req)
-        session.commit()
-        session.refresh(existing_req)
+        await _log(session, "friend_request", existing_req)
+        await session.commit()
+        await session.refresh(existing_req)
+        _push_received(existing_req)
         return existing_req
 
     req = FriendRequest(
@@ -71,39 +94,122 @@ def send_request(
     )
     session.add(req)
     try:
-        session.commit()
+        await session.flush()
+        await _log(session, "friend_request", req)
+        await session.commit()
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=409, detail="Request already exists")
-    session.refresh(req)
+    await session.refresh(req)
+    _push_received(req)
     return req
 
 
-@router.get("/requests/inbox", response_model=List[FriendRequest])
-def inbox(session: Session = Depends(get_session), user: User = Depends(current_user)):
-    return session.exec(
-        select(FriendRequest)
-        .where(FriendRequest.receiver_id == user.id)
-        .order_by(FriendRequest.created_at.desc())
-    ).all()
+RequestStatus = Literal["pending", "accepted", "declined", "canceled"]
 
 
-@router.get("/requests/outbox", response_model=List[FriendRequest])
-def outbox(session: Session = Depends(get_session), user: User = Depends(current_user)):
-    return session.exec(
-        select(FriendRequest)
-        .where(FriendRequest.requester_id == user.id)
-        .order_by(FriendRequest.created_at.desc())
-    ).all()
+async def _request_page(
+    session: DBSession,
+    response: Response,
+    owner,
+    user_id: int,
+    status_: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]],
+):
+    """
+    One page of the user's received or sent requests (`owner` is receiver_id or
+    requester_id), newest first, keyset-paginated on (created_at, id). With a status
+    this is a single range read of ix_friend_requests_{receiver,requester}_status.
+    """
+    after = decode_cursor(cursor, (datetime, int))
+    names = fields or list(FriendRequestRead.model_fields)
+    columns = read_columns(FriendRequest, FriendRequestRead, names)
+    # The sort key is always read, for the cursor, but only returned if asked for.
+    columns += [c for c in (FriendRequest.created_at, FriendRequest.id) if c.name not in names]
+    query = select(*columns).where(owner == user_id)
+    if status_ is not None:
+        query = query.where(FriendRequest.status == status_)
+    if after is not None:
+        query = query.where(tuple_(FriendRequest.created_at, FriendRequest.id) < tuple(after))
+    query = query.order_by(FriendRequest.created_at.desc(), FriendRequest.id.desc()).limit(limit + 1)
+
+    rows = (await session.exec(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor((last.created_at, last.id))
+    return rows_response(names, rows, response)
+
+
+@router.get(
+    "/requests/inbox",
+    response_model=List[FriendRequestRead],
+    dependencies=[Depends(etag_guard("friend_requests"))],
+)
+async def inbox(
+    response: Response,
+    status_: Optional[RequestStatus] = Query(default=None, alias="status"),
+    limit: int = Query(default=settings.FRIEND_REQUESTS_PAGE_SIZE, ge=1, le=settings.FRIEND_REQUESTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = Depends(sparse_fields(FriendRequestRead)),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """Requests received, newest first; pass X-Next-Cursor back as `cursor` for the next page."""
+    return await _request_page(
+        session, response, FriendRequest.receiver_id, user.id, status_, limit, cursor, fields
+    )
+
+
+@router.get(
+    "/requests/outbox",
+    response_model=List[FriendRequestRead],
+    dependencies=[Depends(etag_guard("friend_requests"))],
+)
+async def outbox(
+    response: Response,
+    status_: Optional[RequestStatus] = Query(default=None, alias="status"),
+    limit: int = Query(default=settings.FRIEND_REQUESTS_PAGE_SIZE, ge=1, le=settings.FRIEND_REQUESTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = Depends(sparse_fields(FriendRequestRead)),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """Requests sent, newest first; pass X-Next-Cursor back as `cursor` for the next page."""
+    return await _request_page(
+        session, response, FriendRequest.requester_id, user.id, status_, limit, cursor, fields
+    )
+
+
+@router.get("/requests/count", dependencies=[Depends(etag_guard("friend_requests"))])
+async def pending_counts(session: DBSession = Depends(get_session), user: UserSnapshot = Depends(current_user)):
+    """
+    Pending requests received (the badge count) and sent. One statement of two
+    COUNTs, each answered from the (owner, status, ...) index without touching rows.
+    """
+    def pending(owner):
+        return (
+            select(func.count())
+            .select_from(FriendRequest)
+            .where(owner == user.id, FriendRequest.status == "pending")
+            .scalar_subquery()
+        )
+
+    received, sent = (await session.exec(
+        select(pending(FriendRequest.receiver_id), pending(FriendRequest.requester_id))
+    )).one()
+    return {"pending_received": received, "pending_sent": sent}
 
 
 @router.post("/requests/{request_id}/accept")
-def accept_request(
+async def accept_request(
     request_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
-    req = session.get(FriendRequest, request_id)
+    req = await session.get(FriendRequest, request_id)
     if not req or req.receiver_id != user.id:
         # Tests expect 404 when requester tries to accept. :contentReference[oaicite:8]{index=8}
         raise HTTPException(status_code=404, detail="Request not found")
@@ -115,24 +221,37 @@ def accept_request(
     req.responded_at = datetime.utcnow()
 
     low, high = _friendship_pair(req.requester_id, req.receiver_id)
-    existing_friendship = session.exec(
+    existing_friendship = (await session.exec(
         select(Friendship).where(Friendship.user_low_id == low, Friendship.user_high_id == high)
-    ).first()
+    )).first()
     if not existing_friendship:
-        session.add(Friendship(user_low_id=low, user_high_id=high))
+        existing_friendship = Friendship(user_low_id=low, user_high_id=high)
+        session.add(existing_friendship)
 
     session.add(req)
-    session.commit()
+    await session.flush()
+    await session.run_sync(
+        changes.record,
+        [(uid, "friend_request", req.id, changes.UPSERT) for uid in (req.requester_id, req.receiver_id)]
+        + [(uid, "friendship", existing_friendship.id, changes.UPSERT) for uid in (low, high)],
+    )
+    feed.record(session, req.receiver_id, feed.FRIENDED, subject_id=req.requester_id)
+    await session.run_sync(leaderboard.touch, low, high)
+    await session.commit()
+    friend_graph.graph.add(low, high)
+    realtime.publish([req.requester_id], "friend.added", friend_id=req.receiver_id, request_id=req.id)
+    realtime.publish([req.receiver_id], "friend.added", friend_id=req.requester_id, request_id=req.id)
+    feed.feed_worker.notify()
     return {"message": "Friend request accepted"}
 
 
 @router.post("/requests/{request_id}/decline")
-def decline_request(
+async def decline_request(
     request_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
-    req = session.get(FriendRequest, request_id)
+    req = await session.get(FriendRequest, request_id)
     if not req or req.receiver_id != user.id:
         raise HTTPException(status_code=404, detail="Request not found")
 
@@ -142,17 +261,19 @@ def decline_request(
     req.status = "declined"
     req.responded_at = datetime.utcnow()
     session.add(req)
-    session.commit()
+    await _log(session, "friend_request", req)
+    await session.commit()
+    realtime.publish([req.requester_id], "friend_request.declined", id=req.id)
     return {"message": "Friend request declined"}
 
 
 @router.post("/requests/{request_id}/cancel")
-def cancel_request(
+async def cancel_request(
     request_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
-    req = session.get(FriendRequest, request_id)
+    req = await session.get(FriendRequest, request_id)
     if not req or req.requester_id != user.id:
         raise HTTPException(status_code=404, detail="Request not found")
 
@@ -162,17 +283,19 @@ def cancel_request(
     req.status = "canceled"
     req.responded_at = datetime.utcnow()
     session.add(req)
-    session.commit()
+    await _log(session, "friend_request", req)
+    await session.commit()
+    realtime.publish([req.receiver_id], "friend_request.canceled", id=req.id)
     return {"message": "Friend request canceled"}
 
 
-@router.get("", response_model=List[int])
-def list_friends(session: Session = Depends(get_session), user: User = Depends(current_user)):
-    friendships = session.exec(
+@router.get("", response_model=List[int], dependencies=[Depends(etag_guard("friends"))])
+async def list_friends(session: DBSession = Depends(get_session), user: UserSnapshot = Depends(current_user)):
+    friendships = (await session.exec(
         select(Friendship).where(
             (Friendship.user_low_id == user.id) | (Friendship.user_high_id == user.id)
         )
-    ).all()
+    )).all()
 
     return [
         f.user_high_id if f.user_low_id == user.id else f.user_low_id
@@ -180,23 +303,118 @@ def list_friends(session: Session = Depends(get_session), user: User = Depends(c
     ]
 
 
+@router.get("/detail")
+async def friends_detail(
+    on: Optional[date] = Query(default=None, description="Day to report on (defaults to server today)"),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Every friend's public profile with their number of active habits, completions
+    on the day and best live streak. Three queries regardless of friend count.
+    """
+    day = on or date.today()
+    mine = (Friendship.user_low_id == user.id) | (Friendship.user_high_id == user.id)
+    friend_id = case((Friendship.user_low_id == user.id, Friendship.user_high_id), else_=Friendship.user_low_id)
+
+    friends = (await session.exec(
+        select(User.id, User.name, User.created_at, Friendship.created_at.label("friends_since"))
+        .join(Friendship, User.id == friend_id)
+        .where(mine)
+        .order_by(User.name, User.id)
+    )).all()
+    ids = [f.id for f in friends]
+    if not ids:
+        return []
+
+    habits = (await session.exec(
+        select(
+            Habit.user_id, Habit.current_streak, Habit.last_completed_date,
+            Habit.frequency_type, Habit.frequency_pattern,
+        ).where(Habit.user_id.in_(ids), Habit.status == "active")
+    )).all()
+    active = dict.fromkeys(ids, 0)
+    best = dict.fromkeys(ids, 0)
+    for habit in habits:
+        active[habit.user_id] += 1
+        best[habit.user_id] = max(best[habit.user_id], streaks.streak_as_of(habit, day))
+
+    # One grouped range read on ix_completions_user_day.
+    done = dict((await session.exec(
+        select(Completion.user_id, func.count())
+        .where(Completion.user_id.in_(ids), Completion.completed_date == day)
+        .group_by(Completion.user_id)
+    )).all())
+
+    return [
+        {
+            "id": f.id,
+            "name": f.name,
+            "member_since": f.created_at,
+            "friends_since": f.friends_since,
+            "active_habits": active[f.id],
+            "completed_today": done.get(f.id, 0),
+            "best_streak": best[f.id],
+        }
+        for f in friends
+    ]
+
+
+@router.get("/suggestions")
+async def suggestions(
+    limit: int = Query(default=settings.SUGGESTIONS_PAGE_SIZE, ge=1, le=settings.SUGGESTIONS_MAX_PAGE_SIZE),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    People the user may know: friends of friends ranked by mutual friend count,
+    leaving out anyone with a pending request either way. Ranked from the in-memory
+    friend graph (services/friend_graph.py), so no self-join of friendships runs.
+    """
+    pending = (await session.exec(
+        select(FriendRequest.requester_id, FriendRequest.receiver_id).where(
+            (FriendRequest.requester_id == user.id) | (FriendRequest.receiver_id == user.id),
+            FriendRequest.status == "pending",
+        )
+    )).all()
+    exclude = {uid for pair in pending for uid in pair}
+    ranked = await session.run_sync(friend_graph.suggest, user.id, limit, exclude)
+    if not ranked:
+        return []
+
+    names = dict((await session.exec(
+        select(User.id, User.name).where(User.id.in_([uid for uid, _ in ranked]))
+    )).all())
+    return [
+        {"id": uid, "name": names[uid], "mutual_friends": mutual}
+        for uid, mutual in ranked
+        if uid in names
+    ]
+
+
 @router.delete("/{friend_id}", status_code=status.HTTP_200_OK)
-def unfriend(
+async def unfriend(
     friend_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     if friend_id == user.id:
         raise HTTPException(status_code=400, detail="Invalid friend id")
 
     low, high = _friendship_pair(user.id, friend_id)
-    friendship = session.exec(
+    friendship = (await session.exec(
         select(Friendship).where(Friendship.user_low_id == low, Friendship.user_high_id == high)
-    ).first()
+    )).first()
 
     if not friendship:
         raise HTTPException(status_code=404, detail="Not friends")
 
-    session.delete(friendship)
-    session.commit()
+    await _log(session, "friendship", friendship, changes.DELETE)
+    await session.run_sync(feed.unlink, user.id, friend_id)
+    await session.run_sync(leaderboard.touch, low, high)
+    await session.delete(friendship)
+    await session.commit()
+    friend_graph.graph.remove(low, high)
+    realtime.publish([user.id], "friend.removed", friend_id=friend_id)
+    realtime.publish([friend_id], "friend.removed", friend_id=user.id)
     return {"message": "Unfriended"}
\ No newline at end of file
@@ -1,84 +1,118 @@
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from typing import List
-from ..database import get_session
-from ..deps import current_user
-from ..models import Habit, HabitCreate, HabitUpdate, User
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlmodel import select
+from typing import List, Optional
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user, etag_guard, sparse_fields
+from ..models import Habit, HabitCreate, HabitRead, HabitUpdate
+from ..responses import json_response, read_columns
+from ..services import changes, completion_writes, leaderboard, streaks
 
 router = APIRouter(prefix="/api/habits", tags=["habits"])
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def create_habit(
+# Columns Habit.streak is computed from, selected whenever `streak` is asked for.
+STREAK_COLUMNS = ("current_streak", "last_completed_date", "frequency_type", "frequency_pattern")
+
+@router.post("/", response_model=HabitRead, status_code=status.HTTP_201_CREATED)
+async def create_habit(
     habit: HabitCreate,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     """Create a new habit"""
     db_habit = Habit(**habit.model_dump(), user_id=user.id, started_at=date.today())
     session.add(db_habit)
-    session.commit()
-    session.refresh(db_habit)
+    await session.flush()
+    await session.run_sync(changes.record_change, [user.id], "habit", db_habit.id)
+    await session.commit()
+    await session.refresh(db_habit)
     return db_habit
 
-@router.get("/")
-def list_habits(
+@router.get("/", response_model=List[HabitRead], dependencies=[Depends(etag_guard("habits", daily=True))])
+async def list_habits(
+    response: Response,
     status_filter: str = "active",
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    fields: Optional[List[str]] = Depends(sparse_fields(HabitRead)),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
-    """List all user's habits"""
-    query = select(Habit).where(
+    """
+    List all user's habits.
+    `fields=id,name,status` returns only those fields, and only those columns are read.
+    """
+    names = fields or list(HabitRead.model_fields)
+    columns = read_columns(Habit, HabitRead, names)
+    if "streak" in names:
+        columns += [Habit.__table__.c[name] for name in STREAK_COLUMNS if name not in names]
+    query = select(*columns).where(
         Habit.user_id == user.id,
         Habit.status == status_filter
     )
-    habits = session.exec(query).all()
-    return habits
+    rows = (await session.exec(query)).all()
+
+    today = date.today()
+    items = []
+    for row in rows:
+        item = row._asdict()
+        if "streak" in names:
+            item["streak"] = streaks.streak_as_of(row, today)
+        items.append({name: item[name] for name in names})
+    return json_response(items, response)
 
-@router.get("/{habit_id}")
-def get_habit(
+@router.get("/{habit_id}", response_model=HabitRead, dependencies=[Depends(etag_guard("habits", daily=True))])
+async def get_habit(
     habit_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     """Get a specific habit by ID"""
-    habit = session.get(Habit, habit_id)
+    habit = await session.get(Habit, habit_id)
     if not habit or habit.user_id != user.id:
         raise HTTPException(status_code=404, detail="Habit not found")
     return habit
 
-@router.put("/{habit_id}")
-def update_habit(
+@router.put("/{habit_id}", response_model=HabitRead)
+async def update_habit(
     habit_id: int,
     habit_update: HabitUpdate,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     """Update a habit"""
-    habit = session.get(Habit, habit_id)
+    habit = await session.get(Habit, habit_id)
     if not habit or habit.user_id != user.id:
         raise HTTPException(status_code=404, detail="Habit not found")
     
     update_data = habit_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(habit, key, value)
+
+    # A new schedule changes which gaps break a run.
+    if "frequency_type" in update_data or "frequency_pattern" in update_data:
+        await session.run_sync(streaks.recompute_streaks, habit)
+    # Schedule and status changes move the owner's best streak on friends' leaderboards.
+    await session.run_sync(leaderboard.touch, user.id)
     
     session.add(habit)
-    session.commit()
-    session.refresh(habit)
+    await session.run_sync(changes.record_change, [user.id], "habit", habit_id)
+    await session.commit()
+    await session.refresh(habit)
     return habit
 
 @router.delete("/{habit_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_habit(
+async def delete_habit(
     habit_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(current_user),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
 ):
     """Delete a habit"""
-    habit = session.get(Habit, habit_id)
+    habit = await session.get(Habit, habit_id)
     if not habit or habit.user_id != user.id:
         raise HTTPException(status_code=404, detail="Habit not found")
     
-    session.delete(habit)
-    session.commit()
+    # completions.habit_id is NOT NULL, so the history goes with the habit.
+    await session.run_sync(completion_writes.delete_for_habit, habit_id)
+    await session.run_sync(changes.record_change, [user.id], "habit", habit_id, changes.DELETE)
+    await session.delete(habit)
+    await session.commit()
     return None
@@ -0,0 +1,41 @@
+import io
+import tempfile
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..services.importer import import_stream
+
+router = APIRouter(prefix="/api/import", tags=["import"])
+
+@router.post("")
+async def import_history(
+    request: Request,
+    fmt: Optional[Literal["ndjson", "csv"]] = Query(default=None, alias="format"),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Bulk-import habits and completion history from a CSV or NDJSON request body
+    (format from `?format=` or the Content-Type). The body is spooled to disk as
+    it arrives, then parsed and written in chunks; returns counts, per-line
+    errors and throughput.
+    """
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Import file too large")
+            spool.write(chunk)
+        spool.seek(0)
+
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", errors="replace", newline="")
+        return await session.run_sync(import_stream, user.id, text, fmt)
+    finally:
+        spool.close()
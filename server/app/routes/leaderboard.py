@@ -0,0 +1,26 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..services import leaderboard
+from ..services.rollups import period_start
+
+router = APIRouter(prefix="/api/leaderboard", tags=["leaderboard"])
+
+@router.get("")
+async def friends_leaderboard(
+    week: Optional[date] = Query(default=None, description="Any day in the week to rank (defaults to this week)"),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    You and your friends ranked by completions in the week (Monday start), then by
+    best live streak. Served from cache when nobody on the board has written since.
+    """
+    today = date.today()
+    week_start = period_start("week", week or today)
+    hit = leaderboard.cached(user.id, week_start, today)
+    if hit is not None:
+        return hit
+    return await session.run_sync(leaderboard.build, user.id, week_start, today)
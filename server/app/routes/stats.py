@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user, etag_guard
+from ..services import rollups
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+# Range shown when `from` is omitted: 30 days, 12 weeks or 12 months back from `to`.
+DEFAULT_SPAN = {"day": timedelta(days=29), "week": timedelta(weeks=11), "month": timedelta(days=334)}
+MAX_PERIODS = 400
+
+@router.get("", dependencies=[Depends(etag_guard("habits", daily=True))])
+async def get_stats(
+    period: Literal["day", "week", "month"] = "week",
+    date_from: Optional[date] = Query(default=None, alias="from"),
+    date_to: Optional[date] = Query(default=None, alias="to"),
+    habit_id: Optional[int] = None,
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Completion rates, quantity totals, best streak and per-category trends for
+    ProgressShellView / ProfileView. Reads only the precomputed rollups (plus the
+    habits themselves), never the raw completions.
+    """
+    last = date_to or date.today()
+    first = date_from or rollups.period_start(period, last - DEFAULT_SPAN[period])
+    if first > last:
+        raise HTTPException(status_code=400, detail="`from` must not be after `to`")
+    span = {"day": 1, "week": 7, "month": 28}[period]
+    if (last - first).days // span > MAX_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Range too long (max {MAX_PERIODS} {period}s)")
+
+    return await session.run_sync(rollups.stats, user.id, period, first, last, habit_id)
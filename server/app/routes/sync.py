@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..services import changes
+from ..services.pagination import decode_cursor, encode_cursor
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+@router.get("")
+async def sync(
+    since: Optional[str] = Query(default=None, description="`cursor` from the previous sync; omit for a full snapshot"),
+    limit: int = Query(default=settings.SYNC_PAGE_SIZE, ge=1, le=settings.SYNC_MAX_PAGE_SIZE),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    Delta sync for habits, completions, friend requests and friendships.
+    Without `since` this is a full snapshot; with it, only rows created or updated
+    after the cursor, plus ids under `deleted` for rows that are gone. Keep calling
+    with the returned `cursor` while `has_more` is true.
+    """
+    after = decode_cursor(since, (int,))
+    payload = await session.run_sync(changes.sync, user.id, after[0] if after else None, limit)
+    payload["cursor"] = encode_cursor((payload.pop("version"),))
+    return payload
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Query
+from ..config import settings
+from ..database import DBSession, get_session
+from ..deps import UserSnapshot, current_user
+from ..services import user_search
+
+router = APIRouter(prefix="/api/users", tags=["users"])
+
+@router.get("/search")
+async def search_users(
+    q: str = Query(min_length=1, max_length=100, description="Name or email prefix, case-insensitive"),
+    limit: int = Query(default=settings.USER_SEARCH_PAGE_SIZE, ge=1, le=settings.USER_SEARCH_MAX_PAGE_SIZE),
+    session: DBSession = Depends(get_session),
+    user: UserSnapshot = Depends(current_user),
+):
+    """
+    People to send a friend request to: users whose name or email starts with `q`,
+    excluding the caller and their friends. Returns id and name only.
+    """
+    return await session.run_sync(user_search.search, user.id, q, limit)
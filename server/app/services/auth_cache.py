@@ -0,0 +1,173 @@
+# server/app/services/auth_cache.py
+"""
+In-process cache for the authenticated request path.
+
+Every protected route goes through `deps.current_user`, which used to run
+`jwt.decode` and then `session.get(User, ...)` on every request. This module keeps
+two bounded LRU/TTL maps so the hot path usually skips both:
+
+- token   -> verified user id (never outlives the token's own `exp`)
+- user id -> UserSnapshot (slim, immutable, no password hash)
+
+Anything that changes a user row must call `auth_cache.invalidate_user(user_id)`.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from ..config import settings
+from .metrics import registry
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Read-only view of the authenticated user, safe to share across requests."""
+    id: int
+    email: str
+    name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user: Any) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, name=user.name, created_at=user.created_at)
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache with per-entry expiry.
+    Callers can be on the event loop or a threadpool worker, so every operation takes the lock.
+    `on_remove(key, value)` is called, outside the lock, for entries that are evicted,
+    found expired or popped (not for `clear`).
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, on_remove: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.on_remove = on_remove
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self.misses += 1
+        self._removed([(key, value)])
+        return None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        evicted: List[Tuple[Hashable, Any]] = []
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+                self.evictions += 1
+        self._removed(evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > now
+
+    def update(self, key: Hashable, fn: Callable[[Any], Any]) -> bool:
+        """Replace a live entry's value with fn(value), keeping its expiry and LRU position."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                return False
+            self._data[key] = (entry[0], fn(entry[1]))
+            return True
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is not None:
+            self._removed([(key, entry[1])])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _removed(self, entries: List[Tuple[Hashable, Any]]) -> None:
+        if self.on_remove is not None:
+            for key, value in entries:
+                self.on_remove(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class AuthCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.tokens = TTLCache(max_entries, ttl_seconds)
+        self.users = TTLCache(max_entries, ttl_seconds)
+
+    def get_token(self, token: str) -> Optional[int]:
+        return self.tokens.get(token)
+
+    def remember_token(self, token: str, user_id: int, exp: Optional[int] = None) -> None:
+        # Cap the entry at the token's own expiry so an expired JWT is never accepted from cache.
+        ttl = None
+        if exp is not None:
+            ttl = float(exp) - time.time()
+        self.tokens.set(token, user_id, ttl)
+
+    def get_user(self, user_id: int) -> Optional[UserSnapshot]:
+        return self.users.get(user_id)
+
+    def remember_user(self, snapshot: UserSnapshot) -> None:
+        self.users.set(snapshot.id, snapshot)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self.users.pop(user_id)
+
+    def clear(self) -> None:
+        self.tokens.clear()
+        self.users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tokens": self.tokens.stats(), "users": self.users.stats()}
+
+
+auth_cache = AuthCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
+_lookups = registry.counter("auth_cache_lookups_total", "current_user cache lookups", ["cache", "result"])
+_size = registry.gauge("auth_cache_entries", "Entries currently held by the current_user caches", ["cache"])
+for _name, _cache in (("tokens", auth_cache.tokens), ("users", auth_cache.users)):
+    _lookups.labels(_name, "hit").set_function(lambda c=_cache: c.hits)
+    _lookups.labels(_name, "miss").set_function(lambda c=_cache: c.misses)
+    _size.labels(_name).set_function(lambda c=_cache: len(c._data))
@@ -0,0 +1,224 @@
+# server/app/services/bitsets.py
+"""
+Per-habit, per-year completion bitsets.
+
+`completions` keeps one row per habit per day, so a month calendar or a streak walk
+used to read dozens to hundreds of rows. CompletionBitset packs a whole year into
+46 bytes (bit N = day-of-year N+1), so:
+
+- month/year calendars are one row read + bit tests
+- "done on day X?" is one row read + one bit test
+- streak recomputes walk a few integers instead of the full history
+
+The completions table stays canonical. Every write path that inserts a completion
+must call mark_completed (or go through completion_writes) in the same transaction;
+rebuild/check keep the two honest (`python -m app.cli rebuild-bitsets` / `check-bitsets`).
+"""
+from __future__ import annotations
+
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from ..database import dialect_insert
+from ..models import Completion, CompletionBitset
+
+BITSET_BYTES = 46  # 368 bits >= 366 days
+
+
+def day_index(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+
+def empty_bits() -> bytearray:
+    return bytearray(BITSET_BYTES)
+
+
+def set_bit(bits: bytearray, day: date) -> None:
+    i = day_index(day)
+    bits[i >> 3] |= 1 << (i & 7)
+
+
+def has_bit(bits: bytes, day: date) -> bool:
+    i = day_index(day)
+    return bool(bits[i >> 3] & (1 << (i & 7)))
+
+
+def iter_days(year: int, bits: bytes) -> Iterator[date]:
+    """Completed dates in ascending order, skipping zero bytes wholesale."""
+    jan1 = date(year, 1, 1)
+    for byte_i, byte in enumerate(bits):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (1 << bit):
+                yield jan1 + timedelta(days=(byte_i << 3) + bit)
+
+
+def month_mask(year: int, month: int) -> Tuple[int, int]:
+    """(first day index, mask) selecting `month` out of the year as one int."""
+    first = day_index(date(year, month, 1))
+    length = calendar.monthrange(year, month)[1]
+    return first, ((1 << length) - 1) << first
+
+
+def _get_row(session: Session, habit_id: int, year: int) -> Optional[CompletionBitset]:
+    return session.exec(
+        select(CompletionBitset).where(CompletionBitset.habit_id == habit_id, CompletionBitset.year == year)
+    ).first()
+
+
+# ----------------------------
+# Write path
+# ----------------------------
+def mark_completed(session: Session, habit_id: int, user_id: int, days: Iterable[date]) -> None:
+    """Set the bits for `days` (any years) on the habit; flushes with the caller's transaction."""
+    mark_completed_many(session, user_id, {habit_id: days})
+
+
+def mark_completed_many(session: Session, user_id: int, days_by_habit: Dict[int, Iterable[date]]) -> None:
+    """
+    Batch form of mark_completed. Missing rows are created empty with ON CONFLICT DO
+    NOTHING, then every affected row is read FOR UPDATE with one IN query, so two
+    transactions marking the same habit-year serialize instead of losing bits.
+    """
+    wanted: Dict[Tuple[int, int], List[date]] = defaultdict(list)
+    for habit_id, days in days_by_habit.items():
+        for day in days:
+            wanted[(habit_id, day.year)].append(day)
+    if not wanted:
+        return
+
+    keys = sorted(wanted)  # one lock order for every writer
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        session.execute(
+            upsert(CompletionBitset.__table__).on_conflict_do_nothing(index_elements=["habit_id", "year"]),
+            [{"habit_id": habit_id, "user_id": user_id, "year": year, "bits": bytes(empty_bits())}
+             for habit_id, year in keys],
+        )
+
+    habit_ids = {habit_id for habit_id, _ in keys}
+    years = {year for _, year in keys}
+    rows = {
+        (row.habit_id, row.year): row
+        for row in session.exec(
+            select(CompletionBitset)
+            .where(CompletionBitset.habit_id.in_(habit_ids), CompletionBitset.year.in_(years))
+            .order_by(CompletionBitset.habit_id, CompletionBitset.year)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+    }
+    for key in keys:
+        habit_id, year = key
+        row = rows.get(key)
+        bits = bytearray(row.bits) if row else empty_bits()
+        for day in wanted[key]:
+            set_bit(bits, day)
+        if row is None:
+            row = CompletionBitset(habit_id=habit_id, user_id=user_id, year=year, bits=bytes(bits))
+        else:
+            row.bits = bytes(bits)
+        session.add(row)
+
+
+def delete_for_habit(session: Session, habit_id: int) -> None:
+    session.execute(delete(CompletionBitset).where(CompletionBitset.habit_id == habit_id))
+
+
+# ----------------------------
+# Read path
+# ----------------------------
+def completed_on(session: Session, habit_id: int, day: date) -> bool:
+    row = _get_row(session, habit_id, day.year)
+    return bool(row) and has_bit(row.bits, day)
+
+
+def month_days(session: Session, habit_id: int, year: int, month: int) -> List[date]:
+    row = _get_row(session, habit_id, year)
+    if row is None:
+        return []
+    first, mask = month_mask(year, month)
+    selected = (int.from_bytes(row.bits, "little") & mask) >> first
+    start = date(year, month, 1)
+    days = []
+    offset = 0
+    while selected:
+        if selected & 1:
+            days.append(start + timedelta(days=offset))
+        selected >>= 1
+        offset += 1
+    return days
+
+
+def year_days(session: Session, habit_id: int, year: int) -> List[date]:
+    row = _get_row(session, habit_id, year)
+    return list(iter_days(year, row.bits)) if row else []
+
+
+def all_days(session: Session, habit_id: int) -> List[date]:
+    """Every completed date for the habit, ascending, from one small row per year."""
+    rows = session.exec(
+        select(CompletionBitset.year, CompletionBitset.bits)
+        .where(CompletionBitset.habit_id == habit_id)
+        .order_by(CompletionBitset.year)
+    ).all()
+    return [day for year, bits in rows for day in iter_days(year, bits)]
+
+
+# ----------------------------
+# Rebuild / consistency check against the canonical completions table
+# ----------------------------
+def _expected_bitsets(session: Session, user_id: Optional[int]) -> Dict[Tuple[int, int], Tuple[int, bytearray]]:
+    query = select(Completion.habit_id, Completion.user_id, Completion.completed_date)
+    if user_id is not None:
+        query = query.where(Completion.user_id == user_id)
+    expected: Dict[Tuple[int, int], Tuple[int, bytearray]] = {}
+    for habit_id, owner_id, day in session.exec(query):
+        key = (habit_id, day.year)
+        if key not in expected:
+            expected[key] = (owner_id, empty_bits())
+        set_bit(expected[key][1], day)
+    return expected
+
+
+def rebuild(session: Session, user_id: Optional[int] = None) -> int:
+    """Drop and regenerate bitsets from completions. Returns rows written."""
+    stmt = delete(CompletionBitset)
+    if user_id is not None:
+        stmt = stmt.where(CompletionBitset.user_id == user_id)
+    session.execute(stmt)
+    expected = _expected_bitsets(session, user_id)
+    session.add_all(
+        CompletionBitset(habit_id=habit_id, user_id=owner_id, year=year, bits=bytes(bits))
+        for (habit_id, year), (owner_id, bits) in expected.items()
+    )
+    return len(expected)
+
+
+def check(session: Session, user_id: Optional[int] = None) -> List[dict]:
+    """Compare stored bitsets with completions; returns one entry per inconsistent habit-year."""
+    expected = _expected_bitsets(session, user_id)
+    query = select(CompletionBitset)
+    if user_id is not None:
+        query = query.where(CompletionBitset.user_id == user_id)
+    stored = {(row.habit_id, row.year): row.bits for row in session.exec(query)}
+
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        habit_id, year = key
+        want = set(iter_days(year, bytes(expected[key][1]))) if key in expected else set()
+        have = set(iter_days(year, stored[key])) if key in stored else set()
+        if want != have:
+            problems.append({
+                "habit_id": habit_id,
+                "year": year,
+                "missing": sorted(d.isoformat() for d in want - have),
+                "extra": sorted(d.isoformat() for d in have - want),
+            })
+    return problems
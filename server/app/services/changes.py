@@ -0,0 +1,213 @@
+# server/app/services/changes.py
+"""
+Per-user change log and delta sync.
+
+Every write in the habits, completions and friends routers records which rows it
+touched via `record`, in the same transaction. Each user has a monotonic version
+(SyncCounter, bumped under a row lock so versions follow commit order) and the
+log keeps only the latest entry per entity. `GET /api/sync?since=<cursor>` then
+returns just the rows changed after the cursor, plus tombstones for deletes,
+instead of the whole account.
+
+Deleting a habit logs a tombstone for the habit only; clients drop its
+completions along with it.
+
+The same writes bump a coarser per-resource version (ResourceVersion), which
+`deps.etag_guard` turns into ETags so unchanged polls get a 304.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, tuple_
+from sqlmodel import Session, select
+
+from ..database import dialect_insert
+from ..models import ChangeLog, Completion, FriendRequest, Friendship, Habit, ResourceVersion, SyncCounter
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# entity name -> (model, response key)
+ENTITIES: Dict[str, Tuple[Any, str]] = {
+    "habit": (Habit, "habits"),
+    "completion": (Completion, "completions"),
+    "friend_request": (FriendRequest, "friend_requests"),
+    "friendship": (Friendship, "friendships"),
+}
+
+# entity -> cached resource (ETag scope) it belongs to; completions change habit streaks
+RESOURCES: Dict[str, str] = {
+    "habit": "habits",
+    "completion": "habits",
+    "friend_request": "friend_requests",
+    "friendship": "friends",
+}
+
+# (user_id, entity, entity_id, op)
+Change = Tuple[int, str, int, str]
+
+
+# ----------------------------
+# Write path
+# ----------------------------
+def _bump_version(session: Session, user_id: int, n: int) -> int:
+    """Reserve `n` versions for the user; returns the highest one."""
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        stmt = (
+            upsert(SyncCounter)
+            .values(user_id=user_id, version=n)
+            .on_conflict_do_update(index_elements=["user_id"], set_={"version": SyncCounter.version + n})
+            .returning(SyncCounter.version)
+        )
+        return session.execute(stmt).scalar_one()
+
+    counter = session.exec(select(SyncCounter).where(SyncCounter.user_id == user_id).with_for_update()).first()
+    if counter is None:
+        counter = SyncCounter(user_id=user_id, version=0)
+    counter.version += n
+    session.add(counter)
+    session.flush()
+    return counter.version
+
+
+def _bump_resources(session: Session, user_id: int, resources: Iterable[str]) -> None:
+    resources = sorted(set(resources))
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        stmt = upsert(ResourceVersion).values(
+            [{"user_id": user_id, "resource": resource, "version": 1} for resource in resources]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "resource"], set_={"version": ResourceVersion.version + 1}
+        )
+        session.execute(stmt)
+        return
+
+    for resource in resources:
+        row = session.exec(
+            select(ResourceVersion)
+            .where(ResourceVersion.user_id == user_id, ResourceVersion.resource == resource)
+            .with_for_update()
+        ).first()
+        if row is None:
+            row = ResourceVersion(user_id=user_id, resource=resource, version=0)
+        row.version += 1
+        session.add(row)
+
+
+def record(session: Session, changes: Iterable[Change], created: Iterable[str] = ()) -> None:
+    """
+    Log changes in the caller's transaction (sync Session; use run_sync). Rows must have ids.
+    `created` names entity types whose rows were all just inserted, so they have no
+    older entries to compact away (saves a big DELETE on bulk writes).
+    """
+    created = frozenset(created)
+    now = datetime.utcnow()
+    by_user: Dict[int, Dict[Tuple[str, int], str]] = defaultdict(dict)
+    for user_id, entity, entity_id, op in changes:
+        by_user[user_id][(entity, entity_id)] = op  # last op per entity wins
+
+    # Fixed lock order across users, so two friends writing at once cannot deadlock.
+    for user_id in sorted(by_user):
+        entries = by_user[user_id]
+        stale = [key for key in entries if key[0] not in created]
+        if stale:
+            session.execute(
+                delete(ChangeLog).where(
+                    ChangeLog.user_id == user_id,
+                    tuple_(ChangeLog.entity, ChangeLog.entity_id).in_(stale),
+                )
+            )
+        top = _bump_version(session, user_id, len(entries))
+        first = top - len(entries) + 1
+        # Core executemany on the Table: one statement however many rows, and no ORM
+        # bulk-insert bookkeeping per row.
+        session.execute(
+            insert(ChangeLog.__table__),
+            [
+                {"user_id": user_id, "version": first + i, "entity": entity, "entity_id": entity_id,
+                 "op": op, "changed_at": now}
+                for i, ((entity, entity_id), op) in enumerate(entries.items())
+            ],
+        )
+        _bump_resources(session, user_id, (RESOURCES[entity] for entity, _ in entries))
+
+
+def record_change(session: Session, user_ids: Iterable[int], entity: str, entity_id: int, op: str = UPSERT) -> None:
+    """Single-entity shorthand for `record`, logged for each of `user_ids`."""
+    record(session, [(user_id, entity, entity_id, op) for user_id in user_ids])
+
+
+# ----------------------------
+# Read path
+# ----------------------------
+def resource_version(session: Session, user_id: int, resource: str) -> int:
+    version = session.exec(
+        select(ResourceVersion.version).where(ResourceVersion.user_id == user_id, ResourceVersion.resource == resource)
+    ).first()
+    return version or 0
+
+
+def current_version(session: Session, user_id: int) -> int:
+    version = session.exec(select(SyncCounter.version).where(SyncCounter.user_id == user_id)).first()
+    return version or 0
+
+
+def _empty_payload() -> Dict[str, Any]:
+    payload: Dict[str, Any] = {key: [] for _, key in ENTITIES.values()}
+    payload["deleted"] = {key: [] for _, key in ENTITIES.values()}
+    return payload
+
+
+def snapshot(session: Session, user_id: int) -> Dict[str, Any]:
+    """Full state for a first sync, with the version it is current as of."""
+    # Read the version first: anything written meanwhile shows up again in the next delta.
+    version = current_version(session, user_id)
+    payload = _empty_payload()
+    payload["habits"] = session.exec(select(Habit).where(Habit.user_id == user_id)).all()
+    payload["completions"] = session.exec(select(Completion).where(Completion.user_id == user_id)).all()
+    payload["friend_requests"] = session.exec(
+        select(FriendRequest).where((FriendRequest.requester_id == user_id) | (FriendRequest.receiver_id == user_id))
+    ).all()
+    payload["friendships"] = session.exec(
+        select(Friendship).where((Friendship.user_low_id == user_id) | (Friendship.user_high_id == user_id))
+    ).all()
+    payload.update(version=version, has_more=False, full=True)
+    return payload
+
+
+def changes_since(session: Session, user_id: int, since: int, limit: int) -> Dict[str, Any]:
+    """Rows changed after version `since` (at most `limit` log entries), one IN query per entity type."""
+    entries = session.exec(
+        select(ChangeLog.version, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+        .where(ChangeLog.user_id == user_id, ChangeLog.version > since)
+        .order_by(ChangeLog.version)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    payload = _empty_payload()
+    upserts: Dict[str, List[int]] = defaultdict(list)
+    for _, entity, entity_id, op in entries:
+        if entity not in ENTITIES:
+            continue
+        if op == DELETE:
+            payload["deleted"][ENTITIES[entity][1]].append(entity_id)
+        else:
+            upserts[entity].append(entity_id)
+
+    for entity, ids in upserts.items():
+        model, key = ENTITIES[entity]
+        payload[key] = session.exec(select(model).where(model.id.in_(ids)).order_by(model.id)).all()
+
+    payload.update(version=entries[-1][0] if entries else since, has_more=has_more, full=False)
+    return payload
+
+
+def sync(session: Session, user_id: int, since: Optional[int], limit: int) -> Dict[str, Any]:
+    return snapshot(session, user_id) if since is None else changes_since(session, user_id, since, limit)
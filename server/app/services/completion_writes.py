@@ -0,0 +1,123 @@
+# server/app/services/completion_writes.py
+"""
+Shared write path for new completions.
+
+Every route that inserts Completion rows (single complete, batch sync, ...) goes
+through here so the derived data (bitsets, stored streaks, rollups, change log)
+(and weekly leaderboard scores) is updated in the same transaction, whatever
+the entry point. Friend feed activity is recorded here too, one "completed"
+activity per habit per call however many days it covers; callers notify
+feed_worker after committing.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from ..database import dialect_insert
+from ..models import Completion, Habit
+from . import bitsets, changes, feed, leaderboard, rollups, streaks
+
+# (completion id, habit_id, completed_date, quantity_value)
+Inserted = Tuple[int, int, date, Optional[float]]
+
+
+def record_inserted(
+    session: Session,
+    user_id: int,
+    habits: Dict[int, Habit],
+    inserted: Iterable[Inserted],
+    feed_activity: bool = True,
+) -> None:
+    """
+    Maintain bitsets, streaks, rollups, weekly scores, the change log and (unless
+    `feed_activity` is off) friend feed activity for completions just flushed to `session`.
+    """
+    inserted = list(inserted)
+    days_by_habit: Dict[int, List[date]] = defaultdict(list)
+    for _, habit_id, day, _ in inserted:
+        days_by_habit[habit_id].append(day)
+    days_by_habit = {habit_id: sorted(days) for habit_id, days in days_by_habit.items()}
+    bitsets.mark_completed_many(session, user_id, days_by_habit)
+    for habit_id, days in days_by_habit.items():
+        habit = habits[habit_id]
+        # Forward-only dates stay O(1); the first back-filled date switches to a recompute.
+        if not streaks.apply_completions(habit, days):
+            streaks.recompute_streaks(session, habit)
+        session.add(habit)
+        if feed_activity:
+            feed.record(session, user_id, feed.COMPLETED, habit_id=habit_id, habit_name=habit.name)
+
+    rollups.add_completions(session, user_id, [(habit_id, day, quantity) for _, habit_id, day, quantity in inserted])
+    leaderboard.add_completions(
+        session, user_id, [day for _, _, day, _ in inserted], [habits[habit_id] for habit_id in days_by_habit]
+    )
+
+    # The habits' streak fields changed too, so they are logged alongside the completions.
+    changes.record(
+        session,
+        [(user_id, "completion", completion_id, changes.UPSERT) for completion_id, _, _, _ in inserted]
+        + [(user_id, "habit", habit_id, changes.UPSERT) for habit_id in days_by_habit],
+        created={"completion"},
+    )
+
+
+def insert_ignoring_duplicates(session: Session, rows: List[Dict[str, Any]]) -> List[Inserted]:
+    """
+    Insert completion rows, skipping any (habit_id, completed_date) that already exists
+    (uq_completion_habit_day). Returns Inserted tuples for the rows actually inserted.
+    On SQLite/Postgres this is one executemany of INSERT ... ON CONFLICT DO NOTHING
+    RETURNING, which SQLAlchemy batches into multi-row statements under the
+    driver's parameter limit.
+    """
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("completed_at", now)  # Core inserts skip SQLModel default factories
+
+    insert = dialect_insert(session)
+    if insert is not None:
+        table = Completion.__table__  # Core, not the ORM bulk path: much less per-row overhead
+        stmt = (
+            insert(table)
+            .on_conflict_do_nothing(index_elements=["habit_id", "completed_date"])
+            .returning(table.c.id, table.c.habit_id, table.c.completed_date, table.c.quantity_value)
+        )
+        return [tuple(r) for r in session.execute(stmt, rows).all()]
+
+    # Other dialects: filter against existing rows, then a plain ORM insert.
+    habit_ids = {row["habit_id"] for row in rows}
+    existing = set(
+        session.exec(
+            select(Completion.habit_id, Completion.completed_date).where(Completion.habit_id.in_(habit_ids))
+        ).all()
+    )
+    fresh = [Completion(**row) for row in rows if (row["habit_id"], row["completed_date"]) not in existing]
+    session.add_all(fresh)
+    session.flush()
+    return [(c.id, c.habit_id, c.completed_date, c.quantity_value) for c in fresh]
+
+
+def insert_batch(
+    session: Session,
+    user_id: int,
+    habits: Dict[int, Habit],
+    rows: List[Dict[str, Any]],
+) -> Dict[Tuple[int, date], int]:
+    """Insert + derived-data maintenance in one go. Returns {(habit_id, date): new id}."""
+    inserted = insert_ignoring_duplicates(session, rows)
+    record_inserted(session, user_id, habits, inserted)
+    return {(habit_id, day): completion_id for completion_id, habit_id, day, _ in inserted}
+
+
+def delete_for_habit(session: Session, habit_id: int) -> None:
+    """Remove a habit's completions, bitsets and rollups (and its weekly scores) ahead of deleting the habit itself."""
+    bitsets.delete_for_habit(session, habit_id)
+    leaderboard.remove_habit(session, habit_id)  # reads the rollups, so before they go
+    rollups.delete_for_habit(session, habit_id)
+    session.execute(delete(Completion).where(Completion.habit_id == habit_id))
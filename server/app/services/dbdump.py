@@ -0,0 +1,108 @@
+# server/app/services/dbdump.py
+"""
+Bounded-memory database dumps for the debug endpoints.
+
+- summary: COUNT(*) per table (plus on-disk size where the backend reports it)
+- page: one keyset page of a table, ordered by primary key
+- stream_dump: every table as one JSON document, written in yield_per batches
+
+Rows are read as plain column tuples, never as model instances.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import Table, func, text, tuple_
+from sqlmodel import Session, SQLModel, select
+
+from ..config import settings
+from ..database import engine
+from .export import json_default
+
+
+def tables() -> Dict[str, Table]:
+    return {table.name: table for table in SQLModel.metadata.sorted_tables}
+
+
+def primary_key(table: Table) -> List[Any]:
+    return list(table.primary_key.columns)
+
+
+def key_types(table: Table) -> List[type]:
+    """Python types of the primary-key columns, for decoding page cursors."""
+    types = []
+    for column in primary_key(table):
+        try:
+            types.append(column.type.python_type)
+        except NotImplementedError:  # e.g. SQLModel's AutoString
+            types.append(str)
+    return types
+
+
+def _table_bytes(session: Session, names: List[str]) -> Dict[str, Optional[int]]:
+    """On-disk bytes per table in one query, or {} when the backend cannot say."""
+    dialect = session.get_bind().dialect.name
+    try:
+        if dialect == "postgresql":
+            rows = session.execute(
+                text("SELECT relname, pg_total_relation_size(oid) FROM pg_class WHERE relname = ANY(:names)"),
+                {"names": names},
+            )
+            return dict(rows.all())
+        if dialect == "sqlite":
+            # dbstat is optional in SQLite builds; without it sizes are simply omitted.
+            return dict(session.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all())
+    except Exception:
+        session.rollback()
+    return {}
+
+
+def summary(session: Session) -> Dict[str, Dict[str, Optional[int]]]:
+    sizes = _table_bytes(session, list(tables()))
+    return {
+        name: {
+            "rows": session.execute(select(func.count()).select_from(table)).scalar_one(),
+            "bytes": sizes.get(name),
+        }
+        for name, table in tables().items()
+    }
+
+
+def page(session: Session, table: Table, after: Optional[List[Any]], limit: int) -> Dict[str, Any]:
+    """Up to `limit` rows after primary key `after`; `next` is the last row's key, or None at the end."""
+    pk = primary_key(table)
+    query = select(*table.columns).order_by(*pk).limit(limit + 1)
+    if after is not None:
+        query = query.where(tuple_(*pk) > tuple(after))
+    rows = [
+        {key: value.hex() if isinstance(value, bytes) else value for key, value in row._mapping.items()}
+        for row in session.execute(query)
+    ]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "table": table.name,
+        "rows": rows,
+        "next": [rows[-1][c.name] for c in pk] if has_more else None,  # pk columns are never binary
+    }
+
+
+def stream_dump() -> Iterator[bytes]:
+    """The whole database as `{"table": [rows...], ...}`, one chunk per batch."""
+    with Session(engine) as session:
+        yield b"{"
+        for i, (name, table) in enumerate(tables().items()):
+            yield f'{", " if i else ""}{json.dumps(name)}: ['.encode()
+            result = session.execute(
+                select(*table.columns)
+                .order_by(*primary_key(table))
+                .execution_options(stream_results=True, yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            first = True
+            for batch in result.partitions():
+                body = ", ".join(json.dumps(dict(row._mapping), default=json_default) for row in batch)
+                yield (body if first else ", " + body).encode()
+                first = False
+            yield b"]"
+        yield b"}"
@@ -0,0 +1,107 @@
+# server/app/services/export.py
+"""
+Streaming account export.
+
+Rows are read with `yield_per` on a streaming cursor (a server-side cursor on
+Postgres) and encoded one batch at a time, so memory stays flat however large
+the account is: at most EXPORT_BATCH_SIZE rows are alive at once. The generators
+open their own Session because they outlive the request's session; Starlette
+iterates them in the threadpool.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..database import engine
+from ..models import Completion, Friendship, Habit
+
+EXPORT_TABLES = ("habits", "completions", "friendships")
+
+
+def _table_query(table: str, user_id: int):
+    if table == "habits":
+        model = Habit
+        query = select(*Habit.__table__.columns).where(Habit.user_id == user_id)
+    elif table == "completions":
+        model = Completion
+        query = select(*Completion.__table__.columns).where(Completion.user_id == user_id)
+    elif table == "friendships":
+        model = Friendship
+        query = select(*Friendship.__table__.columns).where(
+            or_(Friendship.user_low_id == user_id, Friendship.user_high_id == user_id)
+        )
+    else:
+        raise ValueError(f"unknown export table {table}")
+    columns = [c.name for c in model.__table__.columns]
+    return columns, query.order_by(model.id)
+
+
+def iter_batches(user_id: int, tables: Sequence[str]) -> Iterator[Tuple[str, List[str], List[Any]]]:
+    """(table, column names, batch of row tuples) for each table, in EXPORT_BATCH_SIZE batches."""
+    with Session(engine) as session:
+        for table in tables:
+            columns, query = _table_query(table, user_id)
+            result = session.execute(
+                query.execution_options(stream_results=True, yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            for batch in result.partitions():
+                yield table, columns, batch
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_chunks(user_id: int, tables: Sequence[str]) -> Iterator[bytes]:
+    """One `{"type": ..., "data": {...}}` line per row; one chunk per batch."""
+    for table, columns, batch in iter_batches(user_id, tables):
+        kind = table[:-1]  # habits -> habit
+        lines = [
+            json.dumps({"type": kind, "data": dict(zip(columns, row))}, default=json_default, separators=(",", ":"))
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def csv_chunks(user_id: int, tables: Sequence[str]) -> Iterator[bytes]:
+    """
+    All tables in one CSV: each section starts with its own header row and every
+    row starts with a record_type column (habit / completion / friendship).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    current = None
+    for table, columns, batch in iter_batches(user_id, tables):
+        kind = table[:-1]
+        if table != current:
+            writer.writerow(["record_type", *columns])
+            current = table
+        writer.writerows([kind, *map(_csv_value, row)] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_chunks(user_id: int, fmt: str, tables: Iterable[str]) -> Iterator[bytes]:
+    tables = [t for t in EXPORT_TABLES if t in set(tables)]
+    return csv_chunks(user_id, tables) if fmt == "csv" else ndjson_chunks(user_id, tables)
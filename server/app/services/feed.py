@@ -0,0 +1,244 @@
+# server/app/services/feed.py
+"""
+Friend activity feed, fanned out on write.
+
+The request path only records an Activity row (one INSERT in the caller's
+transaction, e.g. "Alice completed Read"). FeedWorker, a background thread,
+later copies each pending activity into the FeedItem rows of the actor's
+friends, so a feed read is a single range scan on the (owner_id, activity_id)
+key instead of joining completions against friendships on every poll.
+
+- Delivery is at-least-once and idempotent: inserts ignore existing rows, and
+  anything left pending (crash, another process's writes) is picked up by the
+  worker's periodic poll.
+- Each user's feed is capped at FEED_MAX_ITEMS rows; older ones are trimmed in
+  the same transaction as the fan-out.
+- Actors with more than FEED_FANOUT_MAX_FRIENDS friends are not fanned out
+  (fanout="pull"); `page` merges their recent activities in on read instead.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, exists, func, insert, tuple_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..database import dialect_insert, engine
+from ..models import Activity, FeedItem, User
+from .friend_graph import edges
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+COMPLETED, FRIENDED = "completed", "friended"
+PENDING, PUSH, PULL = "pending", "push", "pull"
+
+fanout_rows = registry.counter("feed_fanout_rows_total", "Feed rows written by the fan-out worker")
+fanout_activities = registry.counter(
+    "feed_fanout_activities_total", "Activities processed by the fan-out worker", ["mode"]
+)
+
+
+def record(session: Any, actor_id: int, verb: str, **fields: Any) -> None:
+    """Queue an activity for fan-out; part of the caller's transaction (works on either session type)."""
+    session.add(Activity(actor_id=actor_id, verb=verb, **fields))
+
+
+# ----------------------------
+# Friend graph lookups
+# ----------------------------
+def _friends_of(session: Session, users: Set[int]) -> Tuple[Dict[int, Set[int]], Set[int]]:
+    """
+    Friend sets for `users`, plus the subset whose degree is over the fan-out limit.
+    High-degree users' friend lists are counted, never loaded.
+    """
+    pairs = edges(users)
+    degree = dict(session.execute(select(pairs.c.user_id, func.count()).group_by(pairs.c.user_id)).all())
+    crowded = {user for user, n in degree.items() if n > settings.FEED_FANOUT_MAX_FRIENDS}
+    friends: Dict[int, Set[int]] = {user: set() for user in users}
+    normal = [user for user in degree if user not in crowded]
+    if normal:
+        pairs = edges(normal)
+        for user, friend in session.execute(select(pairs.c.user_id, pairs.c.friend_id)):
+            friends[user].add(friend)
+    return friends, crowded
+
+
+# ----------------------------
+# Fan-out (worker side)
+# ----------------------------
+def _insert_ignoring_existing(session: Session, rows: List[Dict[str, int]]) -> None:
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        session.execute(upsert(FeedItem.__table__).on_conflict_do_nothing(), rows)
+        return
+    keys = {(row["owner_id"], row["activity_id"]) for row in rows}
+    existing = set(session.execute(
+        select(FeedItem.owner_id, FeedItem.activity_id)
+        .where(tuple_(FeedItem.owner_id, FeedItem.activity_id).in_(keys))
+    ).all())
+    fresh = [row for row in rows if (row["owner_id"], row["activity_id"]) not in existing]
+    if fresh:
+        session.execute(insert(FeedItem.__table__), fresh)
+
+
+def trim(session: Session, owners: Iterable[int]) -> None:
+    """Drop all but the newest FEED_MAX_ITEMS rows of each owner's feed, in one statement."""
+    owners = list(owners)
+    if not owners:
+        return
+    ranked = select(
+        FeedItem.owner_id,
+        FeedItem.activity_id,
+        func.row_number().over(partition_by=FeedItem.owner_id, order_by=FeedItem.activity_id.desc()).label("rank"),
+    ).where(FeedItem.owner_id.in_(owners)).subquery()
+    stale = select(ranked.c.owner_id, ranked.c.activity_id).where(ranked.c.rank > settings.FEED_MAX_ITEMS)
+    session.execute(delete(FeedItem).where(tuple_(FeedItem.owner_id, FeedItem.activity_id).in_(stale)))
+
+
+def fan_out_pending(session: Session, limit: int) -> int:
+    """Fan out up to `limit` pending activities and commit. Returns how many were processed."""
+    pending = session.execute(
+        select(Activity.id, Activity.actor_id, Activity.subject_id)
+        .where(Activity.fanout == PENDING)
+        .order_by(Activity.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)  # several app processes may run a worker
+    ).all()
+    if not pending:
+        return 0
+
+    users = {a.actor_id for a in pending} | {a.subject_id for a in pending if a.subject_id is not None}
+    friends, crowded = _friends_of(session, users)
+
+    rows: List[Dict[str, int]] = []
+    modes: Dict[str, List[int]] = {PUSH: [], PULL: []}
+    for activity in pending:
+        involved = {activity.actor_id, activity.subject_id}
+        recipients = set(friends[activity.actor_id])
+        if activity.subject_id is not None:
+            recipients |= friends[activity.subject_id]
+        rows.extend({"owner_id": owner, "activity_id": activity.id} for owner in recipients - involved)
+        # A crowded actor's friends read the activity from the actor's side instead.
+        modes[PULL if activity.actor_id in crowded else PUSH].append(activity.id)
+
+    if rows:
+        _insert_ignoring_existing(session, rows)
+    for mode, ids in modes.items():
+        if ids:
+            session.execute(update(Activity).where(Activity.id.in_(ids)).values(fanout=mode))
+            fanout_activities.labels(mode).inc(len(ids))
+    trim(session, {row["owner_id"] for row in rows})
+    session.commit()
+    fanout_rows.inc(len(rows))
+    return len(pending)
+
+
+def unlink(session: Session, a: int, b: int) -> None:
+    """After an unfriend: remove each user's activities from the other's feed."""
+    for owner, actor in ((a, b), (b, a)):
+        session.execute(
+            delete(FeedItem).where(
+                FeedItem.owner_id == owner,
+                exists().where(Activity.id == FeedItem.activity_id, Activity.actor_id == actor),
+            )
+        )
+
+
+class FeedWorker:
+    """
+    Background thread that drains pending activities in batches of FEED_BATCH_SIZE.
+    Routes call `notify()` after committing an activity; the worker also polls every
+    FEED_POLL_SECONDS for anything committed elsewhere.
+    """
+
+    def __init__(self, batch_size: int, poll_seconds: float):
+        self.batch_size = max(1, batch_size)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="feed-fanout", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def drain(self) -> int:
+        """Fan out everything pending now (also usable without the thread, e.g. from the CLI)."""
+        total = 0
+        while True:
+            with Session(engine) as session:
+                done = fan_out_pending(session, self.batch_size)
+            total += done
+            if done < self.batch_size:
+                return total
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Feed fan-out failed; pending activities will be retried")
+
+
+feed_worker = FeedWorker(batch_size=settings.FEED_BATCH_SIZE, poll_seconds=settings.FEED_POLL_SECONDS)
+
+
+# ----------------------------
+# Read path
+# ----------------------------
+def page(session: Session, user_id: int, before: Optional[int], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Newest-first feed page: the user's fanned-out items merged with pull-mode
+    activities of their friends, keyset-paginated on activity id. Two queries.
+    Returns (items, id to pass as `before` for the next page or None).
+    """
+    subject = aliased(User)
+    columns = (
+        Activity.id, Activity.actor_id, User.name.label("actor_name"), Activity.verb,
+        Activity.habit_id, Activity.habit_name, Activity.subject_id, subject.name.label("subject_name"),
+        Activity.created_at,
+    )
+
+    def query(key: Any, *criteria: Any):
+        stmt = (
+            select(*columns)
+            .join(User, User.id == Activity.actor_id)
+            .outerjoin(subject, subject.id == Activity.subject_id)
+            .where(*criteria)
+        )
+        if before is not None:
+            stmt = stmt.where(key < before)
+        return stmt.order_by(key.desc()).limit(limit + 1)
+
+    # Keyed on FeedItem.activity_id so the page is a range scan of the owner's primary key.
+    pushed = query(FeedItem.activity_id, FeedItem.owner_id == user_id).join(
+        FeedItem, FeedItem.activity_id == Activity.id
+    )
+    friends = edges([user_id])
+    pulled = query(Activity.id, Activity.fanout == PULL, Activity.actor_id.in_(select(friends.c.friend_id)))
+
+    merged = {row.id: row._asdict() for stmt in (pushed, pulled) for row in session.execute(stmt)}
+    items = [merged[key] for key in sorted(merged, reverse=True)]
+    if len(items) > limit:
+        items = items[:limit]
+        return items, items[-1]["id"]
+    return items, None
@@ -0,0 +1,250 @@
+# server/app/services/friend_graph.py
+"""
+Friend-graph queries over the `friendships` table, and the in-memory graph behind
+friend suggestions.
+
+A friendship is one row with a canonical (user_low_id, user_high_id) pair, so
+"friends of X" has to look at both columns. `edges` does that as a UNION ALL of
+two index range reads (ix_friendships_user_low / ix_friendships_user_high)
+rather than an OR, which would defeat both indexes.
+
+Suggestions ("people you may know", ranked by mutual friends) are friends of
+friends, which in SQL is a self-join of friendships per request. FriendGraph
+instead keeps the whole graph in CSR form: `indices[indptr[u]:indptr[u + 1]]`
+are u's friends, sorted, as two flat integer arrays (~8 bytes per friendship
+direction). A suggestion is then a vectorized gather of the friends' rows plus
+one np.unique.
+
+Accepted and removed friendships are applied after commit as a small overlay of
+added/removed pairs on top of the arrays, folded back in (`compact`) once it
+exceeds FRIEND_GRAPH_COMPACT_AFTER entries. The graph is loaded on first use and
+reloaded after FRIEND_GRAPH_MAX_AGE_SECONDS, which bounds staleness when several
+processes accept friendships.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import union_all
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..models import Friendship
+from .metrics import registry
+
+
+def edges(users: Iterable[int]):
+    """Subquery of (user_id, friend_id) for every friendship of `users`, both directions."""
+    users = list(users)
+    return union_all(
+        select(Friendship.user_low_id.label("user_id"), Friendship.user_high_id.label("friend_id"))
+        .where(Friendship.user_low_id.in_(users)),
+        select(Friendship.user_high_id.label("user_id"), Friendship.user_low_id.label("friend_id"))
+        .where(Friendship.user_high_id.in_(users)),
+    ).subquery()
+
+
+# ----------------------------
+# In-memory graph (suggestions)
+# ----------------------------
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def csr(src: np.ndarray, dst: np.ndarray, nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(indptr, indices) for directed edges src -> dst over node ids 0..nodes-1, rows sorted."""
+    # One sort of combined src * nodes + dst keys: far cheaper than lexsort + gather.
+    keys = np.sort(src * nodes + dst)
+    indptr = np.zeros(nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=nodes), out=indptr[1:])
+    return indptr, (keys % nodes).astype(np.int32)
+
+
+class FriendGraph:
+    """Undirected friend graph: CSR arrays indexed by user id, plus an overlay of recent changes."""
+
+    def __init__(self, compact_after: int, max_age_seconds: float):
+        self.compact_after = compact_after
+        self.max_age_seconds = max_age_seconds
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = _EMPTY
+        self.loaded_at: Optional[float] = None
+        self._added: Dict[int, Set[int]] = defaultdict(set)  # pairs (both directions) not in the arrays yet
+        self._removed: Dict[int, Set[int]] = defaultdict(set)  # pairs still in the arrays but gone
+        self._overlay = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._journal: Optional[List[Tuple[bool, int, int]]] = None  # changes made while a load runs
+
+    @property
+    def nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def edge_count(self) -> int:
+        return (len(self.indices) + self._overlay_balance()) // 2
+
+    def _overlay_balance(self) -> int:
+        return sum(map(len, self._added.values())) - sum(map(len, self._removed.values()))
+
+    # -- loading ---------------------------------------------------------
+    def load_edges(self, low: np.ndarray, high: np.ndarray) -> None:
+        """Replace the graph with the given undirected (low, high) pairs."""
+        low = np.asarray(low, dtype=np.int64)
+        high = np.asarray(high, dtype=np.int64)
+        nodes = int(max(low.max(initial=-1), high.max(initial=-1))) + 1
+        indptr, indices = csr(np.concatenate([low, high]), np.concatenate([high, low]), nodes)
+        with self._lock:
+            self.indptr, self.indices = indptr, indices
+            self._added.clear()
+            self._removed.clear()
+            self._overlay = 0
+            self.loaded_at = time.monotonic()
+            journal, self._journal = self._journal, None
+            for added, a, b in journal or ():
+                self._apply(added, a, b)  # committed while the SELECT was running
+
+    def load(self, session: Session) -> None:
+        """(Re)build from the friendships table: one SELECT of the two id columns."""
+        with self._load_lock:
+            with self._lock:
+                self._journal = []
+            # Core rows streamed straight into one array; np.array() over Row objects is ~20x slower.
+            rows = session.connection().execute(select(Friendship.user_low_id, Friendship.user_high_id))
+            pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+            self.load_edges(pairs[:, 0], pairs[:, 1])
+
+    def ensure_loaded(self, session: Session) -> None:
+        loaded_at = self.loaded_at
+        if loaded_at is None or (self.max_age_seconds and time.monotonic() - loaded_at > self.max_age_seconds):
+            self.load(session)
+
+    # -- incremental updates (call after the friendship change commits) --
+    def add(self, a: int, b: int) -> None:
+        self._change(True, a, b)
+
+    def remove(self, a: int, b: int) -> None:
+        self._change(False, a, b)
+
+    def _change(self, added: bool, a: int, b: int) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((added, a, b))
+            if self.loaded_at is None:
+                return  # not built yet; the load will read it from the table
+            self._apply(added, a, b)
+            if self._overlay > self.compact_after:
+                self._compact()
+
+    def _in_arrays(self, u: int, v: int) -> bool:
+        if u >= self.nodes:
+            return False
+        row = self.indices[self.indptr[u]:self.indptr[u + 1]]
+        i = np.searchsorted(row, v)
+        return bool(i < len(row) and row[i] == v)
+
+    def _apply(self, added: bool, a: int, b: int) -> None:
+        # Idempotent either way round, so replaying a journal over a fresh load is safe.
+        for u, v in ((a, b), (b, a)):
+            undo, record = (self._removed, self._added) if added else (self._added, self._removed)
+            if v in undo.get(u, ()):
+                undo[u].discard(v)
+                self._overlay -= 1
+            elif v not in record.get(u, ()) and self._in_arrays(u, v) != added:
+                record[u].add(v)
+                self._overlay += 1
+
+    def _compact(self) -> None:
+        """Fold the overlay into fresh arrays (caller holds the lock)."""
+        src = np.repeat(np.arange(self.nodes, dtype=np.int64), np.diff(self.indptr))
+        dst = self.indices.astype(np.int64)
+        gone = [
+            self.indptr[u] + np.searchsorted(self.indices[self.indptr[u]:self.indptr[u + 1]], sorted(vs))
+            for u, vs in self._removed.items() if vs
+        ]
+        if gone:
+            keep = np.ones(len(dst), dtype=bool)
+            keep[np.concatenate(gone)] = False
+            src, dst = src[keep], dst[keep]
+        new = [(u, v) for u, vs in self._added.items() for v in vs]
+        if new:
+            pairs = np.array(new, dtype=np.int64)
+            src, dst = np.concatenate([src, pairs[:, 0]]), np.concatenate([dst, pairs[:, 1]])
+        nodes = max(self.nodes, int(src.max(initial=-1)) + 1)
+        self.indptr, self.indices = csr(src, dst, nodes)
+        self._added.clear()
+        self._removed.clear()
+        self._overlay = 0
+
+    # -- reads -----------------------------------------------------------
+    def _rows(self, users: np.ndarray) -> np.ndarray:
+        """Concatenated array rows of `users` (no overlay), without a Python loop."""
+        users = users[users < self.nodes]
+        starts = self.indptr[users]
+        lengths = self.indptr[users + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return _EMPTY
+        # Position k of the output reads indices[starts[row] + (k - first k of that row)].
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.indices[np.arange(total) + offsets]
+
+    def _overlay_of(self, users: Iterable[int], side: Dict[int, Set[int]]) -> np.ndarray:
+        values = [v for u in (users.tolist() if isinstance(users, np.ndarray) else users) for v in side.get(u, ())]
+        return np.array(values, dtype=np.int32) if values else _EMPTY
+
+    def friends(self, user_id: int) -> np.ndarray:
+        with self._lock:
+            return self._friends(user_id)
+
+    def _friends(self, user_id: int) -> np.ndarray:
+        row = self._rows(np.array([user_id], dtype=np.int64))
+        removed = self._removed.get(user_id)
+        if removed:
+            row = row[~np.isin(row, list(removed))]
+        return np.concatenate([row, self._overlay_of((user_id,), self._added)])
+
+    def suggest(self, user_id: int, limit: int, exclude: Iterable[int] = ()) -> List[Tuple[int, int]]:
+        """
+        Up to `limit` (user_id, mutual friend count) pairs: friends of the user's friends
+        who are not the user, a friend, or in `exclude`; most mutual friends first, then id.
+        """
+        with self._lock:
+            friends = self._friends(user_id)
+            if not len(friends):
+                return []
+            reachable = np.concatenate([self._rows(friends.astype(np.int64)), self._overlay_of(friends, self._added)])
+            if not len(reachable):
+                return []
+            candidates, mutual = np.unique(reachable, return_counts=True)
+            gone = self._overlay_of(friends, self._removed)  # subset of what _rows returned
+            if len(gone):
+                ids, counts = np.unique(gone, return_counts=True)
+                mutual[np.searchsorted(candidates, ids)] -= counts
+        skip = np.concatenate([friends, np.array([user_id, *exclude], dtype=np.int32)])
+        keep = (mutual > 0) & ~np.isin(candidates, skip)
+        candidates, mutual = candidates[keep], mutual[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-mutual, limit - 1)[:limit]  # not sorted, but holds the `limit` best counts
+            cutoff = mutual[top].min()
+            tied = mutual >= cutoff  # ties at the cutoff are settled by id below
+            candidates, mutual = candidates[tied], mutual[tied]
+        order = np.lexsort((candidates, -mutual))[:limit]
+        return list(zip(candidates[order].tolist(), mutual[order].tolist()))
+
+
+graph = FriendGraph(settings.FRIEND_GRAPH_COMPACT_AFTER, settings.FRIEND_GRAPH_MAX_AGE_SECONDS)
+
+registry.gauge("friend_graph_edges", "Friendships held by the in-memory suggestion graph").labels().set_function(
+    lambda: graph.edge_count
+)
+
+
+def suggest(session: Session, user_id: int, limit: int, exclude: Iterable[int] = ()) -> List[Tuple[int, int]]:
+    """graph.suggest, loading the graph first if needed (sync Session; use run_sync)."""
+    graph.ensure_loaded(session)
+    return graph.suggest(user_id, limit, exclude)
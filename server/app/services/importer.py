@@ -0,0 +1,266 @@
+# server/app/services/importer.py
+"""
+Bulk import of habits and completion history (POST /api/import, `python -m app.cli import`).
+
+Input is parsed as a stream, one record at a time, and processed in chunks of
+IMPORT_CHUNK_SIZE records: each chunk is validated, its habits and completions
+go in with one executemany apiece, and it is committed. Memory does not depend
+on file size and a bad row costs a line in the report, not the whole import.
+
+Accepted formats (the same ones GET /api/export produces):
+
+- NDJSON: one object per line, either `{"type": "habit" | "completion", "data": {...}}`
+  or a flat object with a `type` / `record_type` key.
+- CSV: header row first; a header may be repeated to start a new section. With a
+  `record_type` column each row says what it is; without one, rows that have a
+  `completed_date` are completions and the rest are habits.
+
+Habits are matched to the user's existing habits by name (case-insensitive), so
+re-running an import, or importing an export back into the same account, adds
+nothing twice. Completions point at their habit by the source file's `habit_id`
+(resolved through the habit rows seen earlier in the file) or by `habit_name`/`habit`.
+Duplicate (habit, day) pairs are skipped via uq_completion_habit_day.
+
+Friendship records (in a default export) are counted under `skipped` and otherwise
+ignored: a friendship needs the other user's acceptance, so it cannot be imported.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import time
+from datetime import date, datetime
+from typing import Any, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..models import CompletionImport, Habit, HabitImport
+from . import changes
+from .completion_writes import insert_ignoring_duplicates, record_inserted
+
+MAX_REPORTED_ERRORS = 50
+# Record types an export can contain that an import deliberately leaves alone.
+SKIPPED_TYPES = ("friendship",)
+
+# (line number, record type, raw fields)
+Record = Tuple[int, str, Dict[str, Any]]
+
+
+# ----------------------------
+# Streaming parsers
+# ----------------------------
+def _record_type(fields: Dict[str, Any]) -> str:
+    kind = fields.pop("record_type", None) or fields.pop("type", None)
+    if kind:
+        return str(kind).strip().lower()
+    return "completion" if fields.get("completed_date") else "habit"
+
+
+def parse_ndjson(stream: IO[str]) -> Iterator[Record]:
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            yield line_no, "invalid", {"error": "Malformed JSON"}
+            continue
+        if not isinstance(obj, dict):
+            yield line_no, "invalid", {"error": "Expected a JSON object"}
+            continue
+        if isinstance(obj.get("data"), dict):
+            kind = obj.get("type")
+            obj = dict(obj["data"], type=kind)
+        yield line_no, _record_type(obj), obj
+
+
+def parse_csv(stream: IO[str]) -> Iterator[Record]:
+    reader = csv.reader(stream)
+    header: Optional[List[str]] = None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        cells = [cell.strip() for cell in row]
+        if header is None or (cells and cells[0] == "record_type"):
+            header = cells
+            continue
+        fields: Dict[str, Any] = {k: v for k, v in zip(header, row) if k and v != ""}
+        pattern = fields.get("frequency_pattern")
+        if isinstance(pattern, str):
+            try:
+                fields["frequency_pattern"] = json.loads(pattern)
+            except ValueError:
+                pass  # left as-is; validation reports it
+        yield reader.line_num, _record_type(fields), fields
+
+
+def parse(stream: IO[str], fmt: str) -> Iterator[Record]:
+    return parse_csv(stream) if fmt == "csv" else parse_ndjson(stream)
+
+
+# ----------------------------
+# Chunked writer
+# ----------------------------
+class Importer:
+    """Validates and writes records for one user in chunks; see `run`."""
+
+    def __init__(self, session: Session, user_id: int, chunk_size: Optional[int] = None):
+        self.session = session
+        self.user_id = user_id
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.habits: Dict[int, Habit] = {}  # habit id -> row, for streak/bitset upkeep
+        self.by_name: Dict[str, int] = {}  # lower-cased name -> habit id
+        self.by_source_id: Dict[int, int] = {}  # id in the file -> habit id
+        self.report: Dict[str, Any] = {
+            "rows_read": 0,
+            "habits_created": 0,
+            "habits_matched": 0,
+            "completions_created": 0,
+            "completions_duplicate": 0,
+            "rows_invalid": 0,
+            "skipped": {},  # record type -> count, for SKIPPED_TYPES
+            "errors": [],
+        }
+
+    def _error(self, line_no: int, message: str) -> None:
+        self.report["rows_invalid"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_no, "error": message})
+
+    def _load_existing_habits(self) -> None:
+        for habit in self.session.exec(select(Habit).where(Habit.user_id == self.user_id)):
+            self.habits[habit.id] = habit
+            self.by_name.setdefault(habit.name.strip().lower(), habit.id)
+
+    def _lock_habits(self, habit_ids: Set[int]) -> None:
+        """Re-read the chunk's habits FOR UPDATE: their streak fields are read-modify-write."""
+        for habit in self.session.exec(
+            select(Habit)
+            .where(Habit.id.in_(habit_ids))
+            .order_by(Habit.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ):
+            self.habits[habit.id] = habit
+
+    def _write_habits(self, records: List[Tuple[int, HabitImport]]) -> None:
+        rows = []
+        pending: Dict[str, List[Optional[int]]] = {}  # name -> source ids, for habits new in this chunk
+        now, today = datetime.utcnow(), date.today()
+        for _, item in records:
+            key = item.name.strip().lower()
+            if key in self.by_name or key in pending:
+                self.report["habits_matched"] += 1
+                if key in pending:
+                    pending[key].append(item.id)
+                elif item.id is not None:
+                    self.by_source_id[item.id] = self.by_name[key]
+                continue
+            data = item.model_dump(exclude={"id"})
+            # Core executemany skips SQLModel defaults, so every column is spelled out.
+            data.update(user_id=self.user_id, created_at=now, started_at=today,
+                        current_streak=0, longest_streak=0, last_completed_date=None)
+            rows.append(data)
+            pending[key] = [item.id]
+        if not rows:
+            return
+
+        table = Habit.__table__
+        ids = self.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for habit_id, (key, source_ids) in zip(ids, pending.items()):
+            self.by_name[key] = habit_id
+            for source_id in source_ids:
+                if source_id is not None:
+                    self.by_source_id[source_id] = habit_id
+        for habit in self.session.exec(select(Habit).where(Habit.id.in_(ids))):
+            self.habits[habit.id] = habit
+        self.report["habits_created"] += len(ids)
+        changes.record(
+            self.session, [(self.user_id, "habit", habit_id, changes.UPSERT) for habit_id in ids], created={"habit"}
+        )
+
+    def _resolve_habit(self, item: CompletionImport) -> Optional[int]:
+        if item.habit_id is not None and item.habit_id in self.by_source_id:
+            return self.by_source_id[item.habit_id]
+        if item.habit_name:
+            return self.by_name.get(item.habit_name.strip().lower())
+        if item.habit_id is not None and item.habit_id in self.habits:
+            return item.habit_id  # an id of one of the user's own habits
+        return None
+
+    def _write_completions(self, records: List[Tuple[int, CompletionImport]]) -> None:
+        rows = []
+        for line_no, item in records:
+            habit_id = self._resolve_habit(item)
+            if habit_id is None:
+                self._error(line_no, "Unknown habit (habit rows must come before their completions)")
+                continue
+            rows.append({
+                "habit_id": habit_id,
+                "user_id": self.user_id,
+                "completed_date": item.completed_date,
+                "quantity_value": item.quantity_value,
+                "note": item.note,
+            })
+        if not rows:
+            return
+        self._lock_habits({row["habit_id"] for row in rows})
+        inserted = insert_ignoring_duplicates(self.session, rows)
+        # Imported history is not news: friends' feeds only show completions made in the app.
+        record_inserted(self.session, self.user_id, self.habits, inserted, feed_activity=False)
+        self.report["completions_created"] += len(inserted)
+        self.report["completions_duplicate"] += len(rows) - len(inserted)
+
+    def _flush(self, chunk: List[Record]) -> None:
+        habits: List[Tuple[int, HabitImport]] = []
+        completions: List[Tuple[int, CompletionImport]] = []
+        for line_no, kind, fields in chunk:
+            try:
+                if kind == "habit":
+                    habits.append((line_no, HabitImport.model_validate(fields)))
+                elif kind == "completion":
+                    if "habit" in fields and "habit_name" not in fields:
+                        fields["habit_name"] = fields.pop("habit")
+                    completions.append((line_no, CompletionImport.model_validate(fields)))
+                elif kind == "invalid":
+                    self._error(line_no, fields["error"])
+                elif kind in SKIPPED_TYPES:
+                    self.report["skipped"][kind] = self.report["skipped"].get(kind, 0) + 1
+                else:
+                    self._error(line_no, f"Unknown record type {kind!r}")
+            except ValidationError as exc:
+                first = exc.errors()[0]
+                self._error(line_no, f"{'.'.join(map(str, first['loc']))}: {first['msg']}")
+        self._write_habits(habits)
+        self._write_completions(completions)
+        self.session.commit()
+
+    def run(self, records: Iterator[Record]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self._load_existing_habits()
+        chunk: List[Record] = []
+        for record in records:
+            self.report["rows_read"] += 1
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+
+        seconds = time.perf_counter() - started
+        self.report["seconds"] = round(seconds, 3)
+        self.report["rows_per_second"] = round(self.report["rows_read"] / seconds) if seconds else None
+        return self.report
+
+
+def import_stream(session: Session, user_id: int, stream: IO[str], fmt: str) -> Dict[str, Any]:
+    """Run a whole import (sync Session; use run_sync). Commits once per chunk."""
+    return Importer(session, user_id).run(parse(stream, fmt))
+
@@ -0,0 +1,378 @@
+# server/app/services/leaderboard.py
+"""
+Weekly friend leaderboards.
+
+Scores: WeeklyScore keeps each user's completions per week (Monday start). The
+completion write path updates it in the same transaction as the completions
+(`add_completions`), and habit deletion takes the habit's weeks back out
+(`remove_habit`), so a board never scans anyone's completions.
+
+Boards: a viewer's board is the viewer plus their friends, ranked by the week's
+completions, then live best streak. Assembling one is two queries (names +
+scores, streak columns of active habits that can still be live), both over a
+friends subquery. Both are built once, with bind parameters, so a miss does not
+pay for constructing and cache-keying fresh ORM statements. Assembled boards are
+cached per (viewer, week) in a TTLCache, so a repeat view is a dict lookup.
+
+Keeping boards current: the cache remembers which boards each user appears on.
+New completions are patched into those boards in place once their transaction
+commits: the user's entry gets the added completions and any longer streak, and
+the board is re-ranked. Changes a patch cannot express (friend list, schedule or
+status edits, habit deletion, score rebuilds) mark the users with `touch`, and
+the boards containing them are dropped instead. Both happen in after_commit
+hooks, so a board never shows a write before it is visible; a board assembled
+while one of its members had a write in flight is not stored.
+"""
+from __future__ import annotations
+
+import threading
+from collections import Counter, defaultdict
+from datetime import date
+from functools import partial
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import Integer, Text, and_, bindparam, cast, delete, event, func, insert, union_all, update
+from sqlalchemy.orm import Session as SASession
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..database import dialect_insert
+from ..models import CompletionRollup, Friendship, Habit, User, WeeklyScore
+from .auth_cache import TTLCache
+from .metrics import registry
+from .rollups import period_start
+from .streaks import habit_weekdays, live_since, live_streak, scheduled_weekdays
+
+_TOUCHED = "leaderboard_touched"
+_SCORED = "leaderboard_scored"
+_HELD = "leaderboard_held"
+
+Key = Tuple[int, date]  # (viewer, week_start)
+Entry = Tuple[date, Dict[str, Any], List[int]]  # (streaks as of, board, member ids)
+StreakColumns = Tuple[int, Optional[date], FrozenSet[int]]  # current_streak, last_completed_date, weekdays
+
+
+class LeaderboardCache:
+    """Assembled boards per (viewer, week), plus the reverse index used to patch or drop them."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.boards = TTLCache(max_entries, ttl_seconds, on_remove=self._unwatch)
+        # Reentrant: put() and release() hold it while the TTLCache calls back into _unwatch.
+        self._lock = threading.RLock()
+        self._watchers: Dict[int, Set[Key]] = defaultdict(set)  # member -> keys of boards they are on
+        self._pending: Counter = Counter()  # member -> committing transactions that change their score
+        self._clock = 0
+        self._horizon = 0  # builds begun before this are never stored
+        self._dropped_at: Dict[int, int] = {}  # member -> clock value of their last change
+
+    def get(self, key: Key, today: date) -> Optional[Dict[str, Any]]:
+        entry = self.boards.get(key)
+        # Streaks are as-of today, so a board built yesterday is stale even if nothing was written.
+        if entry is None or entry[0] != today:
+            return None
+        return entry[1]
+
+    def begin(self) -> int:
+        """Call before reading the data a board is built from; pass the result to `put`."""
+        with self._lock:
+            return self._clock
+
+    def put(self, key: Key, members: Iterable[int], today: date, board: Dict[str, Any], started: int) -> bool:
+        members = list(members)
+        with self._lock:
+            if started < self._horizon or any(
+                member in self._pending or self._dropped_at.get(member, -1) > started for member in members
+            ):
+                return False  # raced with a write; the next view rebuilds
+            self.boards.set(key, (today, board, members))
+            for member in members:
+                self._watchers[member].add(key)
+        return True
+
+    def hold(self, user_ids: Iterable[int]) -> None:
+        """A transaction changing these users' scores is committing: store no board with them until `release`."""
+        with self._lock:
+            self._pending.update(user_ids)
+
+    def release(self, user_id: int, patch: Optional[Any] = None) -> None:
+        """End a `hold`, first applying `patch` (Entry -> Entry) to every cached board the user is on."""
+        with self._lock:
+            if patch is not None:
+                for key in list(self._watchers.get(user_id, ())):
+                    self.boards.update(key, patch)
+            self._pending[user_id] -= 1
+            if self._pending[user_id] <= 0:
+                del self._pending[user_id]
+            self._changed(user_id)
+
+    def drop(self, user_id: int) -> None:
+        """Drop every cached board `user_id` appears on."""
+        with self._lock:
+            self._changed(user_id)
+            keys = self._watchers.pop(user_id, ())
+        for key in keys:
+            self.boards.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._watchers.clear()
+            self._dropped_at.clear()
+            self._clock += 1
+            self._horizon = self._clock
+        self.boards.clear()
+
+    def _changed(self, user_id: int) -> None:
+        # Lock held. Builds already under way read the old state, so they must not be stored.
+        self._clock += 1
+        self._dropped_at[user_id] = self._clock
+        if len(self._dropped_at) > self.boards.max_entries:
+            # Only in-flight builds need these; forget them all and refuse every older build instead.
+            self._dropped_at.clear()
+            self._horizon = self._clock
+
+    def _unwatch(self, key: Key, entry: Entry) -> None:
+        """TTLCache callback: an evicted, expired or dropped board stops being watched by its members."""
+        with self._lock:
+            if key in self.boards:
+                return  # already rebuilt and re-watched
+            for member in entry[2]:
+                keys = self._watchers.get(member)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._watchers[member]
+
+
+leaderboard_cache = LeaderboardCache(settings.LEADERBOARD_CACHE_MAX_ENTRIES, settings.LEADERBOARD_CACHE_TTL_SECONDS)
+
+_lookups = registry.counter("leaderboard_cache_lookups_total", "Leaderboard cache lookups", ["result"])
+_lookups.labels("hit").set_function(lambda: leaderboard_cache.boards.hits)
+_lookups.labels("miss").set_function(lambda: leaderboard_cache.boards.misses)
+
+
+# ----------------------------
+# Patching and invalidation (after commit)
+# ----------------------------
+def touch(session: Session, *user_ids: int) -> None:
+    """Mark users whose boards must be dropped when this session's transaction commits."""
+    session.info.setdefault(_TOUCHED, set()).update(user_ids)
+
+
+def _patch(user_id: int, weeks: Counter, habits: List[StreakColumns], entry: Entry) -> Entry:
+    """Apply a user's committed completions to one cached board."""
+    today, board, members = entry
+    added = weeks.get(board["week_start"], 0)
+    streak = max((live_streak(current, last, weekdays, today) for current, last, weekdays in habits), default=0)
+    entries = list(board["entries"])
+    for position, item in enumerate(entries):
+        if item["user_id"] == user_id:
+            if not added and streak <= item["streak"]:
+                return entry
+            # Completions only ever lengthen a streak, so the best one is the larger of the two.
+            entries[position] = dict(item, completions=item["completions"] + added, streak=max(item["streak"], streak))
+            return today, _ranked(board["week_start"], entries), members
+    return entry
+
+
+@event.listens_for(SASession, "before_commit")
+def _hold_scored(session: SASession) -> None:
+    held = session.info.setdefault(_HELD, set())
+    users = set(session.info.get(_SCORED, ())) - held
+    held.update(users)
+    leaderboard_cache.hold(users)
+
+
+@event.listens_for(SASession, "after_commit")
+def _apply_changes(session: SASession) -> None:
+    touched = session.info.pop(_TOUCHED, set())
+    scored = session.info.pop(_SCORED, {})
+    for user_id in session.info.pop(_HELD, ()):
+        weeks, habits = scored[user_id]
+        patch = None if user_id in touched else partial(_patch, user_id, weeks, list(habits.values()))
+        leaderboard_cache.release(user_id, patch)
+    for user_id in touched:
+        leaderboard_cache.drop(user_id)
+
+
+@event.listens_for(SASession, "after_rollback")
+def _forget_changes(session: SASession) -> None:
+    session.info.pop(_TOUCHED, None)
+    session.info.pop(_SCORED, None)
+    for user_id in session.info.pop(_HELD, ()):
+        leaderboard_cache.release(user_id)
+
+
+# ----------------------------
+# Score maintenance (write path)
+# ----------------------------
+def add_completions(session: Session, user_id: int, days: Iterable[date], habits: Iterable[Habit] = ()) -> None:
+    """
+    Count new completions on `days` into the user's weekly scores; one upsert executemany.
+    `habits` are the habits they were recorded on, streak fields already updated: their
+    streaks are patched into cached boards along with the counts.
+    """
+    weeks = Counter(period_start("week", day) for day in days)
+    if not weeks:
+        return
+    rows = [{"user_id": user_id, "week_start": week, "completions": n} for week, n in weeks.items()]
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        table = WeeklyScore.__table__
+        stmt = upsert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "week_start"],
+            set_={"completions": table.c.completions + stmt.excluded.completions},
+        )
+        session.execute(stmt, rows)
+    else:
+        existing = {
+            score.week_start: score
+            for score in session.exec(
+                select(WeeklyScore)
+                .where(WeeklyScore.user_id == user_id, WeeklyScore.week_start.in_(weeks))
+                .with_for_update()
+            )
+        }
+        for row in rows:
+            score = existing.get(row["week_start"])
+            if score is None:
+                score = WeeklyScore(**row)
+            else:
+                score.completions += row["completions"]
+            session.add(score)
+
+    user_weeks, user_habits = session.info.setdefault(_SCORED, {}).setdefault(user_id, (Counter(), {}))
+    user_weeks.update(weeks)
+    for habit in habits:
+        if habit.status == "active":
+            user_habits[habit.id] = (habit.current_streak, habit.last_completed_date, habit_weekdays(habit))
+
+
+def remove_habit(session: Session, habit_id: int) -> None:
+    """Subtract a habit's weekly rollups from its owner's scores (call before the rollups are deleted)."""
+    weeks = session.execute(
+        select(CompletionRollup.user_id, CompletionRollup.period_start, CompletionRollup.completions)
+        .where(CompletionRollup.habit_id == habit_id, CompletionRollup.period == "week")
+    ).all()
+    if not weeks:
+        return
+    table = WeeklyScore.__table__
+    session.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("b_user_id"), table.c.week_start == bindparam("b_week_start"))
+        .values(completions=table.c.completions - bindparam("b_completions")),
+        [{"b_user_id": u, "b_week_start": week, "b_completions": n} for u, week, n in weeks],
+    )
+    touch(session, weeks[0].user_id)
+
+
+def rebuild(session: Session, user_id: Optional[int] = None) -> int:
+    """Regenerate weekly scores from the weekly rollups. Returns rows written."""
+    stmt = delete(WeeklyScore)
+    source = (
+        select(CompletionRollup.user_id, CompletionRollup.period_start, func.sum(CompletionRollup.completions))
+        .where(CompletionRollup.period == "week")
+        .group_by(CompletionRollup.user_id, CompletionRollup.period_start)
+    )
+    if user_id is not None:
+        stmt = stmt.where(WeeklyScore.user_id == user_id)
+        source = source.where(CompletionRollup.user_id == user_id)
+    session.execute(stmt)
+    result = session.execute(insert(WeeklyScore.__table__).from_select(["user_id", "week_start", "completions"], source))
+    if user_id is None:
+        leaderboard_cache.clear()
+    else:
+        touch(session, user_id)
+    return result.rowcount
+
+
+# ----------------------------
+# Read path
+# ----------------------------
+def cached(viewer: int, week_start: date, today: date) -> Optional[Dict[str, Any]]:
+    return leaderboard_cache.get((viewer, week_start), today)
+
+
+def board(session: Session, viewer: int, week_start: date, today: date) -> Dict[str, Any]:
+    """The viewer's friend board for the week, from cache or assembled."""
+    return cached(viewer, week_start, today) or build(session, viewer, week_start, today)
+
+
+# Board members: the viewer's friends (friendships hold each pair once, lower id first) plus the viewer.
+_friendships = Friendship.__table__
+_viewer = bindparam("viewer", type_=Integer)
+_members = union_all(
+    select(_friendships.c.user_high_id).where(_friendships.c.user_low_id == _viewer),
+    select(_friendships.c.user_low_id).where(_friendships.c.user_high_id == _viewer),
+    select(_viewer),
+).scalar_subquery()
+
+_users, _scores = User.__table__, WeeklyScore.__table__
+_SCORES = (
+    select(_users.c.id, _users.c.name, _scores.c.completions)
+    .select_from(_users.outerjoin(
+        _scores, and_(_scores.c.user_id == _users.c.id, _scores.c.week_start == bindparam("week_start"))
+    ))
+    .where(_users.c.id.in_(_members))
+)
+
+# streak_as_of only looks at these columns, so habits that share them share an answer:
+# the database collapses them to one row carrying the max stored streak. The pattern is
+# grouped as text (JSON has no equality operator on Postgres) and parsed here.
+_habits = Habit.__table__
+_pattern = cast(_habits.c.frequency_pattern, Text)
+_STREAKS = (
+    select(
+        _habits.c.user_id, func.max(_habits.c.current_streak), _habits.c.last_completed_date,
+        _habits.c.frequency_type, _pattern,
+    )
+    .where(
+        _habits.c.user_id.in_(_members),
+        _habits.c.status == "active",
+        _habits.c.current_streak > 0,
+        _habits.c.last_completed_date >= bindparam("since"),
+    )
+    .group_by(_habits.c.user_id, _habits.c.last_completed_date, _habits.c.frequency_type, _pattern)
+)
+
+
+def _ranked(week_start: date, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sort and rank entries into a board. Ties share a rank: 1, 2, 2, 4."""
+    entries = sorted(entries, key=lambda e: (-e["completions"], -e["streak"], e["name"] or "", e["user_id"]))
+    rank = mine = 0
+    previous = None
+    for position, entry in enumerate(entries, start=1):
+        score = (entry["completions"], entry["streak"])
+        if score != previous:
+            rank, previous = position, score
+        if entry.get("rank") != rank:
+            if "rank" in entry:
+                # Ranked entries belong to a board that may already be handed out; never modify one.
+                entry = entries[position - 1] = dict(entry)
+            entry["rank"] = rank
+        if entry["is_me"]:
+            mine = rank
+    return {"week_start": week_start, "rank": mine, "entries": entries}
+
+
+def build(session: Session, viewer: int, week_start: date, today: date) -> Dict[str, Any]:
+    """Assemble (and cache) the viewer's board in two queries."""
+    started = leaderboard_cache.begin()
+    conn = session.connection()
+    scores = conn.execute(_SCORES, {"viewer": viewer, "week_start": week_start}).all()
+    best: Dict[int, int] = defaultdict(int)
+    for user_id, current, last, frequency_type, pattern in conn.execute(
+        _STREAKS, {"viewer": viewer, "since": live_since(today)}
+    ):
+        pattern = orjson.loads(pattern) if pattern and frequency_type != "daily" else None
+        weekdays = scheduled_weekdays(frequency_type, pattern)
+        best[user_id] = max(best[user_id], live_streak(current, last, weekdays, today))
+
+    result = _ranked(week_start, [
+        {"user_id": user_id, "name": name, "completions": completions or 0, "streak": best[user_id],
+         "is_me": user_id == viewer}
+        for user_id, name, completions in scores
+    ])
+    leaderboard_cache.put((viewer, week_start), [e["user_id"] for e in result["entries"]], today, result, started)
+    return result
@@ -0,0 +1,47 @@
+# server/app/services/pagination.py
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is the sort key of the last row on the previous page, JSON-encoded and
+base64url'd so clients treat it as opaque. The next page is then a range read
+`WHERE (sort_key) < (cursor)` on a matching composite index; unlike OFFSET, page
+N costs the same as page 1.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], types: Sequence[type]) -> Optional[List[Any]]:
+    """Decode a cursor whose items have the given types; a malformed cursor is a 400."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor shape")
+        return [_coerce(value, kind) for value, kind in zip(values, types)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _coerce(value: Any, kind: type) -> Any:
+    if kind is datetime:
+        return datetime.fromisoformat(value)
+    if kind is date:
+        return date.fromisoformat(value)
+    if kind is int and (isinstance(value, bool) or not isinstance(value, int)):
+        raise TypeError("expected int")
+    return kind(value)
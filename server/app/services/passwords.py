@@ -0,0 +1,158 @@
+# server/app/services/passwords.py
+"""
+Password hashing (no extra deps) and the process pool that runs it.
+
+Stored format: pbkdf2_sha256$<iters>$<salt_hex>$<dk_hex>
+
+PBKDF2 at 200k iterations is ~100ms of pure CPU. Running it inline in the route
+handlers ties up a request worker for every login, so the auth routes await
+`password_hasher` instead, which ships the work to a small dedicated process pool.
+The iteration count is stored per hash, so PASSWORD_HASH_ITERATIONS can be changed
+at any time: old hashes keep verifying and are upgraded on the next login.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import secrets
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEME = "pbkdf2_sha256"
+
+
+def hash_password(password: str, iterations: int = 200_000) -> str:
+    if not isinstance(password, str) or len(password) < 1:
+        raise ValueError("Password required")
+    salt = secrets.token_bytes(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{SCHEME}${iterations}${salt.hex()}${dk.hex()}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        scheme, iters_s, salt_hex, dk_hex = stored.split("$", 3)
+        if scheme != SCHEME:
+            return False
+        iterations = int(iters_s)
+        salt = bytes.fromhex(salt_hex)
+        expected = bytes.fromhex(dk_hex)
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        return hmac.compare_digest(candidate, expected)
+    except Exception:
+        return False
+
+
+def hash_iterations(stored: str) -> Optional[int]:
+    """Iteration count of a stored hash, None if it is not one of ours."""
+    try:
+        scheme, iters_s, _ = stored.split("$", 2)
+        return int(iters_s) if scheme == SCHEME else None
+    except ValueError:
+        return None
+
+
+def needs_rehash(stored: str, iterations: Optional[int] = None) -> bool:
+    """True when `stored` was hashed with a different scheme or iteration count."""
+    return hash_iterations(stored) != (iterations or settings.PASSWORD_HASH_ITERATIONS)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; routes turn this into a 503."""
+
+
+class PasswordHasher:
+    """
+    Async front for the hashing pool.
+
+    `workers` processes do the work; at most `queue_limit` further jobs may wait
+    behind them. Anything past that is rejected immediately instead of queueing
+    unbounded work behind a login burst. workers=0 falls back to the default
+    thread executor (handy for tests and single-process dev servers).
+
+    A worker process that dies (OOM killer, crash) breaks the whole pool: every
+    pending and later job raises BrokenProcessPool. The pool is then replaced
+    and the job retried once.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, iterations: int):
+        self.workers = max(0, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.iterations = iterations
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers == 0:
+            return None
+        if self._executor is None:
+            # spawn: never fork a process that is already running uvicorn's threads.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _replace_broken(self, executor: Optional[Executor]) -> None:
+        # Jobs failing together all land here; only the first replaces the pool.
+        if executor is not None and executor is self._executor:
+            logger.warning("Password hashing pool broke (a worker died); starting a new one")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.workers) + self.queue_limit
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.capacity:
+            raise HashingBusy()
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._replace_broken(executor)
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.iterations)
+
+    async def verify(self, password: str, stored: str) -> bool:
+        return await self._run(verify_password, password, stored)
+
+    def needs_rehash(self, stored: str) -> bool:
+        return needs_rehash(stored, self.iterations)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "iterations": self.iterations,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.HASH_POOL_WORKERS,
+    queue_limit=settings.HASH_QUEUE_LIMIT,
+    iterations=settings.PASSWORD_HASH_ITERATIONS,
+)
@@ -0,0 +1,306 @@
+# server/app/services/realtime.py
+"""
+Server push: an in-process pub/sub broker behind GET /api/events (SSE) and
+/api/events/ws (WebSocket).
+
+Topics are per user:
+    user:{id}       private events for that user (friend requests, friend added/removed)
+    activity:{id}   what that user does that their friends see (completions)
+
+A connection subscribes to its own user topic plus the activity topic of each
+friend, and follows friend.added / friend.removed events to keep that set
+current, so publishing a completion is one publish to the actor's activity topic
+with no friend lookup on the request path. Those topic changes are applied as the
+events are delivered, not when the client reads them, so an overflow that drops
+them from the buffer cannot leave a connection on a stale friend set.
+
+Routers publish after their transaction commits. Delivery is best effort: each
+connection buffers at most PUSH_BUFFER_SIZE events, and publishing never waits
+for a client. When a slow client's buffer fills, it is emptied and the client
+gets one "overflow" event telling it to resync (GET /api/sync), so one slow
+reader can neither block writers nor grow server memory.
+
+`broker` is an InMemoryBroker unless PUSH_BROKER_URL names a Redis-compatible
+server, in which case RedisBroker relays every publish through it so that
+connections held by other worker processes receive it too.
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import queue
+import threading
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Optional, Set, Tuple
+
+import orjson
+
+from ..config import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW = {"type": "overflow", "data": {"resync": "/api/sync"}}
+
+connections = registry.gauge("push_connections", "Open server-push connections")
+events_dropped = registry.counter("push_events_dropped_total", "Push events dropped from full connection buffers")
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def activity_topic(user_id: int) -> str:
+    return f"activity:{user_id}"
+
+
+class Subscription:
+    """
+    One connection's topics and bounded event buffer. `deliver` may be called from
+    any thread; `get` is awaited on the event loop the subscription was created on.
+    """
+
+    def __init__(self, broker: "Broker", max_buffer: int):
+        self.broker = broker
+        self.topics: Set[str] = set()
+        self.max_buffer = max(1, max_buffer)
+        self.dropped = 0
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._overflowed = False
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self._follow_friendship(event)
+            was_empty = not self._buffer and not self._overflowed
+            if len(self._buffer) >= self.max_buffer:
+                # Dropping the backlog (not the new event) keeps the client's view recent.
+                self.dropped += len(self._buffer)
+                events_dropped.inc(len(self._buffer))
+                self._buffer.clear()
+                self._overflowed = True
+            self._buffer.append(event)
+        if was_empty:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _follow_friendship(self, event: Dict[str, Any]) -> None:
+        # Under self._lock, so a concurrent close() cannot be undone by a late attach.
+        if event["type"] == "friend.added":
+            self.broker.attach(self, [activity_topic(event["data"]["friend_id"])])
+        elif event["type"] == "friend.removed":
+            self.broker.detach(self, [activity_topic(event["data"]["friend_id"])])
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None after `timeout` seconds without one."""
+        while True:
+            with self._lock:
+                if self._overflowed:
+                    self._overflowed = False
+                    return OVERFLOW
+                if self._buffer:
+                    return self._buffer.popleft()
+                self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def add(self, *topics: str) -> None:
+        self.broker.attach(self, topics)
+
+    def remove(self, *topics: str) -> None:
+        self.broker.detach(self, topics)
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+            self._buffer.clear()
+        self.broker.detach(self, list(self.topics))
+
+
+class Broker(abc.ABC):
+    """Pub/sub interface the routers publish to and connections subscribe through."""
+
+    @abc.abstractmethod
+    def publish(self, topic: str, event: Dict[str, Any]) -> None:
+        """Deliver `event` to every subscription on `topic`. Never blocks on subscribers."""
+
+    @abc.abstractmethod
+    def attach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        """Start delivering `topics` to `subscription`."""
+
+    @abc.abstractmethod
+    def detach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        """Stop delivering `topics` to `subscription`."""
+
+    def subscribe(self, topics: Iterable[str], max_buffer: int) -> Subscription:
+        """Open a subscription (call on the event loop that will read it)."""
+        subscription = Subscription(self, max_buffer)
+        self.attach(subscription, topics)
+        return subscription
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class InMemoryBroker(Broker):
+    """Topic -> subscriptions map for connections held by this process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def attach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        with self._lock:
+            for topic in topics:
+                self._subscribers[topic].add(subscription)
+                subscription.topics.add(topic)
+
+    def detach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        with self._lock:
+            for topic in topics:
+                subscription.topics.discard(topic)
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+
+class RedisBroker(Broker):
+    """
+    Fan-out across worker processes through a Redis-compatible server (Redis, Valkey,
+    KeyDB, ...). Publishes go to the server only; one listener thread per process
+    pattern-subscribes to the channel prefix and hands messages to a local
+    InMemoryBroker, so local and remote subscribers are served the same way.
+    Needs the optional `redis` package.
+
+    The redis client is blocking and routers publish from the event loop, so
+    `publish` only queues the event; a sender thread does the network round trip.
+    If the server is unreachable and `max_pending` events pile up, new ones are
+    dropped and counted like a full connection buffer.
+    """
+
+    def __init__(self, url: str, prefix: str = "habitflow:push:", max_pending: int = 10_000):
+        try:
+            import redis
+        except ImportError as exc:  # optional dependency
+            raise RuntimeError("PUSH_BROKER_URL is set but the 'redis' package is not installed") from exc
+        self.prefix = prefix
+        self.local = InMemoryBroker()
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+        self._outbox: "queue.Queue[Optional[Tuple[str, bytes]]]" = queue.Queue(max_pending)
+        self._sender: Optional[threading.Thread] = None
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> None:
+        try:
+            self._outbox.put_nowait((self.prefix + topic, orjson.dumps(event)))
+        except queue.Full:
+            events_dropped.inc()
+
+    def _send(self) -> None:
+        while (item := self._outbox.get()) is not None:
+            channel, payload = item
+            try:
+                self._client.publish(channel, payload)
+            except Exception:
+                logger.exception("Push publish to %s failed; event dropped", channel)
+
+    def attach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        self.local.attach(subscription, topics)
+
+    def detach(self, subscription: Subscription, topics: Iterable[str]) -> None:
+        self.local.detach(subscription, topics)
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        topic = message["channel"].decode()[len(self.prefix):]
+        self.local.publish(topic, orjson.loads(message["data"]))
+
+    def start(self) -> None:
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._send, name="push-publisher", daemon=True)
+            self._sender.start()
+        if self._thread is None:
+            self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.psubscribe(**{self.prefix + "*": self._dispatch})
+            self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self) -> None:
+        if self._sender is not None:
+            self._outbox.put(None)  # after whatever is already queued
+            self._sender.join(timeout=5)
+            self._sender = None
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+            self._pubsub.close()
+
+
+def _make_broker() -> Broker:
+    return RedisBroker(settings.PUSH_BROKER_URL) if settings.PUSH_BROKER_URL else InMemoryBroker()
+
+
+broker = _make_broker()
+
+
+def publish(user_ids: Iterable[int], type_: str, **data: Any) -> None:
+    """Push an event to each user's private topic."""
+    event = {"type": type_, "data": data}
+    for user_id in user_ids:
+        broker.publish(user_topic(user_id), event)
+
+
+def publish_activity(actor_id: int, type_: str, **data: Any) -> None:
+    """Push an event to everyone currently friends with `actor_id`."""
+    broker.publish(activity_topic(actor_id), {"type": type_, "data": {"user_id": actor_id, **data}})
+
+
+def open_stream(user_id: int) -> Subscription:
+    """
+    Subscribe a new connection to the user's own topic. Call before reading the
+    friend list for `follow`, so a friend.added published in between is not missed.
+    """
+    return broker.subscribe([user_topic(user_id)], settings.PUSH_BUFFER_SIZE)
+
+
+def follow(subscription: Subscription, friend_ids: Iterable[int]) -> None:
+    subscription.add(*(activity_topic(friend) for friend in friend_ids))
+
+
+async def events(subscription: Subscription, keepalive: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    A connection's event stream, shared by the SSE and WebSocket transports; closes
+    the subscription when the consumer stops. Yields None after `keepalive` idle
+    seconds so the transport can send a heartbeat.
+    """
+    connections.inc()
+    try:
+        while True:
+            yield await subscription.get(keepalive)
+    finally:
+        connections.dec()
+        subscription.close()
+
+
+def encode_sse(event: Optional[Dict[str, Any]]) -> bytes:
+    """One text/event-stream frame (a comment line for heartbeats)."""
+    if event is None:
+        return b": keepalive\n\n"
+    return b"event: " + event["type"].encode() + b"\ndata: " + orjson.dumps(event["data"]) + b"\n\n"
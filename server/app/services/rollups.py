@@ -0,0 +1,311 @@
+# server/app/services/rollups.py
+"""
+Completion rollups for progress analytics.
+
+CompletionRollup keeps one row per (habit, period, period_start) for day, week
+(Monday start) and month periods, with the completion count and the summed
+quantity_value. Every completion write adds to the matching three rows in the
+same transaction (via completion_writes), so GET /api/stats only ever reads
+rollups and never scans completions.
+
+`rebuild` regenerates everything from the completions table with vectorized
+NumPy grouping (`python -m app.cli rebuild-rollups`).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, or_
+from sqlmodel import Session, select
+
+from ..database import dialect_insert
+from ..models import Completion, CompletionRollup, Habit
+from .streaks import habit_weekdays
+
+PERIODS = ("day", "week", "month")
+
+# (habit_id, period, period_start) -> [completions, quantity_total]
+Deltas = Dict[Tuple[int, str, date], List[float]]
+
+
+def period_start(period: str, day: date) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period_start(period: str, start: date) -> date:
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def scheduled_days(weekdays: FrozenSet[int], first: date, last: date) -> int:
+    """Days in [first, last] whose weekday is scheduled, without walking the range."""
+    if last < first:
+        return 0
+    total = (last - first).days + 1
+    full_weeks, rest = divmod(total, 7)
+    count = full_weeks * len(weekdays)
+    for offset in range(rest):
+        if (first + timedelta(days=full_weeks * 7 + offset)).weekday() in weekdays:
+            count += 1
+    return count
+
+
+# ----------------------------
+# Incremental write path
+# ----------------------------
+def add_completions(
+    session: Session,
+    user_id: int,
+    completions: Iterable[Tuple[int, date, Optional[float]]],
+) -> None:
+    """Add (habit_id, completed_date, quantity_value) to every period's rollup; one upsert executemany."""
+    deltas: Deltas = defaultdict(lambda: [0, 0.0])
+    for habit_id, day, quantity in completions:
+        for period in PERIODS:
+            delta = deltas[(habit_id, period, period_start(period, day))]
+            delta[0] += 1
+            delta[1] += quantity or 0.0
+    if not deltas:
+        return
+
+    rows = [
+        {"habit_id": habit_id, "user_id": user_id, "period": period, "period_start": start,
+         "completions": n, "quantity_total": quantity}
+        for (habit_id, period, start), (n, quantity) in deltas.items()
+    ]
+    upsert = dialect_insert(session)
+    if upsert is not None:
+        table = CompletionRollup.__table__
+        stmt = upsert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["habit_id", "period", "period_start"],
+            set_={
+                "completions": table.c.completions + stmt.excluded.completions,
+                "quantity_total": table.c.quantity_total + stmt.excluded.quantity_total,
+            },
+        )
+        session.execute(stmt, rows)  # executemany: no parameter-limit ceiling on big imports
+        return
+
+    habit_ids = {row["habit_id"] for row in rows}
+    existing = {
+        (r.habit_id, r.period, r.period_start): r
+        for r in session.exec(
+            select(CompletionRollup)
+            .where(CompletionRollup.habit_id.in_(habit_ids))
+            .with_for_update()
+        )
+    }
+    for row in rows:
+        current = existing.get((row["habit_id"], row["period"], row["period_start"]))
+        if current is None:
+            session.add(CompletionRollup(**row))
+        else:
+            current.completions += row["completions"]
+            current.quantity_total += row["quantity_total"]
+            session.add(current)
+
+
+def delete_for_habit(session: Session, habit_id: int) -> None:
+    session.execute(delete(CompletionRollup).where(CompletionRollup.habit_id == habit_id))
+
+
+# ----------------------------
+# Bulk rebuild (NumPy)
+# ----------------------------
+def rebuild(session: Session, user_id: Optional[int] = None) -> int:
+    """Drop and regenerate rollups from completions. Returns rows written."""
+    import numpy as np
+
+    stmt = delete(CompletionRollup)
+    query = select(Completion.user_id, Completion.habit_id, Completion.completed_date, Completion.quantity_value)
+    if user_id is not None:
+        stmt = stmt.where(CompletionRollup.user_id == user_id)
+        query = query.where(Completion.user_id == user_id)
+    session.execute(stmt)
+
+    rows = session.exec(query).all()
+    if not rows:
+        return 0
+    owners, habit_ids, days, quantities = zip(*rows)
+    owners = np.asarray(owners, dtype=np.int64)
+    habit_ids = np.asarray(habit_ids, dtype=np.int64)
+    days = np.asarray(days, dtype="datetime64[D]")
+    quantities = np.nan_to_num(np.asarray(quantities, dtype=np.float64))  # None -> nan -> 0
+
+    day_numbers = days.astype(np.int64)  # days since 1970-01-01, a Thursday
+    starts = {
+        "day": day_numbers,
+        "week": day_numbers - (day_numbers + 3) % 7,
+        "month": days.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64),
+    }
+
+    epoch = date(1970, 1, 1)
+    written = 0
+    for period, start_numbers in starts.items():
+        # One group per (habit, period start): bincount does the sums in C.
+        keys = np.stack([habit_ids, start_numbers], axis=1)
+        groups, first_index, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(groups))
+        totals = np.bincount(inverse, weights=quantities, minlength=len(groups))
+        session.execute(
+            insert(CompletionRollup.__table__),
+            [
+                {"habit_id": int(habit_id), "user_id": int(owner), "period": period,
+                 "period_start": epoch + timedelta(days=int(start)),
+                 "completions": int(n), "quantity_total": float(total)}
+                for (habit_id, start), owner, n, total in zip(
+                    groups.tolist(), owners[first_index].tolist(), counts.tolist(), totals.tolist()
+                )
+            ],
+        )
+        written += len(groups)
+    return written
+
+
+# ----------------------------
+# Read path (GET /api/stats)
+# ----------------------------
+def _rate(completions: int, scheduled: int) -> Optional[float]:
+    return round(min(completions / scheduled, 1.0), 4) if scheduled else None
+
+
+def stats(
+    session: Session,
+    user_id: int,
+    period: str,
+    first: date,
+    last: date,
+    habit_id: Optional[int] = None,
+) -> Dict:
+    """
+    Progress analytics between `first` and `last` (inclusive) at `period` resolution.
+    Two queries: the user's habits and their rollup rows, plus one for day rollups
+    when `first` or `last` cuts a week or month, so an edge period only counts the
+    completions inside the range. Scheduled-day counts (the denominator of
+    completion rates) come from each habit's schedule.
+    """
+    habit_query = select(Habit).where(Habit.user_id == user_id).order_by(Habit.id)
+    if habit_id is not None:
+        habit_query = habit_query.where(Habit.id == habit_id)
+    habits = session.exec(habit_query).all()
+
+    first_start = period_start(period, first)
+    rollup_query = select(
+        CompletionRollup.habit_id, CompletionRollup.period_start,
+        CompletionRollup.completions, CompletionRollup.quantity_total,
+    ).where(
+        CompletionRollup.user_id == user_id,
+        CompletionRollup.period == period,
+        CompletionRollup.period_start >= first_start,
+        CompletionRollup.period_start <= last,
+    )
+    if habit_id is not None:
+        rollup_query = rollup_query.where(CompletionRollup.habit_id == habit_id)
+    cells = {(h, start): (n, q) for h, start, n, q in session.exec(rollup_query)}
+
+    starts = []
+    start = first_start
+    while start <= last:
+        starts.append(start)
+        start = next_period_start(period, start)
+
+    # Edge periods the range only partly covers: period start -> clipped [lo, hi].
+    clipped = {}
+    for s in starts:
+        end = next_period_start(period, s) - timedelta(days=1)
+        if s < first or end > last:
+            clipped[s] = (max(s, first), min(end, last))
+    if clipped:
+        day_query = select(
+            CompletionRollup.habit_id, CompletionRollup.period_start,
+            CompletionRollup.completions, CompletionRollup.quantity_total,
+        ).where(
+            CompletionRollup.user_id == user_id,
+            CompletionRollup.period == "day",
+            or_(*(CompletionRollup.period_start.between(lo, hi) for lo, hi in clipped.values())),
+        )
+        if habit_id is not None:
+            day_query = day_query.where(CompletionRollup.habit_id == habit_id)
+        cells = {key: value for key, value in cells.items() if key[1] not in clipped}
+        for h, day, n, q in session.exec(day_query):
+            key = (h, period_start(period, day))
+            total_n, total_q = cells.get(key, (0, 0.0))
+            cells[key] = (total_n + n, total_q + q)
+
+    series = {s: {"period_start": s, "completions": 0, "scheduled": 0, "by_category": defaultdict(int)} for s in starts}
+    categories: Dict[str, Dict] = {}
+    habit_rows = []
+    for habit in habits:
+        weekdays = habit_weekdays(habit)
+        # Days before the habit existed are not counted against it.
+        began = habit.started_at or habit.created_at.date()
+        row = {
+            "habit_id": habit.id,
+            "name": habit.name,
+            "category": habit.category,
+            "status": habit.status,
+            "quantity_unit": habit.quantity_unit,
+            "completions": 0,
+            "quantity_total": 0.0,
+            "scheduled": 0,
+            "current_streak": habit.streak,
+            "longest_streak": habit.longest_streak,
+        }
+        for s in starts:
+            n, quantity = cells.get((habit.id, s), (0, 0.0))
+            # A period may be partial at either end of the requested range, and days before
+            # the habit began only count when the period was back-filled.
+            lo = max(s, first) if n else max(s, first, began)
+            scheduled = scheduled_days(weekdays, lo, min(next_period_start(period, s) - timedelta(days=1), last))
+            row["completions"] += n
+            row["quantity_total"] += quantity
+            row["scheduled"] += scheduled
+            bucket = series[s]
+            bucket["completions"] += n
+            bucket["scheduled"] += scheduled
+            if n:
+                bucket["by_category"][habit.category] += n
+        row["completion_rate"] = _rate(row["completions"], row["scheduled"])
+        habit_rows.append(row)
+
+        cat = categories.setdefault(
+            habit.category,
+            {"category": habit.category, "completions": 0, "scheduled": 0, "quantity_by_unit": defaultdict(float)},
+        )
+        cat["completions"] += row["completions"]
+        cat["scheduled"] += row["scheduled"]
+        if habit.quantity_unit and row["quantity_total"]:
+            cat["quantity_by_unit"][habit.quantity_unit] += row["quantity_total"]
+
+    for cat in categories.values():
+        cat["completion_rate"] = _rate(cat["completions"], cat["scheduled"])
+    for bucket in series.values():
+        bucket["completion_rate"] = _rate(bucket["completions"], bucket["scheduled"])
+
+    completions = sum(r["completions"] for r in habit_rows)
+    scheduled = sum(r["scheduled"] for r in habit_rows)
+    return {
+        "period": period,
+        "from": first,
+        "to": last,
+        "totals": {
+            "completions": completions,
+            "scheduled": scheduled,
+            "completion_rate": _rate(completions, scheduled),
+            "best_streak": max((h.longest_streak or 0 for h in habits), default=0),
+        },
+        "habits": habit_rows,
+        "categories": sorted(categories.values(), key=lambda c: c["category"]),
+        "series": [series[s] for s in starts],
+    }
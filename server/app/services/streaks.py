@@ -0,0 +1,159 @@
+# server/app/services/streaks.py
+"""
+Streak engine.
+
+A habit's streak is the number of completions in the current unbroken run. A run
+breaks only when a *scheduled* day passes without a completion; days outside
+`frequency_pattern["days"]` are free, so a Mon/Wed/Fri habit done on each of
+those days keeps its streak across the gaps (and a bonus completion on a Tuesday
+still counts).
+
+Stored on Habit and maintained on write:
+  current_streak       run length ending at last_completed_date
+  longest_streak       best run ever
+  last_completed_date  latest completion
+
+The common write (a completion newer than last_completed_date) is an O(1) update;
+back-filled dates fall back to a full recompute over the habit's completion
+bitsets (one small row per year, see bitsets.py). Reads are O(1) via streak_as_of,
+which only has to check whether a scheduled day was missed since the last completion.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from ..models import Completion, Habit
+from . import bitsets
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+EVERY_DAY: FrozenSet[int] = frozenset(range(7))
+
+
+def scheduled_weekdays(frequency_type: Optional[str], frequency_pattern: Optional[dict]) -> FrozenSet[int]:
+    """Weekday indexes (Mon=0, like date.weekday()) the habit is due on."""
+    if frequency_type == "daily" or not frequency_pattern:
+        return EVERY_DAY
+    days = set()
+    for raw in frequency_pattern.get("days") or ():
+        name = str(raw).strip().lower()[:3]
+        if not name:
+            continue
+        for i, weekday in enumerate(WEEKDAYS):
+            if weekday.startswith(name):
+                days.add(i)
+    # An empty or unparseable pattern would make every day optional; treat it as daily instead.
+    return frozenset(days) or EVERY_DAY
+
+
+def habit_weekdays(habit: Any) -> FrozenSet[int]:
+    return scheduled_weekdays(habit.frequency_type, habit.frequency_pattern)
+
+
+def previous_scheduled_day(day: date, weekdays: FrozenSet[int]) -> date:
+    """Latest scheduled day strictly before `day`."""
+    for back in range(1, 8):
+        candidate = day - timedelta(days=back)
+        if candidate.weekday() in weekdays:
+            return candidate
+    return day - timedelta(days=1)
+
+
+def continues_run(previous: date, day: date, weekdays: FrozenSet[int]) -> bool:
+    """True if going from a completion on `previous` to one on `day` skips no scheduled day."""
+    return previous_scheduled_day(day, weekdays) <= previous
+
+
+def compute_streaks(dates: Iterable[date], weekdays: FrozenSet[int]) -> Tuple[int, int, Optional[date]]:
+    """Full scan: (current run ending at the last date, longest run, last date)."""
+    current = longest = 0
+    last: Optional[date] = None
+    for day in sorted(set(dates)):
+        current = current + 1 if last is not None and continues_run(last, day, weekdays) else 1
+        longest = max(longest, current)
+        last = day
+    return current, longest, last
+
+
+def streak_as_of(habit: Any, today: date) -> int:
+    """
+    O(1) read of the live streak: the stored run, unless a scheduled day between the
+    last completion and `today` went by undone. Today itself never breaks a streak;
+    there is still time to do it.
+    """
+    return live_streak(habit.current_streak, habit.last_completed_date, habit_weekdays(habit), today)
+
+
+def live_streak(current: Optional[int], last: Optional[date], weekdays: FrozenSet[int], today: date) -> int:
+    """streak_as_of over the bare column values."""
+    if last is None or not current:
+        return 0
+    if last >= today or continues_run(last, today, weekdays):
+        return current
+    return 0
+
+
+def live_since(today: date) -> date:
+    """Oldest last_completed_date that can still carry a live streak: every schedule has a day in the past week."""
+    return today - timedelta(days=7)
+
+
+def apply_completion(habit: Any, day: date) -> bool:
+    """
+    Incremental update for a new completion on `day`. Returns False when the date is
+    older than last_completed_date (a back-fill), which needs recompute_streaks.
+    """
+    return apply_completions(habit, (day,))
+
+
+def apply_completions(habit: Any, days: Iterable[date]) -> bool:
+    """
+    apply_completion over ascending `days`, working on locals and assigning the
+    habit's fields once (model attribute writes are not cheap on big imports).
+    Returns False, leaving the habit untouched, if any day is a back-fill.
+    """
+    last = habit.last_completed_date
+    current = habit.current_streak or 0
+    longest = habit.longest_streak or 0
+    weekdays = habit_weekdays(habit)
+    for day in days:
+        if last is not None and day <= last:
+            return False
+        current = current + 1 if last is not None and current and continues_run(last, day, weekdays) else 1
+        longest = max(longest, current)
+        last = day
+    habit.current_streak, habit.longest_streak, habit.last_completed_date = current, longest, last
+    return True
+
+
+def recompute_streaks(session: Session, habit: Any) -> None:
+    """Rebuild the stored streak fields by walking the habit's bitsets (sync Session; use run_sync)."""
+    dates = bitsets.all_days(session, habit.id)
+    habit.current_streak, habit.longest_streak, habit.last_completed_date = compute_streaks(
+        dates, habit_weekdays(habit)
+    )
+    session.add(habit)
+
+
+def rebuild_all_streaks(session: Session, user_id: Optional[int] = None) -> int:
+    """Recompute every habit (optionally one user's) in two queries. Returns habits updated."""
+    habit_query = select(Habit)
+    completion_query = select(Completion.habit_id, Completion.completed_date)
+    if user_id is not None:
+        habit_query = habit_query.where(Habit.user_id == user_id)
+        completion_query = completion_query.where(Completion.user_id == user_id)
+
+    dates_by_habit: Dict[int, List[date]] = defaultdict(list)
+    for habit_id, day in session.exec(completion_query):
+        dates_by_habit[habit_id].append(day)
+
+    habits = session.exec(habit_query).all()
+    for habit in habits:
+        habit.current_streak, habit.longest_streak, habit.last_completed_date = compute_streaks(
+            dates_by_habit.get(habit.id, ()), habit_weekdays(habit)
+        )
+        session.add(habit)
+    return len(habits)
@@ -0,0 +1,116 @@
+# server/app/services/user_search.py
+"""
+Case-insensitive prefix search over users' names and emails.
+
+Each user row carries search keys: name and email NFKC-normalized, case-folded
+and whitespace-collapsed (`normalize`), stored in indexed columns that compare
+bytewise. A prefix match on a key is then a plain index range,
+
+    key >= 'ann' AND key < 'ano'
+
+which SQLite and Postgres both answer with a B-tree range scan, where
+lower(name) LIKE 'ann%' would scan the table. Name and email are searched as two
+such ranges, each limited before they are merged, and existing friends are
+filtered inside the ranges by a probe of the friendship pair index.
+
+register and update_me keep the keys current (`set_keys`); `backfill` fills them
+for rows written before the columns existed.
+"""
+from __future__ import annotations
+
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, case, exists, literal, union_all, update
+from sqlmodel import Session, select
+
+from ..models import Friendship, User
+
+
+def normalize(text: Optional[str]) -> Optional[str]:
+    """The search key for `text`: NFKC, case-folded, single-spaced (None if blank)."""
+    if text is None:
+        return None
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split()) or None
+
+
+def set_keys(user: User) -> None:
+    user.search_name = normalize(user.name)
+    user.search_email = normalize(user.email)
+
+
+def _successor(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with `prefix` (None if unbounded)."""
+    while prefix and prefix[-1] == "\U0010ffff":
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    following = ord(prefix[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000  # surrogates cannot be encoded; U+E000 is the next code point after U+D7FF
+    return prefix[:-1] + chr(following)
+
+
+def _matches(column: Any, key: str, rank: int, viewer: int, limit: int):
+    low = case((User.id < viewer, User.id), else_=viewer)
+    high = case((User.id < viewer, viewer), else_=User.id)
+    stmt = (
+        select(User.id, User.name, column.label("key"), literal(rank).label("rank"))
+        .where(
+            column >= key,
+            User.id != viewer,
+            # One probe of uq_friendship_pair per candidate.
+            ~exists().where(Friendship.user_low_id == low, Friendship.user_high_id == high),
+        )
+        .order_by(column, User.id)
+        .limit(limit)
+    )
+    upper = _successor(key)
+    if upper is not None:
+        stmt = stmt.where(column < upper)
+    return stmt.subquery()
+
+
+def search(session: Session, viewer: int, q: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Up to `limit` non-friends whose name or email starts with `q` (case-insensitive):
+    name matches first, then email matches, each in key order. One query.
+    """
+    key = normalize(q)
+    if key is None:
+        return []
+    by_name = _matches(User.search_name, key, 0, viewer, limit)
+    by_email = _matches(User.search_email, key, 1, viewer, limit)
+    merged = union_all(select(by_name), select(by_email)).subquery()
+    rows = session.execute(
+        select(merged.c.id, merged.c.name).order_by(merged.c.rank, merged.c.key, merged.c.id)
+    ).all()
+
+    found: Dict[int, Dict[str, Any]] = {}
+    for user_id, name in rows:
+        found.setdefault(user_id, {"id": user_id, "name": name})
+    return list(found.values())[:limit]
+
+
+def backfill(session: Session, batch_size: int = 1000) -> int:
+    """Recompute every user's search keys in batches. Returns users updated."""
+    table = User.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(search_name=bindparam("b_name"), search_email=bindparam("b_email"))
+    )
+    total = 0
+    after = 0
+    while True:
+        users = session.execute(
+            select(User.id, User.name, User.email).where(User.id > after).order_by(User.id).limit(batch_size)
+        ).all()
+        if not users:
+            return total
+        session.execute(stmt, [
+            {"b_id": user_id, "b_name": normalize(name), "b_email": normalize(email)}
+            for user_id, name, email in users
+        ])
+        total += len(users)
+        after = users[-1].id
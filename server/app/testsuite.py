@@ -1,9 +1,16 @@
 import os
+import time
 import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from datetime import date
 from typing import Optional, Dict, Any, List, Tuple
 
 import httpx
+import orjson
+from websockets.exceptions import InvalidStatus
+from websockets.sync.client import connect as ws_connect
 
 BASE_URL = os.environ.get("BASE_URL", "http://127.0.0.1:8000")
 
@@ -19,11 +26,30 @@ def assert_status(resp: httpx.Response, expected: int, msg: str = ""):
         raise AssertionError(
             f"{msg}\nExpected {expected}, got {resp.status_code}\nBody: {resp.text}"
         )
-def api_print_db(client):
-    r = client.get(f"{BASE_URL}/api/debug/print-db")
-    assert_status(r, 200)
+def api_print_db(client, page_size: int = 20, full: bool = False):
+    """Row counts per table plus the first page of each; `full=True` streams the whole dump."""
     print("\n===== DATABASE STATE =====")
-    print(r.json())
+    if full:
+        with client.stream("GET", f"{BASE_URL}/api/debug/print-db") as r:
+            if r.status_code != 200:
+                r.read()
+            assert_status(r, 200)
+            for chunk in r.iter_text():
+                print(chunk, end="")
+        print()
+        return
+
+    r = client.get(f"{BASE_URL}/api/debug/summary")
+    assert_status(r, 200)
+    for table, info in r.json().items():
+        print(f"{table}: {info['rows']} rows")
+        if info["rows"]:
+            rp = client.get(f"{BASE_URL}/api/debug/tables/{table}", params={"limit": page_size})
+            assert_status(rp, 200)
+            for row in rp.json()["rows"]:
+                print(f"  {row}")
+            if rp.json()["next_cursor"]:
+                print(f"  ... ({info['rows'] - page_size} more)")
 
 def pretty(resp: httpx.Response) -> str:
     return f"{resp.status_code} {resp.text}"
@@ -123,6 +149,14 @@ def api_list_completions(client: httpx.Client, token: str, habit_id: int) -> htt
         headers=auth_headers(token),
     )
 
+def api_dashboard_today(client: httpx.Client, token: str, on: Optional[str] = None) -> httpx.Response:
+    params = {"on": on} if on else None
+    return client.get(f"{BASE_URL}/api/dashboard/today", params=params, headers=auth_headers(token))
+
+def api_stats(client: httpx.Client, token: str, period: str, date_from: str, date_to: str) -> httpx.Response:
+    params = {"period": period, "from": date_from, "to": date_to}
+    return client.get(f"{BASE_URL}/api/stats", params=params, headers=auth_headers(token))
+
 def api_send_friend_request(client: httpx.Client, token: str, receiver_id: int, message: Optional[str] = None) -> httpx.Response:
     params = {"receiver_id": receiver_id}
     if message is not None:
@@ -133,11 +167,16 @@ def api_send_friend_request(client: httpx.Client, token: str, receiver_id: int,
         headers=auth_headers(token),
     )
 
-def api_inbox(client: httpx.Client, token: str) -> httpx.Response:
-    return client.get(f"{BASE_URL}/api/friends/requests/inbox", headers=auth_headers(token))
+def api_inbox(client: httpx.Client, token: str, status: Optional[str] = None) -> httpx.Response:
+    params = {"status": status} if status else None
+    return client.get(f"{BASE_URL}/api/friends/requests/inbox", params=params, headers=auth_headers(token))
+
+def api_outbox(client: httpx.Client, token: str, status: Optional[str] = None) -> httpx.Response:
+    params = {"status": status} if status else None
+    return client.get(f"{BASE_URL}/api/friends/requests/outbox", params=params, headers=auth_headers(token))
 
-def api_outbox(client: httpx.Client, token: str) -> httpx.Response:
-    return client.get(f"{BASE_URL}/api/friends/requests/outbox", headers=auth_headers(token))
+def api_request_counts(client: httpx.Client, token: str) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/friends/requests/count", headers=auth_headers(token))
 
 def api_accept_request(client: httpx.Client, token: str, request_id: int) -> httpx.Response:
     return client.post(f"{BASE_URL}/api/friends/requests/{request_id}/accept", headers=auth_headers(token))
@@ -151,10 +190,156 @@ def api_cancel_request(client: httpx.Client, token: str, request_id: int) -> htt
 def api_list_friends(client: httpx.Client, token: str) -> httpx.Response:
     return client.get(f"{BASE_URL}/api/friends", headers=auth_headers(token))
 
+def api_friends_detail(client: httpx.Client, token: str) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/friends/detail", headers=auth_headers(token))
+
+def api_friend_suggestions(client: httpx.Client, token: str, limit: int = 20) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/friends/suggestions", params={"limit": limit}, headers=auth_headers(token))
+
+def api_search_users(client: httpx.Client, token: str, q: str) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/users/search", params={"q": q}, headers=auth_headers(token))
+
 def api_unfriend(client: httpx.Client, token: str, friend_id: int) -> httpx.Response:
     return client.delete(f"{BASE_URL}/api/friends/{friend_id}", headers=auth_headers(token))
 
 
+def api_complete_batch(client: httpx.Client, token: str, items: List[Dict[str, Any]]) -> httpx.Response:
+    return client.post(f"{BASE_URL}/api/completions/batch", json={"items": items}, headers=auth_headers(token))
+
+
+def api_sync(client: httpx.Client, token: str, since: Optional[str] = None) -> httpx.Response:
+    params = {"since": since} if since else None
+    return client.get(f"{BASE_URL}/api/sync", params=params, headers=auth_headers(token))
+
+
+def api_import(client: httpx.Client, token: str, body: str, content_type: str = "application/x-ndjson") -> httpx.Response:
+    return client.post(
+        f"{BASE_URL}/api/import", content=body.encode(), headers={**auth_headers(token), "Content-Type": content_type}
+    )
+
+
+def api_feed(client: httpx.Client, token: str, limit: Optional[int] = None, cursor: Optional[str] = None) -> httpx.Response:
+    params = {k: v for k, v in (("limit", limit), ("cursor", cursor)) if v is not None}
+    return client.get(f"{BASE_URL}/api/feed", params=params or None, headers=auth_headers(token))
+
+def wait_for_feed(client: httpx.Client, token: str, count: int, timeout: float = 5.0) -> List[Dict[str, Any]]:
+    """Poll the feed until it has `count` items: the fan-out worker fills it in the background."""
+    deadline = time.monotonic() + timeout
+    while True:
+        items = api_feed(client, token).json()
+        if len(items) >= count or time.monotonic() > deadline:
+            return items
+        time.sleep(0.05)
+
+
+def api_leaderboard(client: httpx.Client, token: str, week: Optional[str] = None) -> httpx.Response:
+    params = {"week": week} if week else None
+    return client.get(f"{BASE_URL}/api/leaderboard", params=params, headers=auth_headers(token))
+
+
+def db_queries(resp: httpx.Response) -> int:
+    """Statements the server ran for this request (X-DB-Queries)."""
+    assert "X-DB-Queries" in resp.headers, f"no X-DB-Queries header on {resp.request.url}"
+    return int(resp.headers["X-DB-Queries"])
+
+def debug_enabled(client: httpx.Client) -> bool:
+    return client.get(f"{BASE_URL}/api/debug/summary").status_code == 200
+
+
+def api_password_hash_info(client: httpx.Client, user_id: int) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/debug/users/{user_id}/password-hash")
+
+
+def api_calendar(client: httpx.Client, token: str, habit_id: int, year: int, month: Optional[int] = None) -> httpx.Response:
+    params = {"year": year} if month is None else {"year": year, "month": month}
+    return client.get(f"{BASE_URL}/api/completions/habits/{habit_id}/calendar", params=params, headers=auth_headers(token))
+
+
+def api_completions_page(client: httpx.Client, token: str, habit_id: int, **params: Any) -> httpx.Response:
+    """One page of a habit's completions; `from_`/`to` map onto the from/to query parameters."""
+    if "from_" in params:
+        params["from"] = params.pop("from_")
+    return client.get(
+        f"{BASE_URL}/api/completions/habits/{habit_id}/completions",
+        params={k: v for k, v in params.items() if v is not None},
+        headers=auth_headers(token),
+    )
+
+def follow_pages(fetch, **params: Any) -> List[List[Dict[str, Any]]]:
+    """Every page of a cursor-paginated list, following X-Next-Cursor until it is absent."""
+    pages, cursor = [], None
+    while True:
+        r = fetch(cursor=cursor, **params)
+        assert_status(r, 200, "Page failed")
+        pages.append(r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+        assert len(pages) < 100, "X-Next-Cursor never ends"
+
+
+def api_me(client: httpx.Client, token: str) -> httpx.Response:
+    return client.get(f"{BASE_URL}/api/auth/me", headers=auth_headers(token))
+
+def api_update_me(client: httpx.Client, token: str, patch: Dict[str, Any]) -> httpx.Response:
+    return client.patch(f"{BASE_URL}/api/auth/me", json=patch, headers=auth_headers(token))
+
+
+def api_metrics(client: httpx.Client) -> Dict[str, float]:
+    """/metrics as {'name{labels}': value}, plus '# TYPE name' -> 1.0 for each declared metric."""
+    r = client.get(f"{BASE_URL}/metrics")
+    assert_status(r, 200, "/metrics failed")
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4"), r.headers["content-type"]
+    series: Dict[str, float] = {}
+    for line in r.text.splitlines():
+        if line.startswith("# TYPE "):
+            series["# TYPE " + line.split()[2]] = 1.0
+        elif line and not line.startswith("#"):
+            key, _, value = line.rpartition(" ")
+            series[key] = float(value)
+    return series
+
+def wait_for_metric(client: httpx.Client, key: str, at_least: float, timeout: float = 2.0) -> Dict[str, float]:
+    """
+    Scrape until series `key` reaches `at_least`: the middleware counts a request once
+    its response has been sent, so the client can see the response first.
+    """
+    deadline = time.monotonic() + timeout
+    series = api_metrics(client)
+    while series.get(key, 0) < at_least and time.monotonic() < deadline:
+        time.sleep(0.02)
+        series = api_metrics(client)
+    return series
+
+
+def metric_total(series: Dict[str, float], name: str, **labels: str) -> float:
+    """Sum of `name` over every series carrying `labels` (e.g. across both pool engines)."""
+    wanted = [f'{k}="{v}"' for k, v in labels.items()]
+    return sum(
+        value for key, value in series.items()
+        if key.split("{", 1)[0] == name and all(label in key for label in wanted)
+    )
+
+
+def api_export(client: httpx.Client, token: str, fmt: str, tables: Optional[List[str]] = None) -> httpx.Response:
+    params: Dict[str, Any] = {"format": fmt}
+    if tables:
+        params["tables"] = tables
+    return client.get(f"{BASE_URL}/api/export", params=params, headers=auth_headers(token))
+
+
+def ws_events(token: Optional[str] = None):
+    url = BASE_URL.replace("http", "ws", 1) + "/api/events/ws"
+    return ws_connect(url + (f"?token={token}" if token else ""), open_timeout=5)
+
+def ws_next(ws, timeout: float = 5.0) -> Dict[str, Any]:
+    """Next pushed event, skipping heartbeats."""
+    while True:
+        event = orjson.loads(ws.recv(timeout=timeout))
+        if event["type"] != "keepalive":
+            return event
+
+
 # ----------------------------
 # Tests
 # ----------------------------
@@ -290,6 +475,57 @@ def test_completions_happy_and_edges(client: httpx.Client):
     print("✅ test_completions_happy_and_edges passed")
 
 
+def test_dashboard_today(client: httpx.Client):
+    e = f"{_u('u')}@example.com"
+    r, d = api_register(client, e, "Password123!", "User")
+    assert_status(r, 201)
+    token = d["access_token"]
+
+    hids = [api_create_habit(client, token, name).json()["id"] for name in ("Read", "Run", "Stretch")]
+    date_str = "2026-02-22"
+    assert_status(api_complete_habit(client, token, hids[0], date_str), 201)
+
+    rd = api_dashboard_today(client, token, date_str)
+    assert_status(rd, 200, "Dashboard failed")
+    data = rd.json()
+    by_id = {h["id"]: h for h in data["habits"]}
+    assert set(hids) <= set(by_id), "Dashboard missing active habits"
+    assert by_id[hids[0]]["completed"] and not by_id[hids[1]]["completed"], "Wrong completion flags"
+    assert by_id[hids[0]]["streak"] == 1, f"Expected streak 1, got {by_id[hids[0]]['streak']}"
+    assert data["completed_count"] == 1 and data["scheduled_count"] == 3
+    assert data["completion_percentage"] == 33.3, f"Unexpected percentage {data['completion_percentage']}"
+
+    print("✅ test_dashboard_today passed")
+
+
+def test_stats_periods(client: httpx.Client):
+    r, d = api_register(client, f"{_u('u')}@example.com", "Password123!", "User")
+    assert_status(r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Read").json()["id"]
+    # Mon, Wed and Sun of one week
+    for day in ("2025-01-06", "2025-01-08", "2025-01-12"):
+        assert_status(api_complete_habit(client, token, hid, day), 201)
+
+    # Whole week -> all three completions over seven scheduled days
+    rs = api_stats(client, token, "week", "2025-01-06", "2025-01-12")
+    assert_status(rs, 200, "Stats failed")
+    totals = rs.json()["totals"]
+    assert (totals["completions"], totals["scheduled"]) == (3, 7), f"Unexpected totals: {pretty(rs)}"
+
+    # Wed..Fri cuts the week: only Wednesday's completion counts against three days
+    rs = api_stats(client, token, "week", "2025-01-08", "2025-01-10")
+    assert_status(rs, 200, "Stats failed")
+    data = rs.json()
+    assert (data["totals"]["completions"], data["totals"]["scheduled"]) == (1, 3), f"Unexpected totals: {pretty(rs)}"
+    assert data["series"][0]["completions"] == 1 and data["habits"][0]["completion_rate"] == 0.3333
+
+    # from after to -> 400
+    assert_status(api_stats(client, token, "week", "2025-01-10", "2025-01-08"), 400)
+
+    print("✅ test_stats_periods passed")
+
+
 def test_friends_flow_and_edges(client: httpx.Client):
     p = "Password123!"
     e1 = f"{_u('alice')}@example.com"
@@ -305,6 +541,16 @@ def test_friends_flow_and_edges(client: httpx.Client):
     alice_token = a["access_token"]
     bob_token = b["access_token"]
 
+    # Bob is findable by email prefix, case-insensitively
+    found = api_search_users(client, alice_token, e2.split("@")[0].upper())
+    assert_status(found, 200)
+    assert [u["id"] for u in found.json()] == [bob_id], f"Unexpected search results: {pretty(found)}"
+
+    # A prefix ending just below the surrogate range is still a valid range query
+    edge = api_search_users(client, alice_token, "a\ud7ff")
+    assert_status(edge, 200)
+    assert edge.json() == [], f"Unexpected search results: {pretty(edge)}"
+
     # Self-request -> 400
     self_req = api_send_friend_request(client, alice_token, alice_id)
     assert_status(self_req, 400, "Expected 400 on self friend request")
@@ -323,6 +569,14 @@ def test_friends_flow_and_edges(client: httpx.Client):
     assert_status(inbox, 200)
     assert any(fr["id"] == req_id for fr in inbox.json()), "Request not found in inbox"
 
+    # ... among the pending ones, and in the pending count
+    pending = api_inbox(client, bob_token, status="pending")
+    assert_status(pending, 200)
+    assert [fr["id"] for fr in pending.json()] == [req_id], f"Unexpected pending inbox: {pretty(pending)}"
+    counts = api_request_counts(client, bob_token)
+    assert_status(counts, 200)
+    assert counts.json()["pending_received"] == 1, f"Unexpected counts: {pretty(counts)}"
+
     # Alice outbox has it
     outbox = api_outbox(client, alice_token)
     assert_status(outbox, 200)
@@ -348,6 +602,22 @@ def test_friends_flow_and_edges(client: httpx.Client):
     assert bob_id in fl_a.json(), "Bob missing from Alice friends list"
     assert alice_id in fl_b.json(), "Alice missing from Bob friends list"
 
+    # Friend details: one entry per friend, with profile and activity
+    detail = api_friends_detail(client, alice_token)
+    assert_status(detail, 200)
+    assert [f["id"] for f in detail.json()] == [bob_id], f"Unexpected friend details: {pretty(detail)}"
+    assert detail.json()[0]["name"] == "Bob"
+
+    # Suggestions never include existing friends or the user
+    sg = api_friend_suggestions(client, alice_token)
+    assert_status(sg, 200)
+    assert not {s["id"] for s in sg.json()} & {alice_id, bob_id}, f"Friends in suggestions: {pretty(sg)}"
+
+    # Friends drop out of search results
+    found = api_search_users(client, alice_token, e2.split("@")[0])
+    assert_status(found, 200)
+    assert found.json() == [], f"Friend still in search results: {pretty(found)}"
+
     # Unfriend -> 200
     uf = api_unfriend(client, alice_token, bob_id)
     assert_status(uf, 200, "Unfriend failed")
@@ -359,6 +629,620 @@ def test_friends_flow_and_edges(client: httpx.Client):
     print("✅ test_friends_flow_and_edges passed")
 
 
+def test_push_events_ws(client: httpx.Client):
+    p = "Password123!"
+    a_r, a = api_register(client, f"{_u('alice')}@example.com", p, "Alice")
+    b_r, b = api_register(client, f"{_u('bob')}@example.com", p, "Bob")
+    assert_status(a_r, 201)
+    assert_status(b_r, 201)
+    alice_token, bob_token = a["access_token"], b["access_token"]
+    alice_id, bob_id = a["user"]["id"], b["user"]["id"]
+
+    # Bad token -> the handshake is refused
+    try:
+        ws_events("not-a-token").close()
+        raise AssertionError("Expected the WebSocket handshake to fail for a bad token")
+    except InvalidStatus as exc:
+        assert exc.response.status_code == 403, f"Unexpected handshake status: {exc.response.status_code}"
+
+    with ws_events(alice_token) as ws:
+        r = api_send_friend_request(client, bob_token, alice_id)
+        assert_status(r, 201)
+        ev = ws_next(ws)
+        assert ev["type"] == "friend_request.received" and ev["data"]["requester_id"] == bob_id, ev
+
+        assert_status(api_accept_request(client, alice_token, r.json()["id"]), 200)
+        ev = ws_next(ws)
+        assert ev == {"type": "friend.added", "data": {"friend_id": bob_id, "request_id": r.json()["id"]}}, ev
+
+        # The new friend's activity now reaches Alice's open connection
+        h = api_create_habit(client, bob_token, "Run")
+        assert_status(h, 201)
+        assert_status(api_complete_habit(client, bob_token, h.json()["id"], "2025-01-01"), 201)
+        ev = ws_next(ws)
+        assert ev["type"] == "friend.completed" and ev["data"]["user_id"] == bob_id, ev
+
+        assert_status(api_unfriend(client, bob_token, alice_id), 200)
+        ev = ws_next(ws)
+        assert ev == {"type": "friend.removed", "data": {"friend_id": bob_id}}, ev
+
+    print("✅ test_push_events_ws passed")
+
+
+def test_completion_batch(client: httpx.Client):
+    p = "Password123!"
+    r, d = api_register(client, f"{_u('u')}@example.com", p, "User")
+    o_r, other = api_register(client, f"{_u('other')}@example.com", p, "Other")
+    assert_status(r, 201)
+    assert_status(o_r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Read").json()["id"]
+    foreign = api_create_habit(client, other["access_token"], "Theirs").json()["id"]
+    assert_status(api_complete_habit(client, token, hid, "2026-03-01"), 201)
+
+    rb = api_complete_batch(client, token, [
+        {"habit_id": hid, "completed_date": "2026-03-02"},
+        {"habit_id": hid, "completed_date": "2026-03-02"},  # repeated in the batch
+        {"habit_id": hid, "completed_date": "2026-03-01"},  # already stored
+        {"habit_id": foreign, "completed_date": "2026-03-02"},  # someone else's habit
+    ])
+    assert_status(rb, 200, "Batch failed")
+    data = rb.json()
+    assert (data["created"], data["duplicate"], data["not_found"]) == (1, 2, 1), f"Unexpected counts: {pretty(rb)}"
+    assert [x["status"] for x in data["results"]] == ["created", "duplicate", "duplicate", "not_found"]
+    assert data["results"][0]["id"], "Created item missing its id"
+
+    # Nothing was written to the foreign habit, and the owner's list has both days
+    assert api_list_completions(client, other["access_token"], foreign).json() == []
+    assert len(api_list_completions(client, token, hid).json()) == 2
+
+    print("✅ test_completion_batch passed")
+
+
+
+def test_sync_deltas(client: httpx.Client):
+    r, d = api_register(client, f"{_u('u')}@example.com", "Password123!", "User")
+    assert_status(r, 201)
+    token = d["access_token"]
+    keep = api_create_habit(client, token, "Read").json()["id"]
+    drop = api_create_habit(client, token, "Run").json()["id"]
+
+    # First sync is a full snapshot
+    full = api_sync(client, token)
+    assert_status(full, 200, "Full sync failed")
+    assert full.json()["full"] is True
+    assert {h["id"] for h in full.json()["habits"]} == {keep, drop}, f"Unexpected snapshot: {pretty(full)}"
+    cursor = full.json()["cursor"]
+
+    # An update and a delete after the cursor
+    assert_status(api_update_habit(client, token, keep, {"name": "Read more"}), 200)
+    assert_status(api_delete_habit(client, token, drop), 204)
+
+    delta = api_sync(client, token, cursor)
+    assert_status(delta, 200, "Delta sync failed")
+    data = delta.json()
+    assert data["full"] is False and data["has_more"] is False
+    assert [(h["id"], h["name"]) for h in data["habits"]] == [(keep, "Read more")], f"Unexpected delta: {pretty(delta)}"
+    assert data["deleted"]["habits"] == [drop], f"Unexpected deletions: {pretty(delta)}"
+
+    # Nothing new since the latest cursor
+    again = api_sync(client, token, data["cursor"])
+    assert_status(again, 200)
+    assert again.json()["habits"] == [] and again.json()["deleted"]["habits"] == []
+
+    # Malformed cursor -> 400
+    assert_status(api_sync(client, token, "not-a-cursor"), 400, "Expected 400 on a malformed cursor")
+
+    print("✅ test_sync_deltas passed")
+
+
+
+def test_conditional_get(client: httpx.Client):
+    r, d = api_register(client, f"{_u('u')}@example.com", "Password123!", "User")
+    assert_status(r, 201)
+    token = d["access_token"]
+    assert_status(api_create_habit(client, token, "Read"), 201)
+
+    first = api_list_habits(client, token)
+    assert_status(first, 200)
+    etag = first.headers.get("etag")
+    assert etag, "List habits sent no ETag"
+
+    # Unchanged -> 304 with the same ETag and no body
+    cached = client.get(f"{BASE_URL}/api/habits/", headers={**auth_headers(token), "If-None-Match": etag})
+    assert_status(cached, 304, "Expected 304 for an unchanged habit list")
+    assert cached.headers.get("etag") == etag and not cached.content
+
+    # A write changes the version -> full 200 with a new ETag
+    assert_status(api_create_habit(client, token, "Run"), 201)
+    fresh = client.get(f"{BASE_URL}/api/habits/", headers={**auth_headers(token), "If-None-Match": etag})
+    assert_status(fresh, 200, "Expected 200 after a write")
+    assert fresh.headers.get("etag") != etag and len(fresh.json()) == 2
+
+    print("✅ test_conditional_get passed")
+
+
+
+def test_import_counts(client: httpx.Client):
+    r, d = api_register(client, f"{_u('u')}@example.com", "Password123!", "User")
+    assert_status(r, 201)
+    token = d["access_token"]
+    lines = [
+        {"type": "habit", "data": {"id": 7, "name": "Swim"}},
+        {"type": "completion", "data": {"habit_id": 7, "completed_date": "2025-06-01"}},
+        {"type": "completion", "data": {"habit_id": 7, "completed_date": "2025-06-02"}},
+        {"type": "completion", "data": {"habit_name": "swim", "completed_date": "2025-06-02"}},  # same day again
+        {"type": "completion", "data": {"habit_id": 999_999_999, "completed_date": "2025-06-03"}},  # no such habit
+        {"type": "completion", "data": {"habit_id": 7, "completed_date": "not-a-date"}},
+    ]
+    body = "\n".join(orjson.dumps(line).decode() for line in lines) + "\n"
+
+    ri = api_import(client, token, body)
+    assert_status(ri, 200, "Import failed")
+    rep = ri.json()
+    assert rep["rows_read"] == 6, f"Unexpected report: {pretty(ri)}"
+    assert (rep["habits_created"], rep["completions_created"], rep["completions_duplicate"]) == (1, 2, 1), pretty(ri)
+    assert rep["rows_invalid"] == 2 and sorted(e["line"] for e in rep["errors"]) == [5, 6]
+
+    habits = api_list_habits(client, token).json()
+    assert [h["name"] for h in habits] == ["Swim"]
+    assert len(api_list_completions(client, token, habits[0]["id"]).json()) == 2
+
+    # Importing the same file again adds nothing
+    again = api_import(client, token, body).json()
+    assert (again["habits_matched"], again["completions_created"], again["completions_duplicate"]) == (1, 0, 3), again
+
+    print("✅ test_import_counts passed")
+
+
+
+def test_friend_feed(client: httpx.Client):
+    p = "Password123!"
+    users = {}
+    for name in ("Alice", "Bob", "Cara"):
+        r, d = api_register(client, f"{_u(name.lower())}@example.com", p, name)
+        assert_status(r, 201)
+        users[name] = (d["access_token"], d["user"]["id"])
+    (alice_token, alice_id), (bob_token, bob_id), (cara_token, _) = users["Alice"], users["Bob"], users["Cara"]
+    for token, receiver_token, receiver_id in ((cara_token, alice_token, alice_id), (alice_token, bob_token, bob_id)):
+        req = api_send_friend_request(client, token, receiver_id)
+        assert_status(api_accept_request(client, receiver_token, req.json()["id"]), 200)
+
+    # Cara sees her friend Alice become friends with Bob; Alice's own feed does not
+    items = wait_for_feed(client, cara_token, 1)
+    assert [(i["verb"], i["actor_name"], i["subject_name"]) for i in items] == [("friended", "Bob", "Alice")], items
+
+    # Bob's completion reaches Alice once the worker has drained it, and not Cara
+    hid = api_create_habit(client, bob_token, "Run").json()["id"]
+    assert_status(api_complete_habit(client, bob_token, hid, "2026-01-05"), 201)
+    items = wait_for_feed(client, alice_token, 1)
+    assert [(i["actor_name"], i["verb"], i["habit_name"]) for i in items] == [("Bob", "completed", "Run")], items
+
+    # A batch of several days is one entry per habit
+    rb = client.post(
+        f"{BASE_URL}/api/completions/batch",
+        json={"items": [{"habit_id": hid, "completed_date": f"2026-01-0{n}"} for n in (6, 7, 8)]},
+        headers=auth_headers(bob_token),
+    )
+    assert_status(rb, 200)
+    items = wait_for_feed(client, alice_token, 2)
+    assert len(items) == 2 and items[0]["habit_name"] == "Run", f"Unexpected feed: {items}"
+    assert len(api_feed(client, cara_token).json()) == 1, "Bob's completions leaked to a non-friend"
+
+    # Pagination: newest first, cursor in X-Next-Cursor
+    page1 = api_feed(client, alice_token, limit=1)
+    assert_status(page1, 200)
+    cursor = page1.headers.get("x-next-cursor")
+    assert page1.json()[0]["id"] == items[0]["id"] and cursor, "Expected a next-page cursor"
+    page2 = api_feed(client, alice_token, limit=1, cursor=cursor)
+    assert [i["id"] for i in page2.json()] == [items[1]["id"]] and "x-next-cursor" not in page2.headers
+
+    # Bad cursor -> 400
+    assert_status(api_feed(client, alice_token, cursor="zz"), 400)
+
+    print("✅ test_friend_feed passed")
+
+
+
+def test_friend_leaderboard(client: httpx.Client):
+    p = "Password123!"
+    users = {}
+    for name in ("Alice", "Bob", "Cara"):
+        r, d = api_register(client, f"{_u(name.lower())}@example.com", p, name)
+        assert_status(r, 201)
+        users[name] = (d["access_token"], d["user"]["id"])
+    (alice_token, alice_id), (bob_token, bob_id), (cara_token, cara_id) = users["Alice"], users["Bob"], users["Cara"]
+    req = api_send_friend_request(client, alice_token, bob_id)
+    assert_status(api_accept_request(client, bob_token, req.json()["id"]), 200)
+    today = date.today().isoformat()
+
+    # Alice completes once this week; Cara is not her friend and stays off the board
+    alice_habit = api_create_habit(client, alice_token, "Read").json()["id"]
+    assert_status(api_complete_habit(client, alice_token, alice_habit, today), 201)
+    assert_status(api_complete_habit(client, cara_token, api_create_habit(client, cara_token, "Run").json()["id"], today), 201)
+    board = api_leaderboard(client, alice_token)
+    assert_status(board, 200, "Leaderboard failed")
+    data = board.json()
+    assert [(e["user_id"], e["rank"], e["completions"]) for e in data["entries"]] == [(alice_id, 1, 1), (bob_id, 2, 0)], data
+    assert data["rank"] == 1 and data["entries"][0]["is_me"]
+
+    # Bob's completions are patched into Alice's cached board and overtake her
+    for name in ("Run", "Swim"):
+        hid = api_create_habit(client, bob_token, name).json()["id"]
+        assert_status(api_complete_habit(client, bob_token, hid, today), 201)
+    data = api_leaderboard(client, alice_token).json()
+    assert [(e["user_id"], e["rank"], e["completions"]) for e in data["entries"]] == [(bob_id, 1, 2), (alice_id, 2, 1)], data
+    assert data["rank"] == 2
+    assert cara_id not in {e["user_id"] for e in data["entries"]}
+
+    # Another week is empty but still lists both; ties share rank 1
+    last_year = api_leaderboard(client, alice_token, "2020-01-01").json()
+    assert last_year["week_start"] == "2019-12-30"
+    assert {(e["user_id"], e["rank"], e["completions"]) for e in last_year["entries"]} == {(alice_id, 1, 0), (bob_id, 1, 0)}
+
+    # Bad week -> 422
+    assert_status(api_leaderboard(client, alice_token, "not-a-date"), 422)
+
+    print("✅ test_friend_leaderboard passed")
+
+
+
+# Statements per request on the hot list routes, whatever the number of rows
+# (one more than they use today, for a cold auth cache).
+HABITS_LIST_QUERY_BUDGET = 3
+FRIENDS_LIST_QUERY_BUDGET = 3
+
+def test_query_budget(client: httpx.Client):
+    p = "Password123!"
+    r, d = api_register(client, f"{_u('budget')}@example.com", p, "Budget")
+    assert_status(r, 201)
+    token = d["access_token"]
+    today = date.today().isoformat()
+
+    # /api/habits/ and /api/friends/ stay within budget, and adding rows adds no statements
+    counts = []
+    for n in range(4):
+        hid = api_create_habit(client, token, f"Habit {n}").json()["id"]
+        assert_status(api_complete_habit(client, token, hid, today), 201)
+        rf, fd = api_register(client, f"{_u('budgetf')}@example.com", p, f"Friend {n}")
+        assert_status(rf, 201)
+        req = api_send_friend_request(client, token, fd["user"]["id"])
+        assert_status(api_accept_request(client, fd["access_token"], req.json()["id"]), 200)
+
+        habits, friends = api_list_habits(client, token), api_list_friends(client, token)
+        assert_status(habits, 200)
+        assert_status(friends, 200)
+        assert len(habits.json()) == len(friends.json()) == n + 1
+        for resp, budget in ((habits, HABITS_LIST_QUERY_BUDGET), (friends, FRIENDS_LIST_QUERY_BUDGET)):
+            assert db_queries(resp) <= budget, f"{resp.request.url.path}: {db_queries(resp)} statements > {budget}"
+            assert "X-DB-N-Plus-One" not in resp.headers, f"{resp.request.url.path} repeats a statement"
+        counts.append((db_queries(habits), db_queries(friends)))
+    assert len(set(counts[1:])) == 1, f"statement count grows with rows: {counts}"
+
+    # Browsers may read the accounting headers
+    r = client.get(f"{BASE_URL}/api/habits/", headers={**auth_headers(token), "Origin": "http://localhost:3000"})
+    exposed = {h.strip().lower() for h in r.headers.get("access-control-expose-headers", "").split(",")}
+    assert {"x-db-queries", "x-db-time-ms", "x-db-n-plus-one"} <= exposed, exposed
+
+    # Going over the budget fails the request (needs ENABLE_DEBUG_ENDPOINTS=1 for the per-request header)
+    if debug_enabled(client):
+        used = counts[-1][0]
+        within = client.get(f"{BASE_URL}/api/habits/", headers={**auth_headers(token), "X-DB-Query-Budget": str(used)})
+        assert_status(within, 200, "Request at its exact budget failed")
+        over = client.get(f"{BASE_URL}/api/habits/", headers={**auth_headers(token), "X-DB-Query-Budget": str(used - 1)})
+        assert_status(over, 500, "Request over the query budget did not fail")
+        assert "query budget" in over.json()["detail"]
+    else:
+        print("   (debug endpoints off: over-budget check skipped)")
+
+    print("✅ test_query_budget passed")
+
+
+
+def test_password_rehash_and_busy(client: httpx.Client):
+    # Both checks need the debug endpoints: one plants an old hash, the other reads the pool size.
+    if not debug_enabled(client):
+        print("   (debug endpoints off: password hashing checks skipped)")
+        return
+    hasher = client.get(f"{BASE_URL}/api/debug/password-hasher").json()
+    p = "Password123!"
+    email = f"{_u('rehash')}@example.com"
+    r, d = api_register(client, email, p, "Rehash")
+    assert_status(r, 201)
+    user_id = d["user"]["id"]
+    assert api_password_hash_info(client, user_id).json()["iterations"] == hasher["iterations"]
+
+    # A hash made under an older PASSWORD_HASH_ITERATIONS is redone by the next login
+    old = 1_000 if hasher["iterations"] != 1_000 else 2_000
+    r = client.put(f"{BASE_URL}/api/debug/users/{user_id}/password-hash", json={"password": p, "iterations": old})
+    assert_status(r, 200)
+    assert api_password_hash_info(client, user_id).json()["iterations"] == old
+    assert_status(api_login(client, email, p)[0], 200, "Login with an old-iteration hash failed")
+    assert api_password_hash_info(client, user_id).json()["iterations"] == hasher["iterations"], "hash not upgraded"
+    assert_status(api_login(client, email, p)[0], 200, "Login after the rehash failed")
+    assert_status(api_login(client, email, "wrong-password")[0], 401)
+
+    # A burst past the pool's capacity (workers + queue) is turned away with 503, not queued
+    burst = hasher["capacity"] * 2
+
+    def login_attempt(_: int) -> httpx.Response:
+        with httpx.Client(timeout=30) as own:  # one connection per attempt, all in flight at once
+            return api_login(own, email, "wrong-password")[0]
+
+    with ThreadPoolExecutor(max_workers=burst) as pool:
+        responses = list(pool.map(login_attempt, range(burst)))
+    codes = Counter(resp.status_code for resp in responses)
+    assert set(codes) <= {401, 503}, codes
+    assert codes[503], f"no 503 from {burst} concurrent logins against capacity {hasher['capacity']}: {codes}"
+    busy = next(resp for resp in responses if resp.status_code == 503)
+    assert busy.headers.get("Retry-After") == "1"
+    assert_status(api_login(client, email, p)[0], 200, "Login after the burst failed")
+
+    print("✅ test_password_rehash_and_busy passed")
+
+
+
+def test_completion_calendar(client: httpx.Client):
+    p = "Password123!"
+    r, d = api_register(client, f"{_u('cal')}@example.com", p, "Cal")
+    o_r, other = api_register(client, f"{_u('other')}@example.com", p, "Other")
+    assert_status(r, 201)
+    assert_status(o_r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Journal").json()["id"]
+
+    # Completions through both write paths, across a year boundary and out of order
+    for day in ("2026-01-31", "2025-12-31", "2026-01-05"):
+        assert_status(api_complete_habit(client, token, hid, day), 201)
+    rb = api_complete_batch(client, token, [
+        {"habit_id": hid, "completed_date": day}
+        for day in ("2026-01-20", "2026-02-01", "2025-12-30", "2026-01-06", "2026-01-05")
+    ])
+    assert_status(rb, 200, "Batch failed")
+    assert (rb.json()["created"], rb.json()["duplicate"]) == (4, 1)
+
+    # The calendar (read from the bitsets) agrees with the completion rows, month by month and per year
+    stored = sorted(c["completed_date"] for c in api_list_completions(client, token, hid).json())
+    assert len(stored) == 7, stored
+    for year, month in ((2025, 12), (2026, 1), (2026, 2), (2026, 3)):
+        rc = api_calendar(client, token, hid, year, month)
+        assert_status(rc, 200, "Calendar failed")
+        expected = [day for day in stored if day.startswith(f"{year}-{month:02d}-")]
+        assert rc.json()["completed_dates"] == expected, f"{year}-{month:02d}: {rc.json()} != {expected}"
+    for year in (2025, 2026, 2027):
+        expected = [day for day in stored if day.startswith(f"{year}-")]
+        assert api_calendar(client, token, hid, year).json()["completed_dates"] == expected, year
+
+    # Someone else's habit -> 404; out-of-range month -> 422
+    assert_status(api_calendar(client, other["access_token"], hid, 2026, 1), 404)
+    assert_status(api_calendar(client, token, hid, 2026, 13), 422)
+
+    print("✅ test_completion_calendar passed")
+
+
+
+def test_completion_pages(client: httpx.Client):
+    r, d = api_register(client, f"{_u('pages')}@example.com", "Password123!", "Pages")
+    assert_status(r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Stretch").json()["id"]
+    days = [f"2026-01-{n:02d}" for n in range(1, 13)]
+    assert_status(api_complete_batch(client, token, [{"habit_id": hid, "completed_date": day} for day in days]), 200)
+
+    def fetch(**params: Any) -> httpx.Response:
+        return api_completions_page(client, token, hid, **params)
+
+    # The X-Next-Cursor chain walks every completion once, newest first; the last page has no header
+    pages = follow_pages(fetch, limit=5)
+    assert [len(page) for page in pages] == [5, 5, 2], [len(page) for page in pages]
+    assert [c["completed_date"] for page in pages for c in page] == days[::-1]
+
+    # from/to are inclusive and combine with the cursor
+    pages = follow_pages(fetch, limit=4, from_="2026-01-03", to="2026-01-09")
+    assert [len(page) for page in pages] == [4, 3]
+    assert [c["completed_date"] for page in pages for c in page] == days[2:9][::-1]
+    assert fetch(from_="2026-02-01").json() == []
+    assert "X-Next-Cursor" not in fetch(limit=12).headers, "exact-size last page still advertises a next one"
+
+    # Malformed cursors are a 400, not a 500 or an empty page
+    for bad in ("not-a-cursor", "WyJ4Il0", "WyIyMDI2LTAxLTAxIiwgIngiXQ"):  # garbage, ["x"], ["2026-01-01", "x"]
+        assert_status(fetch(cursor=bad), 400, f"cursor {bad!r}")
+    assert_status(fetch(limit=0), 422)
+
+    print("✅ test_completion_pages passed")
+
+
+
+def test_sparse_fields(client: httpx.Client):
+    p = "Password123!"
+    r, d = api_register(client, f"{_u('fields')}@example.com", p, "Fields")
+    assert_status(r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Walk").json()["id"]
+    api_create_habit(client, token, "Sleep")
+    days = [f"2026-02-{n:02d}" for n in range(1, 6)]
+    assert_status(api_complete_batch(client, token, [{"habit_id": hid, "completed_date": day} for day in days]), 200)
+
+    # Only the requested fields come back, in any order the client lists them
+    rows = api_completions_page(client, token, hid, fields="note,completed_date").json()
+    assert len(rows) == 5 and all(set(row) == {"completed_date", "note"} for row in rows), rows
+    habits = client.get(f"{BASE_URL}/api/habits/", params={"fields": "id,name"}, headers=auth_headers(token))
+    assert_status(habits, 200)
+    assert sorted(h["name"] for h in habits.json()) == ["Sleep", "Walk"]
+    assert all(set(h) == {"id", "name"} for h in habits.json())
+
+    # Unknown or empty field lists are a 400
+    for bad in ("id,bogus", "", " , "):
+        assert_status(api_completions_page(client, token, hid, fields=bad), 400, f"fields={bad!r}")
+        assert_status(client.get(f"{BASE_URL}/api/habits/", params={"fields": bad}, headers=auth_headers(token)), 400)
+
+    # The cursor's sort key is read even when not requested, and stays out of the rows
+    pages = follow_pages(lambda **kw: api_completions_page(client, token, hid, **kw), limit=2, fields="id")
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert all(set(row) == {"id"} for page in pages for row in page)
+    full = api_completions_page(client, token, hid).json()
+    assert [row["id"] for page in pages for row in page] == [c["id"] for c in full]
+
+    # Same on the friend-request inbox, paginated on (created_at, id)
+    senders = []
+    for n in range(3):
+        rs, ds = api_register(client, f"{_u('sender')}@example.com", p, f"Sender {n}")
+        assert_status(rs, 201)
+        assert_status(api_send_friend_request(client, ds["access_token"], d["user"]["id"]), 201)
+        senders.append(ds["user"]["id"])
+
+    def inbox(**params: Any) -> httpx.Response:
+        params = {k: v for k, v in params.items() if v is not None}
+        return client.get(f"{BASE_URL}/api/friends/requests/inbox", params=params, headers=auth_headers(token))
+
+    pages = follow_pages(inbox, limit=2, fields="requester_id")
+    assert [len(page) for page in pages] == [2, 1]
+    assert all(set(row) == {"requester_id"} for page in pages for row in page)
+    assert [row["requester_id"] for page in pages for row in page] == senders[::-1]
+    assert_status(inbox(fields="created_at,nope"), 400)
+
+    print("✅ test_sparse_fields passed")
+
+
+
+def test_me_update_invalidates_auth_cache(client: httpx.Client):
+    p = "Password123!"
+    email = f"{_u('me')}@example.com"
+    r, d = api_register(client, email, p, "Before")
+    o_r, _ = api_register(client, f"{_u('taken')}@example.com", p, "Taken")
+    assert_status(r, 201)
+    assert_status(o_r, 201)
+    token = d["access_token"]
+
+    # Warm the cached snapshot behind current_user; with debug on, confirm /me is served from it
+    hits_before = client.get(f"{BASE_URL}/api/debug/auth-cache").json()["users"]["hits"] if debug_enabled(client) else None
+    for _ in range(2):
+        assert api_me(client, token).json()["name"] == "Before"
+    if hits_before is not None:
+        assert client.get(f"{BASE_URL}/api/debug/auth-cache").json()["users"]["hits"] > hits_before, "/me bypassed the cache"
+
+    # The very next /me after a PATCH shows the new values, not the cached ones
+    new_email = f"{_u('after')}@example.com"
+    ru = api_update_me(client, token, {"name": "After", "email": new_email})
+    assert_status(ru, 200, "PATCH /me failed")
+    for _ in range(2):
+        me = api_me(client, token).json()
+        assert (me["name"], me["email"]) == ("After", new_email), me
+
+    # A rejected update leaves the cached profile alone
+    assert_status(api_update_me(client, token, {"email": o_r.json()["user"]["email"]}), 409)
+    assert api_me(client, token).json()["email"] == new_email
+
+    # Password change: the new one logs in, the old one does not, the current token keeps working
+    assert_status(api_update_me(client, token, {"current_password": p, "new_password": "Changed456!"}), 200)
+    assert_status(api_login(client, new_email, p)[0], 401)
+    assert_status(api_login(client, new_email, "Changed456!")[0], 200)
+    assert_status(api_me(client, token), 200)
+
+    print("✅ test_me_update_invalidates_auth_cache passed")
+
+
+
+def test_metrics_exposition(client: httpx.Client):
+    r, d = api_register(client, f"{_u('metrics')}@example.com", "Password123!", "Metrics")
+    assert_status(r, 201)
+    token = d["access_token"]
+    hid = api_create_habit(client, token, "Floss").json()["id"]
+    route = 'http_requests_total{method="GET",route="/api/habits/{habit_id}",status="200"}'
+    seen = api_metrics(client).get(route, 0)
+    assert_status(api_get_habit(client, token, hid), 200)
+    before = wait_for_metric(client, route, seen + 1)
+
+    # Requests are labelled by route template, never by the concrete path
+    assert before.get(route, 0) == seen + 1, "no route-template series for GET /api/habits/{habit_id}"
+    assert not any(f"/api/habits/{hid}" in key for key in before), "a concrete path leaked into the labels"
+
+    # Auth cache lookups and pool checkouts are exported and move with traffic
+    for name in ("auth_cache_lookups_total", "db_pool_checkout_seconds"):
+        assert f"# TYPE {name}" in before, f"{name} not exported"
+    assert_status(api_get_habit(client, token, hid), 200)
+    after = wait_for_metric(client, route, before[route] + 1)
+    assert after[route] == before[route] + 1
+    assert metric_total(after, "auth_cache_lookups_total", cache="tokens") > metric_total(before, "auth_cache_lookups_total", cache="tokens")
+    assert metric_total(after, "db_pool_checkout_seconds_count") > metric_total(before, "db_pool_checkout_seconds_count")
+    assert metric_total(after, "db_pool_checkout_seconds_bucket", le="+Inf") == metric_total(after, "db_pool_checkout_seconds_count")
+
+    print("✅ test_metrics_exposition passed")
+
+
+
+HABIT_FIELDS = ("name", "category", "description", "trigger_value", "frequency_type", "frequency_pattern",
+                "requires_quantity", "quantity_unit", "allows_notes", "motivation_statement", "status")
+
+def account_snapshot(client: httpx.Client, token: str) -> Dict[str, Any]:
+    """Habits by name (the fields an import carries over) with their completions, ids left out."""
+    snapshot = {}
+    for habit in api_list_habits(client, token).json():
+        completions = api_completions_page(client, token, habit["id"], limit=500).json()
+        snapshot[habit["name"]] = (
+            {field: habit[field] for field in HABIT_FIELDS},
+            sorted((c["completed_date"], c["quantity_value"], c["note"]) for c in completions),
+        )
+    return snapshot
+
+def test_export_import_round_trip(client: httpx.Client):
+    p = "Password123!"
+    r, d = api_register(client, f"{_u('source')}@example.com", p, "Source")
+    assert_status(r, 201)
+    token = d["access_token"]
+    base = {"category": "wellness", "description": "round trip", "trigger_type": "time", "trigger_value": "21:00",
+            "allows_notes": True}
+    water = client.post(f"{BASE_URL}/api/habits/", headers=auth_headers(token), json={
+        **base, "name": "Water, \"8 glasses\"", "frequency_type": "daily", "requires_quantity": True,
+        "quantity_unit": "glasses", "motivation_statement": "Line one\nline two",
+    })
+    gym = client.post(f"{BASE_URL}/api/habits/", headers=auth_headers(token), json={
+        **base, "name": "Gym", "frequency_type": "custom", "frequency_pattern": {"days": ["monday", "thursday"]},
+    })
+    assert_status(water, 201)
+    assert_status(gym, 201)
+    rb = api_complete_batch(client, token, [
+        {"habit_id": water.json()["id"], "completed_date": "2026-03-02", "quantity_value": 6.5, "note": "a, \"quoted\" note"},
+        {"habit_id": water.json()["id"], "completed_date": "2026-03-03", "quantity_value": 8},
+        {"habit_id": gym.json()["id"], "completed_date": "2026-03-02", "note": "légs"},
+        {"habit_id": gym.json()["id"], "completed_date": "2026-03-05"},
+    ])
+    assert_status(rb, 200)
+    r3, d3 = api_register(client, f"{_u('friend')}@example.com", p, "Friend")
+    req = api_send_friend_request(client, token, d3["user"]["id"])
+    assert_status(api_accept_request(client, d3["access_token"], req.json()["id"]), 200)
+    source = account_snapshot(client, token)
+
+    for fmt, content_type in (("csv", "text/csv"), ("ndjson", "application/x-ndjson")):
+        exported = api_export(client, token, fmt, ["habits", "completions"])
+        assert_status(exported, 200, f"{fmt} export failed")
+
+        # Into a fresh account: everything comes back exactly once, nothing rejected
+        r2, d2 = api_register(client, f"{_u('target')}@example.com", p, "Target")
+        assert_status(r2, 201)
+        target = d2["access_token"]
+        ri = api_import(client, target, exported.text, content_type)
+        assert_status(ri, 200, f"{fmt} import failed")
+        rep = ri.json()
+        assert (rep["habits_created"], rep["completions_created"], rep["rows_invalid"]) == (2, 4, 0), pretty(ri)
+        assert account_snapshot(client, target) == source, f"{fmt} round trip changed the data"
+
+        # A default export also carries the friendship, which the import counts as skipped
+        full = api_export(client, token, fmt)
+        assert_status(full, 200)
+        rep = api_import(client, target, full.text, content_type).json()
+        assert (rep["rows_invalid"], rep["errors"], rep["skipped"]) == (0, [], {"friendship": 1}), rep
+        assert rep["completions_duplicate"] == 4, rep
+
+        # The target's own export imports back onto itself as all duplicates
+        again = api_import(client, target, api_export(client, target, fmt, ["habits", "completions"]).text, content_type)
+        rep = again.json()
+        assert (rep["habits_matched"], rep["completions_created"], rep["completions_duplicate"]) == (2, 0, 4), pretty(again)
+
+    print("✅ test_export_import_round_trip passed")
+
+
+
 # ----------------------------
 # Runner
 # ----------------------------
@@ -375,8 +1259,20 @@ if __name__ == "__main__":
             print("🧼 Server DB reset via /api/test/reset")
 
         test_auth_register_login_logout(client)
+        test_password_rehash_and_busy(client)
+        test_me_update_invalidates_auth_cache(client)
         test_habits_crud_and_authz(client)
         test_completions_happy_and_edges(client)
+        test_completion_batch(client)
+        test_completion_calendar(client)
+        test_completion_pages(client)
+        test_sparse_fields(client)
+        test_sync_deltas(client)
+        test_conditional_get(client)
+        test_import_counts(client)
+        test_export_import_round_trip(client)
+        test_dashboard_today(client)
+        test_stats_periods(client)
 
         # Only run if you wired /api/friends
         try:
@@ -385,4 +1281,10 @@ if __name__ == "__main__":
             # If friends routes aren't wired yet, you'll likely get 404s; surface cleanly.
             raise
 
+        test_push_events_ws(client)
+        test_friend_feed(client)
+        test_friend_leaderboard(client)
+        test_metrics_exposition(client)
+        test_query_budget(client)
+
         print("\n🎉 All selected tests passed")
\ No newline at end of file
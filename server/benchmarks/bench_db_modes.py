@@ -0,0 +1,152 @@
+"""
+Requests/sec for the sync (threadpool) vs async (AsyncSession) database modes.
+
+Boots a real uvicorn server per mode against a throwaway SQLite file, seeds one user
+with a handful of habits, then hammers the hot read/write endpoints with concurrent
+clients for a fixed duration.
+
+Usage (from server/):
+    python -m benchmarks.bench_db_modes --seconds 10 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import httpx
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(db_async: bool, port: int, db_path: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        DB_ASYNC="1" if db_async else "0",
+        DB_ECHO="0",
+        HASH_POOL_WORKERS="0",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, base: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base}/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not come up")
+
+
+async def _seed(client: httpx.AsyncClient, base: str, habits: int) -> Dict[str, object]:
+    r = await client.post(f"{base}/api/auth/register", json={"email": "bench@example.com", "password": "Password123!"})
+    r.raise_for_status()
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    habit_ids: List[int] = []
+    for i in range(habits):
+        r = await client.post(
+            f"{base}/api/habits/",
+            headers=headers,
+            json={
+                "name": f"Habit {i}",
+                "category": "fitness",
+                "description": "bench",
+                "trigger_value": "07:00",
+                "frequency_type": "daily",
+            },
+        )
+        r.raise_for_status()
+        habit_ids.append(r.json()["id"])
+    return {"headers": headers, "habit_ids": habit_ids}
+
+
+async def _run_load(client: httpx.AsyncClient, base: str, seed: Dict[str, object], seconds: float, concurrency: int) -> Dict[str, float]:
+    headers = seed["headers"]
+    habit_ids = seed["habit_ids"]
+    deadline = time.monotonic() + seconds
+    counts = {"ok": 0, "err": 0}
+    day_counter = iter(range(10_000_000))
+    start_day = date(2020, 1, 1)
+
+    async def worker(n: int) -> None:
+        i = 0
+        while time.monotonic() < deadline:
+            i += 1
+            hid = habit_ids[(n + i) % len(habit_ids)]
+            if i % 5 == 0:
+                d = start_day + timedelta(days=next(day_counter) % 3650)
+                r = await client.post(
+                    f"{base}/api/completions/habits/{hid}/complete",
+                    headers=headers,
+                    json={"completed_date": d.isoformat()},
+                )
+                ok = r.status_code in (201, 400)  # 400 = already completed that day
+            elif i % 2 == 0:
+                r = await client.get(f"{base}/api/habits/{hid}", headers=headers)
+                ok = r.status_code == 200
+            else:
+                r = await client.get(f"{base}/api/habits/", headers=headers)
+                ok = r.status_code == 200
+            counts["ok" if ok else "err"] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {"requests": counts["ok"] + counts["err"], "errors": counts["err"], "rps": (counts["ok"] + counts["err"]) / elapsed}
+
+
+async def bench_mode(db_async: bool, seconds: float, concurrency: int, habits: int) -> Dict[str, float]:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = _start_server(db_async, port, os.path.join(tmp, "bench.db"))
+        try:
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+                await _wait_ready(client, base)
+                seed = await _seed(client, base, habits)
+                return await _run_load(client, base, seed, seconds, concurrency)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--habits", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for label, db_async in (("sync", False), ("async", True)):
+        results[label] = asyncio.run(bench_mode(db_async, args.seconds, args.concurrency, args.habits))
+
+    print(f"{'mode':<8}{'requests':>10}{'errors':>8}{'req/s':>10}")
+    for label, r in results.items():
+        print(f"{label:<8}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Friend suggestions on a synthetic graph: in-memory CSR graph vs a SQL self-join.
+
+Generates --edges random friendships among --users users (degrees are skewed: a
+few users have many friends, most have a handful), then times
+
+  build              FriendGraph.load_edges from id arrays (what a reload costs after the SELECT)
+  load (sql)         FriendGraph.load: SELECT of the friendships table + build
+  suggest            FriendGraph.suggest for random users
+  add / remove       incremental updates, as applied after accept_request / unfriend
+  self-join (sql)    friends-of-friends GROUP BY on the friendships table, per request
+
+The SQL rows use a throwaway SQLite file with the app's schema and indexes
+(skip them with --no-sql); the self-join is also checked against the graph's
+answers for the users it is timed on.
+
+Usage (from server/):
+    python -m benchmarks.bench_friend_graph --users 100000 --edges 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import insert, text
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.models import Friendship
+from app.services.friend_graph import FriendGraph
+
+SELF_JOIN = text("""
+WITH mine(f) AS (
+    SELECT user_high_id FROM friendships WHERE user_low_id = :u
+    UNION ALL SELECT user_low_id FROM friendships WHERE user_high_id = :u
+), fof(c) AS (
+    SELECT fr.user_high_id FROM friendships fr JOIN mine ON fr.user_low_id = mine.f
+    UNION ALL SELECT fr.user_low_id FROM friendships fr JOIN mine ON fr.user_high_id = mine.f
+)
+SELECT c, COUNT(*) AS mutual FROM fof
+WHERE c != :u AND c NOT IN (SELECT f FROM mine)
+GROUP BY c ORDER BY mutual DESC, c LIMIT :limit
+""")
+
+
+def synthetic_edges(users: int, edges: int, seed: int = 7) -> np.ndarray:
+    """`edges` distinct undirected (low, high) pairs; endpoints drawn with a Zipf-like skew."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, users + 1) ** 0.6
+    weights /= weights.sum()
+    pairs = np.empty((0, 2), dtype=np.int64)
+    while len(pairs) < edges:
+        draw = rng.choice(users, size=(int((edges - len(pairs)) * 1.2) + 16, 2), p=weights) + 1  # ids start at 1
+        draw = np.sort(draw[draw[:, 0] != draw[:, 1]], axis=1)
+        pairs = np.unique(np.concatenate([pairs, draw]), axis=0)
+    return pairs[rng.permutation(len(pairs))[:edges]]
+
+
+def _timed(fn: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.50), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+
+def run(users: int, edges: int, samples: int, limit: int, sql: bool, sql_samples: int) -> Dict[str, Dict[str, float]]:
+    pairs = synthetic_edges(users, edges)
+    rng = np.random.default_rng(11)
+    viewers = rng.integers(1, users + 1, size=samples).tolist()
+    results: Dict[str, Dict[str, float]] = {}
+
+    graph = FriendGraph(compact_after=10_000, max_age_seconds=0)
+    build = _timed(lambda: graph.load_edges(pairs[:, 0], pairs[:, 1]))
+    results["build"] = {"p50": build * 1000, "p99": build * 1000, "max": build * 1000}
+    results["suggest"] = _percentiles([_timed(lambda: graph.suggest(u, limit)) for u in viewers])
+
+    churn = [tuple(p) for p in synthetic_edges(users, 5000, seed=13).tolist()]
+    results["add"] = _percentiles([_timed(lambda: graph.add(a, b)) for a, b in churn])
+    results["remove"] = _percentiles([_timed(lambda: graph.remove(a, b)) for a, b in churn])
+
+    if sql:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            SQLModel.metadata.create_all(engine, tables=[Friendship.__table__])
+            with Session(engine) as session:
+                session.execute(insert(Friendship.__table__), [
+                    {"user_low_id": low, "user_high_id": high} for low, high in pairs.tolist()
+                ])
+                session.commit()
+                fresh = FriendGraph(compact_after=10_000, max_age_seconds=0)
+                load = _timed(lambda: fresh.load(session))
+                results["load (sql)"] = {"p50": load * 1000, "p99": load * 1000, "max": load * 1000}
+
+                checked: List[float] = []
+                for u in viewers[:sql_samples]:
+                    started = time.perf_counter()
+                    rows = session.execute(SELF_JOIN, {"u": u, "limit": limit}).all()
+                    checked.append(time.perf_counter() - started)
+                    assert [tuple(r) for r in rows] == fresh.suggest(u, limit), f"mismatch for user {u}"
+                results["self-join (sql)"] = _percentiles(checked)
+            engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--edges", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=2000, help="Suggestion requests timed on the graph")
+    parser.add_argument("--sql-samples", type=int, default=50, help="Self-join requests timed (and checked)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--no-sql", dest="sql", action="store_false")
+    args = parser.parse_args()
+
+    results = run(args.users, args.edges, args.samples, args.limit, args.sql, args.sql_samples)
+    print(f"{args.edges:,} friendships among {args.users:,} users, top {args.limit} suggestions")
+    print(f"{'operation':<18}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['p50']:>10.3f}{r['p99']:>10.3f}{r['max']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
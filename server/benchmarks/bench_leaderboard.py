@@ -0,0 +1,136 @@
+"""
+Friend leaderboard latency: cache hits, cold builds, and views after a friend writes.
+
+Seeds a throwaway SQLite database with one viewer and N friends (each with a few
+habits and weeks of completions), derives rollups and weekly scores the same way
+the CLI rebuilds do, then times services.leaderboard directly.
+
+Usage (from server/):
+    python -m benchmarks.bench_leaderboard --friends 300 --iterations 500
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models import Completion, Friendship, Habit, User
+from app.services import leaderboard, rollups
+from app.services.leaderboard import leaderboard_cache
+from app.services.rollups import period_start
+
+
+def _seed(session: Session, friends: int, habits: int, weeks: int) -> int:
+    now = datetime.utcnow()
+    users = [{"email": f"u{i}@example.com", "password_hash": "x", "name": f"User {i}", "created_at": now}
+             for i in range(friends + 1)]
+    user_ids = session.execute(
+        insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True), users
+    ).scalars().all()
+    viewer, others = user_ids[0], user_ids[1:]
+    session.execute(insert(Friendship.__table__), [
+        {"user_low_id": min(viewer, o), "user_high_id": max(viewer, o), "created_at": now} for o in others
+    ])
+
+    habit_rows = [
+        {"user_id": u, "name": f"H{k}", "category": "fitness", "description": "", "trigger_type": "time",
+         "trigger_value": "07:00", "frequency_type": "daily", "requires_quantity": False, "allows_notes": True,
+         "status": "active", "current_streak": (u + k) % 9, "longest_streak": 9,
+         "last_completed_date": date.today(), "created_at": now}
+        for u in user_ids for k in range(habits)
+    ]
+    habit_ids = session.execute(
+        insert(Habit.__table__).returning(Habit.__table__.c.id, Habit.__table__.c.user_id, sort_by_parameter_order=True),
+        habit_rows,
+    ).all()
+    first = date.today() - timedelta(days=7 * weeks)
+    session.execute(insert(Completion.__table__), [
+        {"habit_id": h, "user_id": u, "completed_date": first + timedelta(days=d), "completed_at": now}
+        for h, u in habit_ids for d in range(0, 7 * weeks, 1 + (h % 3))
+    ])
+    rollups.rebuild(session)
+    leaderboard.rebuild(session)
+    session.commit()
+    return viewer
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {"p50": pick(0.50), "p99": pick(0.99), "max": samples[-1] * 1000, "mean": statistics.fmean(samples) * 1000}
+
+
+def _time(fn: Callable[[], object], iterations: int, setup: Optional[Callable[[], object]] = None) -> Dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()  # untimed
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return _percentiles(samples)
+
+
+def run(friends: int, habits: int, weeks: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            viewer = _seed(session, friends, habits, weeks)
+        today = date.today()
+        week = period_start("week", today)
+        leaderboard_cache.clear()
+
+        with Session(engine) as session:
+            def cold():
+                leaderboard_cache.clear()
+                leaderboard.board(session, viewer, week, today)
+
+            friend = viewer + 1
+            with Session(engine, expire_on_commit=False) as writer:
+                habit = writer.exec(select(Habit).where(Habit.user_id == friend)).first()
+
+                def friend_write():
+                    # What a committed completion does to the scores (the completion rows are not the point here).
+                    habit.current_streak += 1
+                    leaderboard.add_completions(writer, friend, [today], [habit])
+                    writer.commit()
+
+                def view():
+                    leaderboard.board(session, viewer, week, today)
+
+                view()
+                results = {
+                    "cold build": _time(cold, iterations),
+                    "friend write + commit": _time(friend_write, iterations),
+                    "view after write": _time(view, iterations, setup=friend_write),
+                }
+            results["cache hit"] = _time(view, iterations)
+        engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--friends", type=int, default=300)
+    parser.add_argument("--habits", type=int, default=3, help="Habits per user")
+    parser.add_argument("--weeks", type=int, default=8, help="Weeks of completion history per habit")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    results = run(args.friends, args.habits, args.weeks, args.iterations)
+    print(f"{args.friends} friends, {args.habits} habits each, {args.weeks} weeks of history")
+    print(f"{'path':<22}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for path, r in results.items():
+        print(f"{path:<22}{r['p50']:>9.3f}{r['p99']:>9.3f}{r['max']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
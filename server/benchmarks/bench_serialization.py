@@ -0,0 +1,114 @@
+"""
+JSON serialization cost per 1k rows for each response path.
+
+  jsonable_encoder   ORM instances -> jsonable_encoder -> json.dumps (the old default
+                     for routes without a response_model)
+  response_model     ORM instances -> Read schema -> Pydantic dump_json (routes that
+                     declare a *Read response_model)
+  row tuples         Core column tuples -> orjson (responses.rows_response; big lists)
+
+Rows are loaded once from a throwaway in-memory SQLite database; only serialization
+is timed.
+
+Usage (from server/):
+    python -m benchmarks.bench_serialization --rows 5000 --repeat 20
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models import Completion, CompletionRead, Habit, HabitRead, User
+from app.responses import read_columns, rows_response
+
+
+def _seed(session: Session, rows: int) -> None:
+    user = User(email="bench@example.com", password_hash="x")
+    session.add(user)
+    session.flush()
+    habits = [
+        Habit(user_id=user.id, name=f"Habit {i}", category="fitness", description="bench " * 20,
+              trigger_value="07:00", frequency_type="daily", motivation_statement="because",
+              started_at=date(2020, 1, 1))
+        for i in range(rows)
+    ]
+    session.add_all(habits)
+    session.flush()
+    start = date(2000, 1, 1)
+    session.add_all(
+        Completion(habit_id=habits[i % len(habits)].id, user_id=user.id,
+                   completed_date=start + timedelta(days=i // len(habits)),
+                   completed_at=datetime(2024, 1, 1, 7, 30), quantity_value=float(i % 60), note="ok")
+        for i in range(rows)
+    )
+    session.commit()
+
+
+def _time(fn: Callable[[], bytes], repeat: int) -> float:
+    fn()  # warm-up (schema build, caches)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(rows: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        _seed(session, rows)
+        habits = session.exec(select(Habit)).all()
+        completions = session.exec(select(Completion)).all()
+        columns = read_columns(Completion, CompletionRead)
+        keys = [c.name for c in columns]
+        tuples = session.exec(select(*columns)).all()
+
+    def jsonable(items: List[Any]) -> Callable[[], bytes]:
+        return lambda: JSONResponse(jsonable_encoder(items)).body
+
+    def response_model(schema: Any, items: List[Any]) -> Callable[[], bytes]:
+        adapter = TypeAdapter(List[schema])
+        return lambda: adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+    results = {
+        "habits": {
+            "jsonable_encoder": _time(jsonable(habits), repeat),
+            "response_model": _time(response_model(HabitRead, habits), repeat),
+        },
+        "completions": {
+            "jsonable_encoder": _time(jsonable(completions), repeat),
+            "response_model": _time(response_model(CompletionRead, completions), repeat),
+            "row tuples": _time(lambda: rows_response(keys, tuples).body, repeat),
+        },
+    }
+    return {
+        table: {path: seconds * 1000 * 1000 / rows for path, seconds in paths.items()}
+        for table, paths in results.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    print(f"{'table':<13}{'path':<18}{'ms / 1k rows':>14}{'speedup':>10}")
+    for table, paths in results.items():
+        baseline = paths["jsonable_encoder"]
+        for path, ms in paths.items():
+            print(f"{table:<13}{path:<18}{ms:>14.2f}{baseline / ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import asyncio
+
+from app.services.passwords import PasswordHasher, hash_password
+
+
+def test_pool_recovers_from_a_dead_worker():
+    async def scenario():
+        hasher = PasswordHasher(workers=1, queue_limit=0, iterations=1_000)
+        stored = hash_password("secret", 1_000)
+        try:
+            assert await hasher.verify("secret", stored)
+            broken = hasher._executor
+            for process in list(broken._processes.values()):
+                process.kill()  # what the OOM killer does
+                process.join()
+
+            assert await hasher.verify("secret", stored)
+            assert hasher._executor is not broken
+            assert not await hasher.verify("wrong", stored)
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(scenario())
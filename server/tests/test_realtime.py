@@ -0,0 +1,33 @@
+import asyncio
+
+from app.services import realtime
+from app.services.realtime import InMemoryBroker, activity_topic, user_topic
+
+
+def test_friend_topics_survive_overflow():
+    async def scenario():
+        broker = InMemoryBroker()
+        sub = broker.subscribe([user_topic(1)], max_buffer=2)
+
+        # friend.added, then enough traffic that it is dropped before anyone reads it
+        broker.publish(user_topic(1), {"type": "friend.added", "data": {"friend_id": 2}})
+        for n in range(5):
+            broker.publish(user_topic(1), {"type": "friend_request.received", "data": {"n": n}})
+        assert await sub.get(0) == realtime.OVERFLOW
+        assert activity_topic(2) in sub.topics
+
+        broker.publish(activity_topic(2), {"type": "friend.completed", "data": {"user_id": 2}})
+        while (event := await sub.get(0)) is not None and event["type"] != "friend.completed":
+            pass
+        assert event is not None, "friend's activity not delivered after the overflow"
+
+        broker.publish(user_topic(1), {"type": "friend.removed", "data": {"friend_id": 2}})
+        for n in range(5):
+            broker.publish(user_topic(1), {"type": "friend_request.received", "data": {"n": n}})
+        assert await sub.get(0) == realtime.OVERFLOW
+        assert sub.topics == {user_topic(1)}
+
+        sub.close()
+        assert not broker._subscribers
+
+    asyncio.run(scenario())